@@ -1,8 +1,11 @@
+import sys
 import sqlalchemy
 from sqlalchemy.orm import declarative_base
-from sqlalchemy import Column, Integer, String, ForeignKey, Float, Date
+from sqlalchemy import Column, Integer, String, ForeignKey, Float, Date, select
 from sqlalchemy.orm import relationship, sessionmaker
+from datetime import datetime
 import pymysql
+from versao_esquema import VersaoEsquema
 
 # Versão do SQLAlchemy
 versao = sqlalchemy.__version__
@@ -40,8 +43,11 @@ def delete_database():
     finally:
         connection.close()
 
-#apagar o banco de dados
-delete_database()
+#apagar o banco de dados só quando pedido (python banco_de_dados.py --recriar); mudanças no esquema
+#são aplicadas pelas migrações no fim das definições das tabelas, sem perder os dados
+if '--recriar' in sys.argv:
+    delete_database()
+    create_database()
 
 # Fazendo uma URL para criar a conexão no engine
 url = f'mysql+pymysql://{usuario}:{senha}@{host}:{porta}/{nome_do_banco}'
@@ -121,8 +127,33 @@ class Apartamento(base):
     def __repr__(self):
         return f"<Apartamento(endereco={self.endereco}, numero_ap={self.numero_ap})>"
 
-# Criando as tabelas no banco de dados
+# Criando as tabelas no banco de dados (o create_all só cria as que não existem); a tabela com as migrações
+# já aplicadas vem de versao_esquema.py, compartilhada com a interface gráfica
 base.metadata.create_all(engine)
+VersaoEsquema.__table__.create(engine, checkfirst=True)
+
+# Migrações do esquema, em ordem: (versão, descrição, função que recebe a conexão). Cada uma roda uma única
+# vez e fica registrada em versao_esquema. Mudanças em tabelas existentes (colunas, índices) entram aqui,
+# já que o create_all não altera tabelas.
+MIGRACOES = [
+    (1, 'Esquema inicial', None),
+]
+
+def migrar(engine):
+    with engine.connect() as conexao:
+        aplicadas = set(conexao.execute(select(VersaoEsquema.versao)).scalars())
+    for versao, descricao, funcao in MIGRACOES:
+        if versao in aplicadas:
+            continue
+        with engine.begin() as conexao:
+            if funcao is not None:
+                funcao(conexao)
+            conexao.execute(VersaoEsquema.__table__.insert().values(
+                versao=versao, descricao=descricao, data_aplicacao=datetime.now()
+            ))
+        print(f"Migração {versao} aplicada: {descricao}")
+
+migrar(engine)
 
 # Criando uma sessão
 Sessao = sessionmaker(bind=engine)
@@ -1,19 +1,19 @@
 import sys
-import bcrypt
+import functools
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QPushButton, QVBoxLayout, 
     QWidget, QLabel, QDialog, QGridLayout, QLineEdit, 
     QMessageBox, QTabWidget, QListWidget, QCheckBox, QComboBox
 )
 from PyQt5.QtCore import Qt, QRegExp
-from PyQt5 import QtGui, QtCore, QtWidgets
-from PyQt5.QtGui import QIcon, QValidator, QIntValidator, QRegExpValidator
+from PyQt5.QtGui import QRegExpValidator
 import sqlalchemy
-from sqlalchemy.orm import declarative_base, sessionmaker
-from sqlalchemy import Column, Integer, String, ForeignKey, Float, Date, create_engine, text
+from sqlalchemy.orm import declarative_base, sessionmaker, scoped_session
+from sqlalchemy import Column, Integer, String, ForeignKey, Float, Date, create_engine, text, select, func
 from sqlalchemy.orm import relationship
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.exc import DBAPIError, IntegrityError
 from datetime import datetime
+from versao_esquema import VersaoEsquema
 
 def parse_data(data_str):
     """Tenta converter uma string para uma data, aceitando múltiplos formatos."""
@@ -33,9 +33,22 @@ PORTA = '3306'
 BANCO_DE_DADOS = 'seguradora'
 
 
+# Versão do esquema esperada; com o banco nela, a abertura pula a verificação do banco e o create_all
+VERSAO_ESQUEMA = 1
+
 # Criar engine do SQLAlchemy
 url_sem_banco = f'mysql+pymysql://{USUARIO}:{SENHA}@{HOST}:{PORTA}'
-engine_sem_banco = create_engine(url_sem_banco, echo=False)
+url_com_banco = f'mysql+pymysql://{USUARIO}:{SENHA}@{HOST}:{PORTA}/{BANCO_DE_DADOS}'
+engine = create_engine(url_com_banco, echo=False)
+engine_sem_banco = None
+
+def versao_do_esquema():
+    """Retorna a versão do esquema gravada no banco, ou None se o banco ou a tabela versao_esquema não existem."""
+    try:
+        with engine.connect() as conexao:
+            return conexao.execute(select(func.max(VersaoEsquema.versao))).scalar()
+    except DBAPIError:
+        return None
 
 def banco_existe(nome_do_banco):
     """Verifica se o banco de dados já existe."""
@@ -51,32 +64,57 @@ def criar_banco_de_dados(nome_do_banco):
         conexao.execute(text(f"CREATE DATABASE {nome_do_banco}"))
         print(f"Banco de dados '{nome_do_banco}' criado.")
 
-if not banco_existe(BANCO_DE_DADOS):  # Check if the database exists before proceeding
-    while True:
-        print(f"O banco de dados '{BANCO_DE_DADOS}' não existe. Deseja criá-lo?")
-        opcao = input("1. Sim\n2. Não\nEscolha uma opção: ")
-
-        if opcao == '1':
-            criar_banco_de_dados(BANCO_DE_DADOS)
-            break
-        elif opcao == '2':
-            print("Programa encerrado.")
-            exit()
-        else:
-            print("Opção inválida. Por favor, escolha 1 ou 2.")
-else:
+esquema_atualizado = versao_do_esquema() == VERSAO_ESQUEMA
+
+if esquema_atualizado:
     print(f"O banco de dados '{BANCO_DE_DADOS}' já existe.")
+else:
+    engine_sem_banco = create_engine(url_sem_banco, echo=False)
+    if not banco_existe(BANCO_DE_DADOS):  # Check if the database exists before proceeding
+        while True:
+            print(f"O banco de dados '{BANCO_DE_DADOS}' não existe. Deseja criá-lo?")
+            opcao = input("1. Sim\n2. Não\nEscolha uma opção: ")
+
+            if opcao == '1':
+                criar_banco_de_dados(BANCO_DE_DADOS)
+                break
+            elif opcao == '2':
+                print("Programa encerrado.")
+                exit()
+            else:
+                print("Opção inválida. Por favor, escolha 1 ou 2.")
+    else:
+        print(f"O banco de dados '{BANCO_DE_DADOS}' já existe.")
 
 
-url_com_banco = f'mysql+pymysql://{USUARIO}:{SENHA}@{HOST}:{PORTA}/{BANCO_DE_DADOS}'
-engine = create_engine(url_com_banco, echo=False)
-
 # Definindo a base para as tabelas
 Base = declarative_base()
 
-# Criando uma sessão
-Sessao = sessionmaker(bind=engine)
-sessao = Sessao()
+# Criando uma sessão por operação da interface: cada tratador marcado com @unidade_de_trabalho usa uma
+# sessão própria, descartada ao final junto com os objetos carregados, em vez de uma sessão aberta até o
+# programa fechar
+Sessao = scoped_session(sessionmaker(bind=engine))
+sessao = Sessao
+
+operacoes_em_andamento = 0
+
+def unidade_de_trabalho(metodo):
+    """Descarta a sessão ao fim do tratador de evento.
+
+    Tratadores chamados durante outro (ex.: os botões de um diálogo aberto por form_dialog) usam a mesma sessão,
+    descartada quando o de fora termina.
+    """
+    @functools.wraps(metodo)
+    def executar(*args, **kwargs):
+        global operacoes_em_andamento
+        operacoes_em_andamento += 1
+        try:
+            return metodo(*args, **kwargs)
+        finally:
+            operacoes_em_andamento -= 1
+            if operacoes_em_andamento == 0:
+                Sessao.remove()
+    return executar
 
 # Tabela Cliente
 class Cliente(Base):
@@ -150,8 +188,16 @@ class Funcionario(Base):
 
     def __repr__(self):
         return f"<Funcionario(id={self.id}, nome={self.nome}, cpf={self.cpf})>"
-    
-Base.metadata.create_all(engine)
+
+# A tabela versao_esquema vem de versao_esquema.py, a mesma usada por banco_de_dados.py, e fica fora de Base
+if not esquema_atualizado:
+    Base.metadata.create_all(engine)
+    VersaoEsquema.__table__.create(engine, checkfirst=True)
+    with engine.begin() as conexao:
+        if (conexao.execute(select(func.max(VersaoEsquema.versao))).scalar() or 0) < VERSAO_ESQUEMA:
+            conexao.execute(VersaoEsquema.__table__.insert().values(
+                versao=VERSAO_ESQUEMA, descricao='Esquema inicial', data_aplicacao=datetime.now()
+            ))
 
 class CPFValidator(QRegExpValidator):
     def __init__(self):
@@ -179,7 +225,7 @@ class LoginDialog(QDialog):
         layout.addWidget(self.password_input, 1, 1)
 
         self.login_button = QPushButton("Login")
-        self.login_button.clicked.connect(self.login)
+        self.login_button.clicked.connect(lambda: self.login())
         layout.addWidget(self.login_button, 2, 0, 1, 2)
 
         self.register_button = QPushButton("Register")
@@ -189,7 +235,10 @@ class LoginDialog(QDialog):
         self.setLayout(layout)
         self.registration_dialog = None
 
+    @unidade_de_trabalho
     def login(self):
+        import bcrypt
+
         cpf = self.cpf_input.text()
         password = self.password_input.text()
 
@@ -277,7 +326,7 @@ class RegistrationDialog(QDialog):
         self.layout.addWidget(self.show_password_checkbox, row, 0, 1, 2)
 
         self.register_button = QPushButton("Registrar")
-        self.register_button.clicked.connect(self.register)
+        self.register_button.clicked.connect(lambda: self.register())
         self.layout.addWidget(self.register_button, row + 1, 0, 1, 2)
 
         self.setLayout(self.layout)
@@ -299,6 +348,7 @@ class RegistrationDialog(QDialog):
         self.password_input.setEchoMode(mode)
         self.confirm_password_input.setEchoMode(mode)
 
+    @unidade_de_trabalho
     def register(self):
         # Validate common fields
         cpf = self.cpf_input.text()
@@ -315,6 +365,8 @@ class RegistrationDialog(QDialog):
             QMessageBox.warning(self, "Erro", "As senhas não coincidem.")
             return
 
+        import bcrypt
+
         hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
 
         try:
@@ -467,7 +519,7 @@ class MainMenu(QMainWindow):
             personal_layout = QVBoxLayout()
             
             view_personal_btn = QPushButton('Consultar Dados Pessoais')
-            view_personal_btn.clicked.connect(self.view_personal_data)
+            view_personal_btn.clicked.connect(lambda: self.view_personal_data())
             personal_layout.addWidget(view_personal_btn)
             
             view_apolices_btn = QPushButton('Consultar Apólices')
@@ -485,6 +537,7 @@ class MainMenu(QMainWindow):
             personal_tab.setLayout(personal_layout)
             self.tabs.addTab(personal_tab, 'Área do Cliente')
 
+    @unidade_de_trabalho
     def view_personal_data(self):
         cliente = sessao.query(Cliente).filter_by(cpf=self.cpf).first()
         if cliente:
@@ -540,6 +593,7 @@ class MainMenu(QMainWindow):
         tab.setLayout(layout)
         self.tabs.addTab(tab, title)
 
+    @unidade_de_trabalho
     def form_dialog(self, tipo, operacao):
         dialog = QDialog(self)
         dialog.setWindowTitle(f'{operacao} {tipo}')
@@ -664,6 +718,7 @@ class MainMenu(QMainWindow):
 
         return campos, inputs
 
+    @unidade_de_trabalho
     def adicionar_registro(self, tipo, inputs, dialog, apolice_list=None, cliente_list=None, apartamento_list=None):
             if self.role == "client" and tipo != 'Cliente':
                 QMessageBox.warning(dialog, 'Acesso Negado', 'Você não tem permissão para adicionar este tipo de registro.')
@@ -801,6 +856,7 @@ class MainMenu(QMainWindow):
                 sessao.rollback()
                 QMessageBox.warning(dialog, 'Erro', f'Erro ao adicionar {tipo}: {e}')
 
+    @unidade_de_trabalho
     def atualizar_registro(self, tipo, inputs, id_list, dialog):
         if self.role == "client" and tipo != 'Cliente':
           QMessageBox.warning(dialog, 'Acesso Negado', 'Você não tem permissão para atualizar este tipo de registro.')
@@ -860,6 +916,7 @@ class MainMenu(QMainWindow):
             QMessageBox.warning(dialog, 'Erro', f'Erro ao atualizar {tipo}: {e}')
             print(f"Erro geral ao atualizar {tipo}: {e}")
 
+    @unidade_de_trabalho
     def deletar_registro(self, tipo, id_list, dialog):
         if self.role == "client":
             QMessageBox.warning(dialog, 'Acesso Negado', 'Você não tem permissão para deletar registros.')
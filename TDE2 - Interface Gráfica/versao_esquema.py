@@ -0,0 +1,13 @@
+from sqlalchemy.orm import declarative_base
+from sqlalchemy import Column, Integer, String, DateTime
+
+# Tabela com as migrações já aplicadas, usada por banco_de_dados.py e pela interface gráfica. Fica num
+# módulo próprio, com uma base só dela, porque importar banco_de_dados.py conecta ao banco e roda o script.
+base_versao = declarative_base()
+
+class VersaoEsquema(base_versao):
+    __tablename__ = 'versao_esquema'
+
+    versao = Column(Integer, primary_key=True, autoincrement=False)
+    descricao = Column(String(200))
+    data_aplicacao = Column(DateTime)
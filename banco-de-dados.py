@@ -1,32 +1,176 @@
+import os
+import asyncio
+import re
+import contextlib
+import functools
+import sys
+import threading
+import time
 import sqlalchemy
 from sqlalchemy import text
+from sqlalchemy import select
+from sqlalchemy import insert
+from sqlalchemy import update
+from sqlalchemy import delete
+from sqlalchemy import func
+from sqlalchemy import bindparam
+from sqlalchemy import literal
+from sqlalchemy import event
 from sqlalchemy import create_engine
 from sqlalchemy import Column
 from sqlalchemy import Integer
+from sqlalchemy import BigInteger
 from sqlalchemy import String
+from sqlalchemy import Float
 from sqlalchemy import ForeignKey
 from sqlalchemy import Date
+from sqlalchemy import DateTime
+from sqlalchemy import Index
+from sqlalchemy.engine import make_url
+from sqlalchemy.schema import AddConstraint
+from sqlalchemy.pool import NullPool
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import SingletonThreadPool
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.orm import Session
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import scoped_session
 from sqlalchemy.orm import relationship
+from collections import Counter
+from collections import OrderedDict
+from concurrent.futures import Future
 from datetime import date, datetime
 
 # PARTE 1: Configurações do Banco de Dados
-usuario = 'root'
-senha = ''
-host = 'localhost'
-porta = '3306'
-nome_do_banco = 'colecao_musicas'
+# Todas as configurações podem ser sobrescritas por variáveis de ambiente,
+# para que a CLI e os jobs em lote usem o mesmo banco sem editar o código.
+usuario = os.environ.get('BANCO_USUARIO', 'root')
+senha = os.environ.get('BANCO_SENHA', '')
+host = os.environ.get('BANCO_HOST', 'localhost')
+porta = os.environ.get('BANCO_PORTA', '3306')
+nome_do_banco = os.environ.get('BANCO_NOME', 'colecao_musicas')
+
+# Configurações do pool de conexões
+CONFIGURACAO_POOL = {
+    'pool_size': int(os.environ.get('BANCO_POOL_TAMANHO', '5')),
+    'max_overflow': int(os.environ.get('BANCO_POOL_EXCEDENTE', '10')),
+    'pool_recycle': int(os.environ.get('BANCO_POOL_RECICLAR', '3600')),  # segundos, abaixo do wait_timeout do MySQL
+    'pool_pre_ping': os.environ.get('BANCO_POOL_PRE_PING', '1') == '1',
+    'pool_timeout': int(os.environ.get('BANCO_POOL_TIMEOUT', '30')),
+}
+TIMEOUT_CONEXAO = int(os.environ.get('BANCO_TIMEOUT_CONEXAO', '10'))
+
+# Quantidade de linhas buscadas por vez nas listagens e relatórios
+TAMANHO_LOTE_LEITURA = int(os.environ.get('BANCO_LOTE_LEITURA', '1000'))
+
+# Quantidade máxima de gêneros e artistas mantidos no cache de dados de referência
+TAMANHO_CACHE_REFERENCIA = int(os.environ.get('BANCO_CACHE_REFERENCIA', '1024'))
+
+# Espaço entre as posições de músicas vizinhas numa playlist
+ESPACO_POSICAO = 1024
+
+# Quantidade máxima de linhas apagadas por DELETE nas exclusões em cascata (artista, álbum, cliente)
+TAMANHO_LOTE_EXCLUSAO = int(os.environ.get('BANCO_LOTE_EXCLUSAO', '1000'))
+
+# Instrumentação opcional das consultas SQL por ação do menu
+INSTRUMENTACAO_ATIVA = os.environ.get('BANCO_INSTRUMENTACAO', '0') == '1'
+ARQUIVO_LOG_INSTRUMENTACAO = os.environ.get('BANCO_INSTRUMENTACAO_LOG')
+LIMITE_REPETICOES_N_MAIS_1 = int(os.environ.get('BANCO_LIMITE_N_MAIS_1', '10'))
+
+# Réplica de leitura opcional (ex.: sqlite:///replica.db) e por quantos segundos depois de uma escrita
+# as leituras continuam no banco principal
+URL_REPLICA = os.environ.get('BANCO_URL_REPLICA')
+JANELA_LEITURA_PROPRIA = float(os.environ.get('BANCO_JANELA_REPLICA', '5'))
+
+# Versão do esquema que este código espera (a da última migração, ver "MIGRAÇÕES"). Quando o banco já está
+# nela, a inicialização faz uma única consulta em vez de verificar o banco e criar as tabelas.
+# BANCO_VERIFICAR_ESQUEMA=1 força a verificação completa mesmo assim.
+VERSAO_ESQUEMA = 1
+VERIFICAR_ESQUEMA = os.environ.get('BANCO_VERIFICAR_ESQUEMA', '0') == '1'
+
+# Migrações pendentes são aplicadas na partida ('0' só com o comando 'migrar'). Os preenchimentos de dados
+# das migrações andam em faixas de IDs, uma transação por faixa, com uma pausa entre elas
+MIGRAR_NA_PARTIDA = os.environ.get('BANCO_MIGRAR_NA_PARTIDA', '1') == '1'
+configuracao_migracao = {
+    'tamanho_lote': int(os.environ.get('BANCO_LOTE_MIGRACAO', '5000')),
+    'pausa': float(os.environ.get('BANCO_PAUSA_MIGRACAO', '0.05')),  # segundos
+}
+
+# Escrita agrupada opcional: escrever(), usada pelas ações do menu e pelo executar-lote, junta as operações e
+# as confirma numa única transação quando o grupo chega a BANCO_GRUPO_OPERACOES operações ou a mais antiga
+# espera há BANCO_GRUPO_ESPERA_MS milissegundos
+ESCRITA_AGRUPADA = os.environ.get('BANCO_ESCRITA_AGRUPADA', '0') == '1'
+TAMANHO_GRUPO_ESCRITA = int(os.environ.get('BANCO_GRUPO_OPERACOES', '100'))
+ESPERA_GRUPO_ESCRITA = float(os.environ.get('BANCO_GRUPO_ESPERA_MS', '20')) / 1000
+
+# Uma sessão nova por ação do menu ou comando ('0' volta a usar uma só sessão durante todo o programa)
+SESSAO_POR_ACAO = os.environ.get('BANCO_SESSAO_POR_ACAO', '1') == '1'
+
+# Modo das listagens: 'streaming' mostra tudo lendo em lotes, 'paginado' mostra uma página por vez
+configuracao_listagem = {
+    'modo': os.environ.get('BANCO_MODO_LISTAGEM', 'streaming'),
+    'tamanho_pagina': int(os.environ.get('BANCO_TAMANHO_PAGINA', '50')),
+}
 
 versao = sqlalchemy.__version__
 print("Versão do SQLAlchemy:",versao)
 
-url_sem_banco = f'mysql+pymysql://{usuario}:{senha}@{host}:{porta}'
+# BANCO_URL permite apontar para outro banco (ex.: sqlite:///colecao_musicas.db)
+if os.environ.get('BANCO_URL'):
+    url_com_banco = make_url(os.environ['BANCO_URL'])
+    nome_do_banco = url_com_banco.database
+    url_sem_banco = url_com_banco.set(database=None)
+else:
+    url_com_banco = make_url(f'mysql+pymysql://{usuario}:{senha}@{host}:{porta}/{nome_do_banco}')
+    url_sem_banco = make_url(f'mysql+pymysql://{usuario}:{senha}@{host}:{porta}')
+
+banco_sqlite = url_com_banco.get_backend_name() == 'sqlite'
+
+def opcoes_engine(url, **opcoes):
+    """Monta as opções de pool e timeout de uma engine, síncrona ou assíncrona."""
+    url = make_url(url)
+    configuracao = dict(CONFIGURACAO_POOL)
+    configuracao.update(opcoes)
+
+    if configuracao.get('poolclass') is NullPool:
+        # Sem pool: cada checkout abre uma conexão nova
+        for chave in ('pool_size', 'max_overflow', 'pool_recycle', 'pool_timeout'):
+            configuracao.pop(chave, None)
+
+    if url.get_backend_name() == 'sqlite':
+        # Um SQLite em arquivo usa QueuePool e aceita todas as opções. Em memória, o SQLAlchemy usa
+        # SingletonThreadPool (ou StaticPool, se pedido), que não tem tamanho, transbordo nem espera
+        em_memoria = url.database in (None, '', ':memory:') or url.query.get('mode') == 'memory'
+        if em_memoria or configuracao.get('poolclass') in (StaticPool, SingletonThreadPool):
+            for chave in ('pool_size', 'max_overflow', 'pool_timeout'):
+                configuracao.pop(chave, None)
+        configuracao.setdefault('connect_args', {'timeout': TIMEOUT_CONEXAO})
+    elif url.get_backend_name() == 'mysql' and url.get_driver_name() in ('pymysql', 'mysqldb'):
+        configuracao.setdefault('connect_args', {
+            'connect_timeout': TIMEOUT_CONEXAO,
+            'read_timeout': TIMEOUT_CONEXAO * 3,
+            'write_timeout': TIMEOUT_CONEXAO * 3,
+        })
+    elif url.get_backend_name() == 'mysql':
+        # Os drivers assíncronos só aceitam o timeout de conexão
+        configuracao.setdefault('connect_args', {'connect_timeout': TIMEOUT_CONEXAO})
 
-engine_sem_banco = create_engine(url_sem_banco, echo=False)
+    configuracao.setdefault('echo', False)
+    return configuracao
+
+def criar_engine(url, **opcoes):
+    """Cria uma engine com pool de conexões configurável."""
+    return create_engine(url, **opcoes_engine(url, **opcoes))
+
+# Quando o programa recebe um comando na linha de comando ele roda sem perguntas
+modo_comando = len(sys.argv) > 1
 
 def banco_existe(nome_do_banco):
     """Verifica se o banco de dados já existe."""
+    if banco_sqlite:
+        return True
     query = f"SELECT SCHEMA_NAME FROM INFORMATION_SCHEMA.SCHEMATA WHERE SCHEMA_NAME = '{nome_do_banco}'"
     with engine_sem_banco.connect() as conexao:
         resultado = conexao.execute(text(query)).fetchone()
@@ -38,25 +182,46 @@ def criar_banco_de_dados(nome_do_banco):
         conexao.execute(text(f"CREATE DATABASE {nome_do_banco}"))
         print(f"Banco de dados '{nome_do_banco}' criado.")
 
-while True:
-    if banco_existe(nome_do_banco):
-        print(f"O banco de dados '{nome_do_banco}' já existe.")
-        break
+def versao_do_esquema():
+    """Retorna a versão do esquema gravada no banco, ou None se o banco ou a tabela versao_esquema não existem."""
+    try:
+        with engine.connect() as conexao:
+            return conexao.execute(text("SELECT MAX(versao) FROM versao_esquema")).scalar()
+    except DBAPIError:
+        return None
 
-    print(f"O banco de dados '{nome_do_banco}' será criado se não existir.")
-    opcao = input("Deseja continuar? {1} Sim / {2} Não: ")
+engine = criar_engine(url_com_banco)
 
-    if opcao == '1':
-        criar_banco_de_dados(nome_do_banco)
-        break
-    elif opcao == '2':
-        print("ADEUS")
-        exit()
-    else:
-        print("Opção inválida. Por favor, escolha {1} ou {2}.")
+# Caminho rápido: com o esquema na versão atual, o banco existe e as tabelas estão completas
+versao_atual = versao_do_esquema()
+esquema_atualizado = not VERIFICAR_ESQUEMA and versao_atual == VERSAO_ESQUEMA
+
+if esquema_atualizado:
+    print(f"O banco de dados '{nome_do_banco}' já existe.")
+else:
+    # A engine sem banco só é usada na verificação inicial, então não mantém conexões abertas
+    engine_sem_banco = None if banco_sqlite else criar_engine(url_sem_banco, poolclass=NullPool)
+
+    while True:
+        if banco_existe(nome_do_banco):
+            print(f"O banco de dados '{nome_do_banco}' já existe.")
+            break
 
-url_com_banco = f'mysql+pymysql://{usuario}:{senha}@{host}:{porta}/{nome_do_banco}'
-engine = create_engine(url_com_banco, echo=False)
+        if modo_comando:
+            criar_banco_de_dados(nome_do_banco)
+            break
+
+        print(f"O banco de dados '{nome_do_banco}' será criado se não existir.")
+        opcao = input("Deseja continuar? {1} Sim / {2} Não: ")
+
+        if opcao == '1':
+            criar_banco_de_dados(nome_do_banco)
+            break
+        elif opcao == '2':
+            print("ADEUS")
+            exit()
+        else:
+            print("Opção inválida. Por favor, escolha {1} ou {2}.")
 
 # Base declarativa para mapeamento
 Base = declarative_base()
@@ -68,7 +233,7 @@ class Cliente(Base):
     nome = Column(String(50))
     email = Column(String(50))
     data_nasc = Column(Date)
-    playlists = relationship("Playlist", back_populates="cliente")
+    playlists = relationship("Playlist", back_populates="cliente", passive_deletes=True)
 
 class Playlist(Base):
     __tablename__ = 'playlists'
@@ -76,67 +241,1138 @@ class Playlist(Base):
     nome = Column(String(50))
     data_criacao = Column(Date)
     quantidade_musicas = Column(Integer)
-    fk_id_cliente = Column(Integer, ForeignKey('clientes.id'))
+    fk_id_cliente = Column(Integer, ForeignKey('clientes.id', ondelete='CASCADE'), index=True)
     cliente = relationship("Cliente", back_populates="playlists")
-    musicas = relationship("PlaylistMusica", back_populates="playlist")
+    musicas = relationship("PlaylistMusica", back_populates="playlist", passive_deletes=True)
 
 class Musica(Base):
     __tablename__ = 'musicas'
     id = Column(Integer, primary_key=True)
-    nome = Column(String(50))
+    nome = Column(String(50), index=True)
     duracao = Column(Integer)
-    fk_id_genero = Column(Integer, ForeignKey('generos.id'))
-    fk_id_album = Column(Integer, ForeignKey('albuns.id'))
-    fk_id_single = Column(Integer, ForeignKey('singles.id'), nullable=True)
+    fk_id_genero = Column(Integer, ForeignKey('generos.id'), index=True)
+    fk_id_album = Column(Integer, ForeignKey('albuns.id', ondelete='CASCADE'), index=True)
+    fk_id_single = Column(Integer, ForeignKey('singles.id'), nullable=True, index=True)
     album = relationship("Album", back_populates="musicas")
     genero = relationship("Genero", back_populates="musicas")
     single = relationship("Single", back_populates="musicas")
 
 class Album(Base):
     __tablename__ = 'albuns'
+    # Busca de álbum pelo nome dentro do artista (usada na importação do catálogo)
+    __table_args__ = (Index('ix_albuns_nome_artista', 'nome', 'fk_id_artista'),)
     id = Column(Integer, primary_key=True)
     nome = Column(String(50))
     data_lancamento = Column(Date)
-    fk_id_artista = Column(Integer, ForeignKey('artistas.id'))
+    fk_id_artista = Column(Integer, ForeignKey('artistas.id', ondelete='CASCADE'), index=True)
     artista = relationship("Artista", back_populates="albuns")
-    musicas = relationship("Musica", back_populates="album")
+    musicas = relationship("Musica", back_populates="album", passive_deletes=True)
 
 class Artista(Base):
     __tablename__ = 'artistas'
     id = Column(Integer, primary_key=True)
-    nome = Column(String(50))
+    nome = Column(String(50), index=True)
     pais_origem = Column(String(50))
-    albuns = relationship("Album", back_populates="artista")
+    albuns = relationship("Album", back_populates="artista", passive_deletes=True)
 
 class Genero(Base):
     __tablename__ = 'generos'
     id = Column(Integer, primary_key=True)
-    nome = Column(String(50))
+    nome = Column(String(50), index=True)
     musicas = relationship("Musica", back_populates="genero")
 
 class PlaylistMusica(Base):
     __tablename__ = 'playlist_musicas'
+    # Uma música aparece no máximo uma vez por playlist; o índice também atende buscas por fk_id_playlist
+    __table_args__ = (
+        Index('uq_playlist_musica', 'fk_id_playlist', 'fk_id_musica', unique=True),
+        Index('ix_playlist_musicas_posicao', 'fk_id_playlist', 'posicao'),
+    )
     id = Column(Integer, primary_key=True)
-    fk_id_playlist = Column(Integer, ForeignKey('playlists.id'))
-    fk_id_musica = Column(Integer, ForeignKey('musicas.id', ondelete='CASCADE'))
+    fk_id_playlist = Column(Integer, ForeignKey('playlists.id', ondelete='CASCADE'))
+    fk_id_musica = Column(Integer, ForeignKey('musicas.id', ondelete='CASCADE'), index=True)
+    # Ordem da música na playlist, com folga entre vizinhas (ver "Ordem das músicas nas playlists")
+    posicao = Column(BigInteger)
     playlist = relationship("Playlist", back_populates="musicas")
     musica = relationship("Musica", backref='playlists', passive_deletes=True)
 
 class Single(Base):
     __tablename__ = 'singles'
+    __table_args__ = (Index('ix_singles_nome_data', 'nome', 'data_lancamento'),)
     id = Column(Integer, primary_key=True)
     nome = Column(String(50))
     data_lancamento = Column(Date)
     musicas = relationship("Musica", back_populates="single")
 
-# Criando as tabelas no banco de dados
-Base.metadata.create_all(engine)
+class ResumoPlaylist(Base):
+    __tablename__ = 'resumo_playlists'
+    # Totais da playlist, mantidos a cada música adicionada ou removida (ver "Resumos das playlists")
+    fk_id_playlist = Column(Integer, ForeignKey('playlists.id', ondelete='CASCADE'), primary_key=True)
+    quantidade_musicas = Column(Integer, nullable=False, default=0)
+    duracao_total = Column(BigInteger, nullable=False, default=0)
+
+class ResumoPlaylistGenero(Base):
+    __tablename__ = 'resumo_playlist_generos'
+    # Quantidade de músicas de cada gênero na playlist; músicas sem gênero não entram
+    fk_id_playlist = Column(Integer, ForeignKey('playlists.id', ondelete='CASCADE'), primary_key=True)
+    fk_id_genero = Column(Integer, ForeignKey('generos.id', ondelete='CASCADE'), primary_key=True, index=True)
+    quantidade = Column(Integer, nullable=False, default=0)
+
+class PerfilCliente(Base):
+    __tablename__ = 'perfil_clientes'
+    # Quantas músicas de cada gênero e de cada artista o cliente tem, somando todas as playlists dele
+    fk_id_cliente = Column(Integer, ForeignKey('clientes.id', ondelete='CASCADE'), primary_key=True)
+    tipo = Column(String(10), primary_key=True)  # 'genero' ou 'artista'
+    referencia_id = Column(Integer, primary_key=True)
+    quantidade = Column(Integer, nullable=False, default=0)
+
+class MusicaSimilar(Base):
+    __tablename__ = 'musicas_similares'
+    # Músicas mais parecidas com cada música pela co-ocorrência em playlists, em ordem (ver "RECOMENDAÇÕES")
+    fk_id_musica = Column(Integer, ForeignKey('musicas.id', ondelete='CASCADE'), primary_key=True)
+    ordem = Column(Integer, primary_key=True)
+    fk_id_similar = Column(Integer, ForeignKey('musicas.id', ondelete='CASCADE'), index=True)
+    pontuacao = Column(Float)
+
+class VersaoEsquema(Base):
+    __tablename__ = 'versao_esquema'
+    # Uma linha por versão aplicada; a maior é a versão atual do banco
+    versao = Column(Integer, primary_key=True, autoincrement=False)
+    descricao = Column(String(200))
+    data_aplicacao = Column(DateTime)
+
+# Réplica de leitura
+# Com BANCO_URL_REPLICA, os SELECTs das operações só de leitura (listagens, buscas e relatórios, marcadas
+# com @leitura) vão para a réplica, e todo o resto vai para o banco principal. Depois de um commit com
+# escritas, as leituras da mesma thread continuam no principal por JANELA_LEITURA_PROPRIA segundos, para
+# que quem escreveu veja o que escreveu mesmo que a réplica esteja atrasada.
+engine_replica = criar_engine(make_url(URL_REPLICA)) if URL_REPLICA else None
+
+# Por thread (um usuário no menu, uma thread por usuário nos benchmarks): ações e operações de leitura em
+# andamento e o momento do último commit com escritas
+roteamento = threading.local()
+
+class SessaoRoteada(Session):
+    """Sessão que manda cada comando para a réplica ou para o banco principal."""
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.pode_usar_replica(clause):
+            return engine_replica
+        if getattr(clause, 'is_dml', False):
+            self.info['escreveu'] = True
+        return super().get_bind(mapper, clause=clause, **kwargs)
+
+    def pode_usar_replica(self, clause):
+        return (
+            engine_replica is not None
+            and getattr(roteamento, 'leituras', 0) > 0
+            and getattr(clause, 'is_select', False)
+            and not self.info.get('escreveu')
+            and time.monotonic() - getattr(roteamento, 'ultima_escrita', float('-inf')) >= JANELA_LEITURA_PROPRIA
+        )
+
+@event.listens_for(SessaoRoteada, 'after_flush')
+def marcar_escrita(sessao, contexto):
+    sessao.info['escreveu'] = True
+
+@event.listens_for(SessaoRoteada, 'after_commit')
+def abrir_janela_de_leitura_propria(sessao):
+    if sessao.info.pop('escreveu', False):
+        roteamento.ultima_escrita = time.monotonic()
+
+@event.listens_for(SessaoRoteada, 'after_rollback')
+def descartar_escrita(sessao):
+    sessao.info.pop('escreveu', None)
+
+def leitura(funcao):
+    """Marca uma operação só de leitura: fora da janela de leitura própria, os SELECTs dela podem ir para a réplica."""
+    @functools.wraps(funcao)
+    def executar(*args, **kwargs):
+        # Chamada de dentro de uma ação que escreve (ex.: a listagem mostrada antes de adicionar uma música a
+        # uma playlist), a leitura fica no principal, para não misturar na sessão objetos lidos da réplica
+        if getattr(roteamento, 'acoes', 0) > 1 and not getattr(roteamento, 'leituras', 0):
+            return funcao(*args, **kwargs)
+        roteamento.leituras = getattr(roteamento, 'leituras', 0) + 1
+        try:
+            return funcao(*args, **kwargs)
+        finally:
+            roteamento.leituras -= 1
+    return executar
 
 # Criando a sessão para interagir com o banco
-Sessao = sessionmaker(bind=engine)
-sessao = Sessao()
+# `sessao` é uma scoped_session: cada ação do menu ou comando trabalha numa sessão própria, descartada ao
+# final junto com o mapa de identidade (ver acao_de_menu), então a memória e o custo do commit não crescem
+# com o tempo de uso do programa. Sessao() continua criando sessões independentes (threads, processos).
+Sessao = sessionmaker(bind=engine, class_=SessaoRoteada)
+sessao = scoped_session(Sessao)
+
+# Instrumentação das consultas
+class Instrumentacao:
+    """Registra o número de consultas, o tempo de banco e as consultas mais lentas de cada ação do menu.
+
+    Uma mesma consulta (mesmo SQL, parâmetros diferentes) repetida muitas vezes numa ação
+    é sinalizada como suspeita de N+1.
+    """
+
+    def __init__(self, arquivo_log=None, limite_repeticoes=10):
+        self.arquivo_log = arquivo_log
+        self.limite_repeticoes = limite_repeticoes
+        self.menu_atual = 'principal'
+        self.consultas = None
+        self.resumo = {}
+
+    def ativar(self, engine):
+        event.listen(engine, 'before_cursor_execute', self.antes_da_consulta)
+        event.listen(engine, 'after_cursor_execute', self.depois_da_consulta)
+
+    def antes_da_consulta(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('inicio_consultas', []).append(time.perf_counter())
+
+    def depois_da_consulta(self, conn, cursor, statement, parameters, context, executemany):
+        duracao = (time.perf_counter() - conn.info['inicio_consultas'].pop()) * 1000
+        if self.consultas is not None:
+            self.consultas.append((statement, duracao))
+
+    @contextlib.contextmanager
+    def acao(self, nome):
+        # Ações chamadas de dentro de outra (ex.: ler_musicas dentro de adicionar_musica_a_playlist) contam na externa
+        if self.consultas is not None:
+            yield
+            return
+        self.consultas = []
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            consultas, self.consultas = self.consultas, None
+            self.registrar(f"{self.menu_atual}.{nome}", consultas, (time.perf_counter() - inicio) * 1000)
+
+    def registrar(self, chave, consultas, tempo_total):
+        tempo_banco = sum(duracao for _, duracao in consultas)
+        mais_lentas = sorted(consultas, key=lambda consulta: consulta[1], reverse=True)[:3]
+        repetidas = {sql: vezes for sql, vezes in Counter(sql for sql, _ in consultas).items() if vezes >= self.limite_repeticoes}
+
+        resumo = self.resumo.setdefault(chave, {
+            'execucoes': 0, 'consultas': 0, 'tempo_banco_ms': 0.0, 'tempo_total_ms': 0.0,
+            'consulta_mais_lenta_ms': 0.0, 'suspeitas_n_mais_1': 0,
+        })
+        resumo['execucoes'] += 1
+        resumo['consultas'] += len(consultas)
+        resumo['tempo_banco_ms'] += tempo_banco
+        resumo['tempo_total_ms'] += tempo_total
+        resumo['consulta_mais_lenta_ms'] = max(resumo['consulta_mais_lenta_ms'], mais_lentas[0][1] if mais_lentas else 0)
+        resumo['suspeitas_n_mais_1'] += len(repetidas)
+
+        print(f"[instrumentação] {chave}: {len(consultas)} consulta(s), {tempo_banco:.1f} ms no banco, {tempo_total:.1f} ms no total")
+        for sql, vezes in repetidas.items():
+            print(f"[instrumentação] possível N+1: consulta repetida {vezes}x: {' '.join(sql.split())[:120]}")
+
+        if self.arquivo_log:
+            import json
+            with open(self.arquivo_log, 'a', encoding='utf-8') as arquivo:
+                arquivo.write(json.dumps({
+                    'data': datetime.now().isoformat(timespec='seconds'),
+                    'acao': chave,
+                    'consultas': len(consultas),
+                    'tempo_banco_ms': round(tempo_banco, 3),
+                    'tempo_total_ms': round(tempo_total, 3),
+                    'mais_lentas': [{'sql': sql, 'ms': round(duracao, 3)} for sql, duracao in mais_lentas],
+                    'n_mais_1': [{'sql': sql, 'repeticoes': vezes} for sql, vezes in repetidas.items()],
+                }, ensure_ascii=False) + '\n')
+
+    def imprimir_resumo(self):
+        if not self.resumo:
+            return
+        print("\nResumo da instrumentação:")
+        print(f"{'Ação':<45} {'vezes':>6} {'consultas':>10} {'banco (ms)':>11} {'total (ms)':>11} {'mais lenta':>11} {'N+1':>4}")
+        for chave, resumo in sorted(self.resumo.items(), key=lambda item: item[1]['tempo_banco_ms'], reverse=True):
+            print(f"{chave:<45} {resumo['execucoes']:>6} {resumo['consultas']:>10} {resumo['tempo_banco_ms']:>11.1f} "
+                  f"{resumo['tempo_total_ms']:>11.1f} {resumo['consulta_mais_lenta_ms']:>11.1f} {resumo['suspeitas_n_mais_1']:>4}")
+
+instrumentacao = None
+if INSTRUMENTACAO_ATIVA:
+    instrumentacao = Instrumentacao(ARQUIVO_LOG_INSTRUMENTACAO, LIMITE_REPETICOES_N_MAIS_1)
+    instrumentacao.ativar(engine)
+    if engine_replica is not None:
+        instrumentacao.ativar(engine_replica)
+
+# Ações em andamento ficam em roteamento.acoes, por thread: uma ação pode chamar outra (ex.: ler_musicas
+# dentro de adicionar_musica_a_playlist), e cada thread descarta só a própria sessão
+def acao_de_menu(funcao):
+    """Marca uma função como ação do menu: uma unidade de trabalho, medida pela instrumentação.
+
+    Ao fim da ação mais externa a sessão é descartada (o que não foi confirmado é desfeito), e a próxima
+    ação começa com uma sessão vazia.
+    """
+    @functools.wraps(funcao)
+    def executar(*args, **kwargs):
+        roteamento.acoes = getattr(roteamento, 'acoes', 0) + 1
+        try:
+            if instrumentacao is None:
+                return funcao(*args, **kwargs)
+            with instrumentacao.acao(funcao.__name__):
+                return funcao(*args, **kwargs)
+        finally:
+            roteamento.acoes -= 1
+            if roteamento.acoes == 0 and SESSAO_POR_ACAO:
+                sessao.remove()
+    return executar
+
+def menu(funcao):
+    """Marca uma função como menu, para a instrumentação saber de qual menu veio cada ação."""
+    if instrumentacao is None:
+        return funcao
+
+    @functools.wraps(funcao)
+    def executar(*args, **kwargs):
+        menu_anterior = instrumentacao.menu_atual
+        instrumentacao.menu_atual = funcao.__name__
+        try:
+            return funcao(*args, **kwargs)
+        finally:
+            instrumentacao.menu_atual = menu_anterior
+    return executar
+
+# Cache dos dados de referência
+# O cache só guarda dados confirmados: uma linha lida por uma sessão que já escreveu na transação atual pode
+# ser desfeita por um rollback, então não entra. Alterações e exclusões agendam a remoção do ID para depois
+# do commit da sessão que as fez (um rollback cancela o agendamento), e até lá essa sessão lê o ID direto
+# do banco, vendo a própria alteração.
+class CacheReferencia:
+    """Cache LRU de tamanho limitado para tabelas pequenas que mudam pouco, como gêneros e artistas."""
+
+    def __init__(self, modelo, colunas, tamanho_maximo):
+        self.modelo = modelo
+        self.colunas = colunas
+        self.tamanho_maximo = tamanho_maximo
+        self.itens = OrderedDict()
+        self.acertos = 0
+        self.falhas = 0
+        # O cache é compartilhado pelas threads (menu, escrita agrupada, benchmarks). A consulta ao banco fica
+        # fora da trava; `geracao` muda a cada invalidação, para não guardar uma linha lida antes dela
+        self.trava = threading.Lock()
+        self.geracao = 0
+
+    def buscar(self, sessao, id):
+        """Retorna a linha com as colunas do cache para o ID, ou None se não existir, lendo pela sessão informada."""
+        alterado = self.alterado_na_sessao(sessao, id)
+        with self.trava:
+            if id in self.itens and not alterado:
+                self.itens.move_to_end(id)
+                self.acertos += 1
+                return self.itens[id]
+            self.falhas += 1
+            geracao = self.geracao
+        linha = sessao.execute(select(*self.colunas).where(self.modelo.id == id)).first()
+        # IDs inexistentes não entram no cache, assim um registro criado depois é encontrado
+        if linha is not None and not sessao.info.get('escritas_pendentes'):
+            with self.trava:
+                if geracao == self.geracao:
+                    self.itens[id] = linha
+                    self.itens.move_to_end(id)
+                    if len(self.itens) > self.tamanho_maximo:
+                        self.itens.popitem(last=False)
+        return linha
+
+    def alterado_na_sessao(self, sessao, id):
+        return any(
+            cache is self and (alterado is None or alterado == id)
+            for cache, alterado in sessao.info.get('invalidar_ao_confirmar', ())
+        )
+
+    def invalidar(self, id=None):
+        """Remove um ID do cache, ou todos se nenhum for informado."""
+        with self.trava:
+            self.geracao += 1
+            if id is None:
+                self.itens.clear()
+            else:
+                self.itens.pop(id, None)
+
+    def invalidar_ao_confirmar(self, sessao, id=None):
+        """Remove o ID (ou todos) quando a transação da sessão for confirmada."""
+        sessao.info.setdefault('invalidar_ao_confirmar', []).append((self, id))
+
+    def estatisticas(self):
+        total = self.acertos + self.falhas
+        taxa = self.acertos / total * 100 if total else 0
+        return (f"{self.modelo.__tablename__}: {len(self.itens)}/{self.tamanho_maximo} itens, "
+                f"{self.acertos} acertos, {self.falhas} falhas ({taxa:.1f}% de acerto)")
+
+# Valem para todas as sessões, inclusive as síncronas por trás das sessões assíncronas
+@event.listens_for(Session, 'after_flush')
+def marcar_escritas_pendentes(sessao, contexto):
+    sessao.info['escritas_pendentes'] = True
+
+@event.listens_for(Session, 'do_orm_execute')
+def marcar_escritas_pendentes_dml(estado):
+    if estado.is_insert or estado.is_update or estado.is_delete:
+        estado.session.info['escritas_pendentes'] = True
+
+@event.listens_for(Session, 'after_commit')
+def aplicar_invalidacoes(sessao):
+    sessao.info.pop('escritas_pendentes', None)
+    for cache, id in sessao.info.pop('invalidar_ao_confirmar', ()):
+        cache.invalidar(id)
+
+@event.listens_for(Session, 'after_rollback')
+def descartar_invalidacoes(sessao):
+    sessao.info.pop('escritas_pendentes', None)
+    sessao.info.pop('invalidar_ao_confirmar', None)
+
+cache_generos = CacheReferencia(Genero, (Genero.id, Genero.nome), TAMANHO_CACHE_REFERENCIA)
+cache_artistas = CacheReferencia(Artista, (Artista.id, Artista.nome, Artista.pais_origem), TAMANHO_CACHE_REFERENCIA)
+
+# Contador de músicas das playlists
+# O contador é sempre alterado no próprio banco (quantidade = quantidade + n), nunca lido e regravado
+# pelo Python, para que vários processos escrevendo ao mesmo tempo não percam atualizações.
+def alterar_quantidade_musicas(sessao, playlist_id, diferenca):
+    """Soma a diferença ao contador de músicas da playlist de forma atômica."""
+    sessao.execute(
+        update(Playlist)
+        .where(Playlist.id == playlist_id)
+        .values(quantidade_musicas=func.coalesce(Playlist.quantidade_musicas, 0) + diferenca)
+        .execution_options(synchronize_session=False)
+    )
+
+def remover_entradas_de_musica(sessao, musica_id):
+    """Remove uma música de todas as playlists, descontando-a dos contadores, dos resumos e dos perfis."""
+    descontar_entradas(sessao, PlaylistMusica.fk_id_musica == musica_id)
+    sessao.execute(
+        delete(PlaylistMusica).where(PlaylistMusica.fk_id_musica == musica_id).execution_options(synchronize_session=False)
+    )
+
+# Resumos das playlists
+# Quantidade de músicas, duração total e contagem por gênero de cada playlist ficam nas tabelas de resumo,
+# alteradas por diferença a cada música adicionada ou removida, como o contador de músicas. Assim a visão
+# geral de uma playlist é uma leitura pela chave, qualquer que seja o tamanho dela.
+def somar_quantidades(sessao, tabela, linhas):
+    """Soma a coluna `quantidade` das linhas às linhas da tabela com a mesma chave primária, inserindo as que faltam."""
+    if not linhas:
+        return
+    chave = [coluna.name for coluna in tabela.primary_key.columns]
+    backend = sessao.get_bind().dialect.name
+    if backend == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as insert_sqlite
+        comando = insert_sqlite(tabela)
+        comando = comando.on_conflict_do_update(
+            index_elements=chave, set_={'quantidade': tabela.c.quantidade + comando.excluded.quantidade}
+        )
+        sessao.execute(comando, linhas)
+    elif backend == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as insert_mysql
+        comando = insert_mysql(tabela)
+        sessao.execute(comando.on_duplicate_key_update(quantidade=tabela.c.quantidade + comando.inserted.quantidade), linhas)
+    else:
+        somar = (
+            update(tabela)
+            .where(*(tabela.c[nome] == bindparam(f'chave_{nome}') for nome in chave))
+            .values(quantidade=tabela.c.quantidade + bindparam('diferenca'))
+        )
+        for linha in linhas:
+            parametros = {f'chave_{nome}': linha[nome] for nome in chave}
+            if not sessao.execute(somar, dict(parametros, diferenca=linha['quantidade'])).rowcount:
+                sessao.execute(insert(tabela), linha)
+
+def somar_resumo_generos(sessao, playlist_id, diferencas):
+    """Soma as diferenças {genero_id: n} à contagem por gênero da playlist, criando as linhas que faltam."""
+    linhas = [
+        {'fk_id_playlist': playlist_id, 'fk_id_genero': genero_id, 'quantidade': diferenca}
+        for genero_id, diferenca in diferencas.items() if genero_id is not None and diferenca
+    ]
+    tabela = ResumoPlaylistGenero.__table__
+    somar_quantidades(sessao, tabela, linhas)
+    if any(linha['quantidade'] < 0 for linha in linhas):
+        sessao.execute(delete(tabela).where(tabela.c.fk_id_playlist == playlist_id, tabela.c.quantidade <= 0))
+
+def atualizar_resumo_playlist(sessao, playlist_id, musica_ids, sinal):
+    """Soma (sinal=1) ou desconta (sinal=-1) as músicas informadas nos resumos da playlist."""
+    por_genero = sessao.execute(
+        select(Musica.fk_id_genero, func.count(Musica.id), func.coalesce(func.sum(Musica.duracao), 0))
+        .where(Musica.id.in_(musica_ids))
+        .group_by(Musica.fk_id_genero)
+    ).all()
+    quantidade = sum(linha[1] for linha in por_genero)
+    duracao = sum(linha[2] for linha in por_genero)
+    sessao.execute(
+        update(ResumoPlaylist)
+        .where(ResumoPlaylist.fk_id_playlist == playlist_id)
+        .values(quantidade_musicas=ResumoPlaylist.quantidade_musicas + sinal * quantidade,
+                duracao_total=ResumoPlaylist.duracao_total + sinal * duracao)
+        .execution_options(synchronize_session=False)
+    )
+    somar_resumo_generos(sessao, playlist_id, {genero_id: sinal * total for genero_id, total, _ in por_genero})
+
+def descontar_entradas(sessao, *condicao):
+    """Desconta dos contadores, dos resumos e dos perfis as entradas de playlist que atendem à condição.
+
+    Deve ser chamada antes de removê-las. Cada tabela é alterada por um só UPDATE, com a diferença de cada
+    playlist calculada por subconsulta, então o custo não depende de quantas entradas são descontadas.
+    """
+    playlists = select(PlaylistMusica.fk_id_playlist).where(*condicao)
+
+    def das_entradas(coluna, playlist_id, *filtros):
+        return (
+            select(coluna).select_from(PlaylistMusica).outerjoin(Musica, Musica.id == PlaylistMusica.fk_id_musica)
+            .where(PlaylistMusica.fk_id_playlist == playlist_id, *condicao, *filtros)
+            .scalar_subquery()
+        )
+
+    sessao.execute(
+        update(Playlist).where(Playlist.id.in_(playlists))
+        .values(quantidade_musicas=func.coalesce(Playlist.quantidade_musicas, 0)
+                - das_entradas(func.count(PlaylistMusica.id), Playlist.id))
+        .execution_options(synchronize_session=False)
+    )
+    sessao.execute(
+        update(ResumoPlaylist).where(ResumoPlaylist.fk_id_playlist.in_(playlists))
+        .values(quantidade_musicas=ResumoPlaylist.quantidade_musicas
+                - das_entradas(func.count(PlaylistMusica.id), ResumoPlaylist.fk_id_playlist),
+                duracao_total=ResumoPlaylist.duracao_total
+                - das_entradas(func.coalesce(func.sum(Musica.duracao), 0), ResumoPlaylist.fk_id_playlist))
+        .execution_options(synchronize_session=False)
+    )
+    do_genero = (ResumoPlaylistGenero.fk_id_playlist.in_(playlists),)
+    sessao.execute(
+        update(ResumoPlaylistGenero).where(*do_genero)
+        .values(quantidade=ResumoPlaylistGenero.quantidade
+                - das_entradas(func.count(PlaylistMusica.id), ResumoPlaylistGenero.fk_id_playlist,
+                               Musica.fk_id_genero == ResumoPlaylistGenero.fk_id_genero))
+        .execution_options(synchronize_session=False)
+    )
+    sessao.execute(
+        delete(ResumoPlaylistGenero).where(*do_genero, ResumoPlaylistGenero.quantidade <= 0)
+        .execution_options(synchronize_session=False)
+    )
+    alterar_perfis(sessao, -1, *condicao)
+
+def alterar_duracao_nos_resumos(sessao, musica_id, diferenca):
+    """Aplica a mudança de duração de uma música à duração total das playlists em que ela está."""
+    sessao.execute(
+        update(ResumoPlaylist)
+        .where(ResumoPlaylist.fk_id_playlist.in_(select(PlaylistMusica.fk_id_playlist).where(PlaylistMusica.fk_id_musica == musica_id)))
+        .values(duracao_total=ResumoPlaylist.duracao_total + diferenca)
+        .execution_options(synchronize_session=False)
+    )
+
+def reconstruir_resumos_playlists(sessao, primeiro=None, ultimo=None):
+    """Recalcula com INSERT ... SELECT agrupado os resumos das playlists com ID entre `primeiro` e `ultimo` (ou de todas)."""
+    faixa_resumo, faixa_genero, faixa_playlist, faixa_entrada = [], [], [], []
+    if primeiro is not None:
+        faixa_resumo = [ResumoPlaylist.fk_id_playlist.between(primeiro, ultimo)]
+        faixa_genero = [ResumoPlaylistGenero.fk_id_playlist.between(primeiro, ultimo)]
+        faixa_playlist = [Playlist.id.between(primeiro, ultimo)]
+        faixa_entrada = [PlaylistMusica.fk_id_playlist.between(primeiro, ultimo)]
+    sessao.execute(delete(ResumoPlaylistGenero).where(*faixa_genero).execution_options(synchronize_session=False))
+    sessao.execute(delete(ResumoPlaylist).where(*faixa_resumo).execution_options(synchronize_session=False))
+    sessao.execute(insert(ResumoPlaylist).from_select(
+        ['fk_id_playlist', 'quantidade_musicas', 'duracao_total'],
+        select(Playlist.id, func.count(PlaylistMusica.id), func.coalesce(func.sum(Musica.duracao), 0))
+        .outerjoin(PlaylistMusica, PlaylistMusica.fk_id_playlist == Playlist.id)
+        .outerjoin(Musica, Musica.id == PlaylistMusica.fk_id_musica)
+        .where(*faixa_playlist)
+        .group_by(Playlist.id)
+    ))
+    sessao.execute(insert(ResumoPlaylistGenero).from_select(
+        ['fk_id_playlist', 'fk_id_genero', 'quantidade'],
+        select(PlaylistMusica.fk_id_playlist, Musica.fk_id_genero, func.count(PlaylistMusica.id))
+        .join(Musica, Musica.id == PlaylistMusica.fk_id_musica)
+        .where(*faixa_entrada, Musica.fk_id_genero.is_not(None))
+        .group_by(PlaylistMusica.fk_id_playlist, Musica.fk_id_genero)
+    ))
+
+def resumo_da_playlist(sessao, playlist_id):
+    """Retorna os totais da playlist e a contagem por gênero, lidos das tabelas de resumo."""
+    totais = sessao.execute(
+        select(ResumoPlaylist.quantidade_musicas, ResumoPlaylist.duracao_total).where(ResumoPlaylist.fk_id_playlist == playlist_id)
+    ).first()
+    if totais is None:
+        raise ValueError(MENSAGENS_NAO_ENCONTRADO[Playlist])
+    generos = sessao.execute(
+        select(Genero.nome, ResumoPlaylistGenero.quantidade)
+        .join(Genero, Genero.id == ResumoPlaylistGenero.fk_id_genero)
+        .where(ResumoPlaylistGenero.fk_id_playlist == playlist_id)
+        .order_by(ResumoPlaylistGenero.quantidade.desc())
+    ).all()
+    return totais, generos
+
+# Perfis dos clientes
+# Top gêneros e artistas de cada cliente em todas as playlists dele. A tabela perfil_clientes é alterada
+# por diferença sempre que entradas de playlist são inseridas ou removidas, e a leitura de um perfil é uma
+# consulta pela chave primária. O artista de uma música vem do álbum (singles não têm artista).
+TIPOS_PERFIL = (('genero', Musica.fk_id_genero), ('artista', Album.fk_id_artista))
+
+def consulta_perfil(tipo, coluna, *condicao):
+    """Contagem das entradas de playlist por (cliente, referência do tipo), no formato da tabela perfil_clientes."""
+    consulta = (
+        select(Playlist.fk_id_cliente, literal(tipo), coluna, func.count(PlaylistMusica.id))
+        .select_from(PlaylistMusica)
+        .join(Playlist, Playlist.id == PlaylistMusica.fk_id_playlist)
+        .join(Musica, Musica.id == PlaylistMusica.fk_id_musica)
+    )
+    if tipo == 'artista':
+        consulta = consulta.join(Album, Album.id == Musica.fk_id_album)
+    return consulta.where(*condicao, Playlist.fk_id_cliente.is_not(None), coluna.is_not(None)).group_by(Playlist.fk_id_cliente, coluna)
+
+def alterar_perfis(sessao, sinal, *condicao):
+    """Soma (sinal=1) ou desconta (sinal=-1) dos perfis as entradas de playlist que atendem à condição.
+
+    Deve ser chamada depois de inserir as entradas, ou antes de removê-las.
+    """
+    linhas = [
+        {'fk_id_cliente': cliente_id, 'tipo': tipo, 'referencia_id': referencia_id, 'quantidade': sinal * quantidade}
+        for tipo, coluna in TIPOS_PERFIL
+        for cliente_id, _, referencia_id, quantidade in sessao.execute(consulta_perfil(tipo, coluna, *condicao))
+    ]
+    somar_quantidades(sessao, PerfilCliente.__table__, linhas)
+    if sinal < 0 and linhas:
+        sessao.execute(
+            delete(PerfilCliente)
+            .where(PerfilCliente.fk_id_cliente.in_({linha['fk_id_cliente'] for linha in linhas}), PerfilCliente.quantidade <= 0)
+            .execution_options(synchronize_session=False)
+        )
+
+def reconstruir_perfis_clientes(sessao, primeiro=None, ultimo=None):
+    """Recalcula com INSERT ... SELECT os perfis dos clientes com ID entre `primeiro` e `ultimo` (ou de todos)."""
+    faixa_perfil, faixa_playlist = [], []
+    if primeiro is not None:
+        faixa_perfil = [PerfilCliente.fk_id_cliente.between(primeiro, ultimo)]
+        faixa_playlist = [Playlist.fk_id_cliente.between(primeiro, ultimo)]
+    sessao.execute(delete(PerfilCliente).where(*faixa_perfil).execution_options(synchronize_session=False))
+    for tipo, coluna in TIPOS_PERFIL:
+        sessao.execute(insert(PerfilCliente).from_select(
+            ['fk_id_cliente', 'tipo', 'referencia_id', 'quantidade'], consulta_perfil(tipo, coluna, *faixa_playlist)
+        ))
+
+def perfil_do_cliente(sessao, cliente_id, limite=5):
+    """Retorna {'genero': [(nome, quantidade), ...], 'artista': [...]} com os `limite` maiores de cada tipo."""
+    linhas = sessao.execute(
+        select(PerfilCliente.tipo, func.coalesce(Genero.nome, Artista.nome), PerfilCliente.quantidade)
+        .outerjoin(Genero, (PerfilCliente.tipo == 'genero') & (Genero.id == PerfilCliente.referencia_id))
+        .outerjoin(Artista, (PerfilCliente.tipo == 'artista') & (Artista.id == PerfilCliente.referencia_id))
+        .where(PerfilCliente.fk_id_cliente == cliente_id)
+        .order_by(PerfilCliente.tipo, PerfilCliente.quantidade.desc())
+    )
+    perfil = {tipo: [] for tipo, _ in TIPOS_PERFIL}
+    for tipo, nome, quantidade in linhas:
+        if len(perfil[tipo]) < limite:
+            perfil[tipo].append((nome, quantidade))
+    return perfil
+
+# MIGRAÇÕES
+# Cada mudança de esquema é uma função registrada com @migracao(versão, descrição), aplicada uma única vez e
+# em ordem, e registrada na tabela versao_esquema. Tabelas novas são criadas pelo create_all antes das
+# migrações; colunas, índices e chaves em tabelas existentes, e o preenchimento dos dados, ficam na migração.
+# Preenchimentos longos usam preencher_em_lotes(), para que nenhuma transação segure bloqueios por muito
+# tempo e o programa continue usável durante a migração. Uma migração interrompida não é registrada e roda
+# de novo na próxima vez, então cada passo deve poder ser repetido. Ao criar uma migração, aumente VERSAO_ESQUEMA.
+MIGRACOES = {}
+
+def migracao(versao, descricao):
+    """Registra a função decorada como a migração `versao`."""
+    def registrar(funcao):
+        MIGRACOES[versao] = (descricao, funcao)
+        return funcao
+    return registrar
+
+def preencher_em_lotes(coluna_id, preencher_faixa, rotulo, *condicao):
+    """Chama preencher_faixa(sessao, primeiro, ultimo) em faixas de `coluna_id`, cada uma na sua transação.
+
+    As faixas têm configuracao_migracao['tamanho_lote'] IDs e vão do menor ao maior ID das linhas que atendem
+    à `condicao` (ex.: as que ainda faltam preencher), então um preenchimento interrompido recomeça de onde
+    parou. Entre uma faixa e outra há uma pausa de configuracao_migracao['pausa'] segundos, para que as
+    consultas do programa não fiquem esperando.
+    """
+    tamanho_lote, pausa = configuracao_migracao['tamanho_lote'], configuracao_migracao['pausa']
+    with Sessao() as sessao_migracao:
+        minimo, maximo = sessao_migracao.execute(select(func.min(coluna_id), func.max(coluna_id)).where(*condicao)).one()
+    if minimo is None:
+        return
+    lotes = (maximo - minimo) // tamanho_lote + 1
+    maior_lote = 0
+    for numero, primeiro in enumerate(range(minimo, maximo + 1, tamanho_lote), start=1):
+        inicio = time.perf_counter()
+        with Sessao() as sessao_migracao, sessao_migracao.begin():
+            preencher_faixa(sessao_migracao, primeiro, primeiro + tamanho_lote - 1)
+        maior_lote = max(maior_lote, time.perf_counter() - inicio)
+        print(f"\r  {rotulo}: lote {numero}/{lotes}", end='', flush=True)
+        if numero < lotes:
+            time.sleep(pausa)
+    print(f"\r  {rotulo}: {lotes} lote(s), o mais longo com {maior_lote * 1000:.0f} ms")
+
+def atualizar_regras_de_exclusao(tabelas_anteriores):
+    """Recria no MySQL as chaves estrangeiras já existentes cuja regra ON DELETE difere da do modelo.
+
+    O create_all não altera tabelas, e o SQLite não permite trocar a chave de uma tabela existente.
+    """
+    if engine.dialect.name != 'mysql':
+        return
+    inspetor = sqlalchemy.inspect(engine)
+    for tabela in Base.metadata.sorted_tables:
+        if tabela.name not in tabelas_anteriores:
+            continue
+        atuais = {tuple(chave['constrained_columns']): chave for chave in inspetor.get_foreign_keys(tabela.name)}
+        for restricao in tabela.foreign_key_constraints:
+            atual = atuais.get(tuple(restricao.column_keys))
+            if atual is None or not restricao.ondelete:
+                continue
+            if (atual['options'].get('ondelete') or '').upper() == restricao.ondelete.upper():
+                continue
+            with engine.begin() as conexao:
+                conexao.execute(text(f"ALTER TABLE {tabela.name} DROP FOREIGN KEY {atual['name']}"))
+                conexao.execute(AddConstraint(restricao))
+            print(f"Chave {tabela.name}({', '.join(restricao.column_keys)}) recriada com ON DELETE {restricao.ondelete}.")
+
+def preencher_posicoes(sessao, primeiro, ultimo):
+    """Mantém a ordem atual (por ID), já com espaço entre as posições."""
+    sessao.execute(
+        update(PlaylistMusica)
+        .where(PlaylistMusica.id.between(primeiro, ultimo), PlaylistMusica.posicao.is_(None))
+        .values(posicao=PlaylistMusica.id * ESPACO_POSICAO)
+        .execution_options(synchronize_session=False)
+    )
+
+@migracao(1, 'Esquema inicial')
+def migracao_esquema_inicial(tabelas_anteriores):
+    """Traz um banco criado antes do controle de versão para o esquema atual.
+
+    A coluna posicao, as tabelas de resumo e de perfis e as regras ON DELETE vieram depois das primeiras
+    tabelas, e o create_all não altera tabelas existentes.
+    """
+    colunas = {coluna['name'] for coluna in sqlalchemy.inspect(engine).get_columns(PlaylistMusica.__tablename__)}
+    if 'posicao' not in colunas:
+        with engine.begin() as conexao:
+            conexao.execute(text("ALTER TABLE playlist_musicas ADD COLUMN posicao BIGINT"))
+        print("Coluna 'posicao' adicionada à tabela playlist_musicas.")
+    preencher_em_lotes(PlaylistMusica.id, preencher_posicoes, "Posições das músicas nas playlists", PlaylistMusica.posicao.is_(None))
+    if not any(indice['name'] == 'ix_playlist_musicas_posicao' for indice in sqlalchemy.inspect(engine).get_indexes(PlaylistMusica.__tablename__)):
+        next(indice for indice in PlaylistMusica.__table__.indexes if indice.name == 'ix_playlist_musicas_posicao').create(engine)
+
+    atualizar_regras_de_exclusao(tabelas_anteriores)
+
+    # Bancos criados antes das tabelas de resumo e de perfis têm os dados calculados a partir das playlists
+    if ResumoPlaylist.__tablename__ not in tabelas_anteriores:
+        preencher_em_lotes(Playlist.id, reconstruir_resumos_playlists, "Resumos das playlists")
+    if PerfilCliente.__tablename__ not in tabelas_anteriores:
+        preencher_em_lotes(Cliente.id, reconstruir_perfis_clientes, "Perfis dos clientes")
+
+def gravar_versao_do_esquema(versao, descricao):
+    with engine.begin() as conexao:
+        conexao.execute(insert(VersaoEsquema).values(versao=versao, descricao=descricao, data_aplicacao=datetime.now()))
+
+def migracoes_pendentes(versao):
+    return [numero for numero in sorted(MIGRACOES) if numero > (versao or 0)]
+
+def migrar_esquema(versao):
+    """Cria as tabelas que faltam e aplica, em ordem, as migrações posteriores à `versao` do banco.
+
+    Num banco vazio, o create_all já cria o esquema atual, então as migrações só são registradas.
+    """
+    tabelas_anteriores = set(sqlalchemy.inspect(engine).get_table_names())
+    banco_vazio = not tabelas_anteriores & set(Base.metadata.tables)
+    Base.metadata.create_all(engine)
+    for numero in migracoes_pendentes(versao):
+        descricao, funcao = MIGRACOES[numero]
+        if not banco_vazio:
+            print(f"Aplicando a migração {numero}: {descricao}")
+            inicio = time.perf_counter()
+            funcao(tabelas_anteriores)
+            print(f"Migração {numero} aplicada em {time.perf_counter() - inicio:.1f}s.")
+        gravar_versao_do_esquema(numero, descricao)
+
+# O comando 'migrar' aplica as migrações ele mesmo, com o tamanho do lote e a pausa pedidos
+if not esquema_atualizado and sys.argv[1:2] != ['migrar']:
+    if MIGRAR_NA_PARTIDA or not migracoes_pendentes(versao_atual):
+        migrar_esquema(versao_atual)
+    else:
+        print(f"O banco está na versão {versao_atual or 0} do esquema e este código precisa da versão {VERSAO_ESQUEMA}.")
+        print("Aplique as migrações com 'python banco-de-dados.py migrar'.")
+        sys.exit(1)
+
+# Ordem das músicas nas playlists
+# As posições têm uma folga de ESPACO_POSICAO entre vizinhas. Inserir ou mover uma música grava só a
+# linha dela, com uma posição no meio do intervalo entre as novas vizinhas; remover não mexe nas outras.
+# Só quando não sobra espaço entre duas posições a playlist é renumerada (rebalanceada) de uma vez.
+def ultima_posicao(sessao, playlist_id):
+    return sessao.execute(
+        select(func.max(PlaylistMusica.posicao)).where(PlaylistMusica.fk_id_playlist == playlist_id)
+    ).scalar() or 0
+
+def vizinhas_da_faixa(sessao, playlist_id, faixa, ignorar_entrada_id=None):
+    """Posições das entradas que ficam antes e depois da faixa `faixa` (1 = primeira), ou None se não houver."""
+    consulta = select(PlaylistMusica.posicao).where(PlaylistMusica.fk_id_playlist == playlist_id)
+    if ignorar_entrada_id is not None:
+        consulta = consulta.where(PlaylistMusica.id != ignorar_entrada_id)
+    consulta = consulta.order_by(PlaylistMusica.posicao, PlaylistMusica.id)
+    if faixa <= 1:
+        return None, sessao.execute(consulta.limit(1)).scalar()
+    posicoes = sessao.scalars(consulta.offset(faixa - 2).limit(2)).all()
+    if not posicoes:
+        # Depois do fim da playlist
+        return ultima_posicao(sessao, playlist_id), None
+    return posicoes[0], posicoes[1] if len(posicoes) > 1 else None
+
+def calcular_posicao(sessao, playlist_id, faixa, ignorar_entrada_id=None):
+    """Posição livre para uma música na faixa `faixa` da playlist, rebalanceando a playlist se preciso."""
+    while True:
+        anterior, seguinte = vizinhas_da_faixa(sessao, playlist_id, faixa, ignorar_entrada_id)
+        if seguinte is None:
+            return (anterior or 0) + ESPACO_POSICAO
+        if anterior is None:
+            return seguinte - ESPACO_POSICAO
+        if seguinte - anterior > 1:
+            return (anterior + seguinte) // 2
+        rebalancear_playlist(sessao, playlist_id)
+
+def rebalancear_playlist(sessao, playlist_id):
+    """Renumera as posições da playlist com ESPACO_POSICAO entre elas, mantendo a ordem."""
+    entradas = sessao.scalars(
+        select(PlaylistMusica.id)
+        .where(PlaylistMusica.fk_id_playlist == playlist_id)
+        .order_by(PlaylistMusica.posicao, PlaylistMusica.id)
+    ).all()
+    tabela = PlaylistMusica.__table__
+    if entradas:
+        sessao.execute(
+            update(tabela).where(tabela.c.id == bindparam('entrada_id')).values(posicao=bindparam('nova_posicao')),
+            [{'entrada_id': entrada_id, 'nova_posicao': (indice + 1) * ESPACO_POSICAO} for indice, entrada_id in enumerate(entradas)]
+        )
+
+def faixas_da_playlist(sessao, playlist_id, primeira, ultima):
+    """Faixas `primeira` a `ultima` da playlist (1 = primeira), lidas pelo índice (fk_id_playlist, posicao)."""
+    return sessao.execute(
+        select(Musica.id, Musica.nome, Musica.duracao)
+        .join(PlaylistMusica, PlaylistMusica.fk_id_musica == Musica.id)
+        .where(PlaylistMusica.fk_id_playlist == playlist_id)
+        .order_by(PlaylistMusica.posicao, PlaylistMusica.id)
+        .offset(primeira - 1)
+        .limit(ultima - primeira + 1)
+    ).all()
+
+# SERVIÇOS
+# Funções que recebem os dados por parâmetro, sem input() nem print(), e não fazem commit:
+# quem chama decide quando confirmar (o menu grava cada operação com escrever(), o executar-lote confirma
+# a cada N operações).
+# Dados inválidos ou registros inexistentes são informados com ValueError, antes de qualquer escrita.
+ENTIDADES = {
+    'cliente': Cliente,
+    'playlist': Playlist,
+    'musica': Musica,
+    'album': Album,
+    'artista': Artista,
+    'genero': Genero,
+    'single': Single,
+}
+
+MENSAGENS_NAO_ENCONTRADO = {
+    Cliente: "Cliente não encontrado.",
+    Playlist: "Playlist não encontrada.",
+    Musica: "Música não encontrada.",
+    Album: "Álbum não encontrado.",
+    Artista: "Artista não encontrado.",
+    Genero: "Gênero não encontrado.",
+    Single: "Single não encontrada.",
+}
+
+CAMPOS_ATUALIZAVEIS = {
+    Cliente: ('nome', 'email', 'data_nasc'),
+    Playlist: ('nome',),
+    Musica: ('nome', 'duracao'),
+    Album: ('nome', 'data_lancamento'),
+    Artista: ('nome', 'pais_origem'),
+    Genero: ('nome',),
+    Single: ('nome', 'data_lancamento'),
+}
+
+def buscar_registro(sessao, modelo, id):
+    """Busca um registro pelo ID, ou levanta ValueError se ele não existir."""
+    registro = sessao.get(modelo, id)
+    if registro is None:
+        raise ValueError(MENSAGENS_NAO_ENCONTRADO[modelo])
+    return registro
+
+def servico_criar_cliente(sessao, nome, email, data_nasc):
+    cliente = Cliente(nome=nome, email=email, data_nasc=data_nasc)
+    sessao.add(cliente)
+    sessao.flush()
+    return cliente
+
+def servico_criar_playlist(sessao, nome, cliente_id):
+    buscar_registro(sessao, Cliente, cliente_id)
+    playlist = Playlist(nome=nome, data_criacao=date.today(), quantidade_musicas=0, fk_id_cliente=cliente_id)
+    sessao.add(playlist)
+    sessao.flush()
+    sessao.add(ResumoPlaylist(fk_id_playlist=playlist.id, quantidade_musicas=0, duracao_total=0))
+    sessao.flush()
+    return playlist
+
+def servico_criar_artista(sessao, nome, pais_origem=None):
+    artista = Artista(nome=nome, pais_origem=pais_origem)
+    sessao.add(artista)
+    sessao.flush()
+    return artista
+
+def servico_criar_genero(sessao, nome):
+    genero = Genero(nome=nome)
+    sessao.add(genero)
+    sessao.flush()
+    return genero
+
+def servico_criar_album(sessao, nome, data_lancamento=None, artista_id=None):
+    if artista_id is not None and cache_artistas.buscar(sessao, artista_id) is None:
+        raise ValueError(MENSAGENS_NAO_ENCONTRADO[Artista])
+    album = Album(nome=nome, data_lancamento=data_lancamento, fk_id_artista=artista_id)
+    sessao.add(album)
+    sessao.flush()
+    return album
+
+def servico_criar_single(sessao, nome, data_lancamento=None):
+    single = Single(nome=nome, data_lancamento=data_lancamento)
+    sessao.add(single)
+    sessao.flush()
+    return single
+
+def servico_adicionar_musica(sessao, nome, duracao, genero_id, album_id=None, single_id=None):
+    if duracao < 0:
+        raise ValueError("A duração não pode ser negativa.")
+    if (album_id is None) == (single_id is None):
+        raise ValueError("Informe o álbum ou a single da música, e apenas um dos dois.")
+    # O cache consulta pela sessão recebida, então um gênero criado nela e ainda não confirmado é encontrado
+    if cache_generos.buscar(sessao, genero_id) is None:
+        raise ValueError(MENSAGENS_NAO_ENCONTRADO[Genero])
+    if album_id is not None:
+        buscar_registro(sessao, Album, album_id)
+    else:
+        buscar_registro(sessao, Single, single_id)
+    musica = Musica(nome=nome, duracao=duracao, fk_id_genero=genero_id, fk_id_album=album_id, fk_id_single=single_id)
+    sessao.add(musica)
+    sessao.flush()
+    return musica
+
+def servico_adicionar_musica_a_playlist(sessao, playlist_id, musica_id, faixa=None):
+    """Adiciona a música no fim da playlist, ou na faixa `faixa` (1 = primeira) se informada."""
+    buscar_registro(sessao, Playlist, playlist_id)
+    buscar_registro(sessao, Musica, musica_id)
+    ja_existe = sessao.execute(
+        select(PlaylistMusica.id).where(PlaylistMusica.fk_id_playlist == playlist_id, PlaylistMusica.fk_id_musica == musica_id)
+    ).first()
+    if ja_existe:
+        raise ValueError("Esta música já está na playlist.")
+    if faixa is None:
+        posicao = ultima_posicao(sessao, playlist_id) + ESPACO_POSICAO
+    else:
+        posicao = calcular_posicao(sessao, playlist_id, faixa)
+    # Se outro processo inserir a mesma música ao mesmo tempo, o índice único recusa com IntegrityError
+    sessao.add(PlaylistMusica(fk_id_playlist=playlist_id, fk_id_musica=musica_id, posicao=posicao))
+    sessao.flush()
+    alterar_quantidade_musicas(sessao, playlist_id, 1)
+    atualizar_resumo_playlist(sessao, playlist_id, [musica_id], 1)
+    alterar_perfis(sessao, 1, PlaylistMusica.fk_id_playlist == playlist_id, PlaylistMusica.fk_id_musica == musica_id)
+
+def servico_adicionar_musicas_a_playlist(sessao, playlist_id, musica_ids):
+    """Adiciona várias músicas a uma playlist de uma vez. Retorna (IDs adicionados, IDs que já estavam nela).
+
+    As músicas são validadas com uma consulta IN, as entradas inseridas com um único executemany
+    e o contador alterado uma vez só.
+    """
+    musica_ids = list(dict.fromkeys(musica_ids))
+    if not musica_ids:
+        raise ValueError("Informe ao menos uma música.")
+    buscar_registro(sessao, Playlist, playlist_id)
+    existentes = set(sessao.scalars(select(Musica.id).where(Musica.id.in_(musica_ids))))
+    faltando = [musica_id for musica_id in musica_ids if musica_id not in existentes]
+    if faltando:
+        raise ValueError(f"Músicas não encontradas: {', '.join(map(str, faltando))}.")
+    ja_na_playlist = set(sessao.scalars(
+        select(PlaylistMusica.fk_id_musica)
+        .where(PlaylistMusica.fk_id_playlist == playlist_id, PlaylistMusica.fk_id_musica.in_(musica_ids))
+    ))
+    novas = [musica_id for musica_id in musica_ids if musica_id not in ja_na_playlist]
+    if novas:
+        # As novas músicas entram no fim da playlist, na ordem informada
+        base = ultima_posicao(sessao, playlist_id)
+        sessao.execute(insert(PlaylistMusica), [
+            {'fk_id_playlist': playlist_id, 'fk_id_musica': musica_id, 'posicao': base + (indice + 1) * ESPACO_POSICAO}
+            for indice, musica_id in enumerate(novas)
+        ])
+        alterar_quantidade_musicas(sessao, playlist_id, len(novas))
+        atualizar_resumo_playlist(sessao, playlist_id, novas, 1)
+        alterar_perfis(sessao, 1, PlaylistMusica.fk_id_playlist == playlist_id, PlaylistMusica.fk_id_musica.in_(novas))
+    return novas, [musica_id for musica_id in musica_ids if musica_id in ja_na_playlist]
+
+def servico_remover_musica_da_playlist(sessao, playlist_id, musica_id):
+    # Os perfis são descontados antes, enquanto a entrada existe (se não existir, nada muda)
+    alterar_perfis(sessao, -1, PlaylistMusica.fk_id_playlist == playlist_id, PlaylistMusica.fk_id_musica == musica_id)
+    resultado = sessao.execute(
+        delete(PlaylistMusica)
+        .where(PlaylistMusica.fk_id_playlist == playlist_id, PlaylistMusica.fk_id_musica == musica_id)
+        .execution_options(synchronize_session=False)
+    )
+    # Só desconta se a linha ainda existia, caso outro processo já a tenha removido
+    if not resultado.rowcount:
+        raise ValueError("Música não encontrada nesta playlist.")
+    alterar_quantidade_musicas(sessao, playlist_id, -1)
+    atualizar_resumo_playlist(sessao, playlist_id, [musica_id], -1)
+
+def servico_mover_musica_na_playlist(sessao, playlist_id, musica_id, faixa):
+    """Move a música para a faixa `faixa` da playlist (1 = primeira), gravando só a linha dela."""
+    if faixa < 1:
+        raise ValueError("A faixa deve ser um número maior que zero.")
+    entrada_id = sessao.execute(
+        select(PlaylistMusica.id).where(PlaylistMusica.fk_id_playlist == playlist_id, PlaylistMusica.fk_id_musica == musica_id)
+    ).scalar()
+    if entrada_id is None:
+        raise ValueError("Música não encontrada nesta playlist.")
+    posicao = calcular_posicao(sessao, playlist_id, faixa, ignorar_entrada_id=entrada_id)
+    sessao.execute(
+        update(PlaylistMusica)
+        .where(PlaylistMusica.id == entrada_id)
+        .values(posicao=posicao)
+        .execution_options(synchronize_session=False)
+    )
+
+def servico_atualizar(sessao, modelo, id, novos_dados):
+    """Altera os campos informados de um registro."""
+    for campo in novos_dados:
+        if campo not in CAMPOS_ATUALIZAVEIS[modelo]:
+            raise ValueError(f"O campo '{campo}' não pode ser alterado.")
+    if novos_dados.get('duracao') is not None and novos_dados['duracao'] < 0:
+        raise ValueError("A duração não pode ser negativa.")
+    registro = buscar_registro(sessao, modelo, id)
+    if modelo is Musica and novos_dados.get('duracao') is not None:
+        alterar_duracao_nos_resumos(sessao, id, novos_dados['duracao'] - (registro.duracao or 0))
+    for campo, valor in novos_dados.items():
+        setattr(registro, campo, valor)
+    if modelo is Genero:
+        cache_generos.invalidar_ao_confirmar(sessao, id)
+    elif modelo is Artista:
+        cache_artistas.invalidar_ao_confirmar(sessao, id)
+    return registro
+
+# Exclusão em cascata
+# Artista, álbum e cliente levam junto o que depende deles. Em vez de carregar os objetos e deixar o ORM
+# apagá-los um a um, cada etapa apaga, da folha para a raiz, lotes de até TAMANHO_LOTE_EXCLUSAO linhas com
+# DELETE ... WHERE id IN (...), descontando antes os contadores, resumos e perfis. O ON DELETE CASCADE das
+# chaves fica só como garantia: quando a linha de cima é apagada, as de baixo já não existem.
+def apagar_similares(sessao, musica_ids):
+    sessao.execute(
+        delete(MusicaSimilar)
+        .where(MusicaSimilar.fk_id_musica.in_(musica_ids) | MusicaSimilar.fk_id_similar.in_(musica_ids))
+        .execution_options(synchronize_session=False)
+    )
+
+def apagar_resumos(sessao, playlist_ids):
+    for resumo in (ResumoPlaylistGenero, ResumoPlaylist):
+        sessao.execute(
+            delete(resumo).where(resumo.fk_id_playlist.in_(playlist_ids)).execution_options(synchronize_session=False)
+        )
+
+def apagar_perfis(sessao, cliente_ids):
+    sessao.execute(
+        delete(PerfilCliente).where(PerfilCliente.fk_id_cliente.in_(cliente_ids)).execution_options(synchronize_session=False)
+    )
+
+def descontar_entradas_por_id(sessao, entrada_ids):
+    descontar_entradas(sessao, PlaylistMusica.id.in_(entrada_ids))
+
+def etapas_de_exclusao(modelo, id):
+    """Lista as etapas (descrição, modelo, condição, preparo) para apagar o registro e o que depende dele.
+
+    `preparo(sessao, ids)`, quando houver, roda antes de cada lote, com os IDs que serão apagados.
+    """
+    if modelo is Cliente:
+        playlists = select(Playlist.id).where(Playlist.fk_id_cliente == id)
+        return [
+            ("entradas de playlist", PlaylistMusica, PlaylistMusica.fk_id_playlist.in_(playlists), descontar_entradas_por_id),
+            ("playlists", Playlist, Playlist.fk_id_cliente == id, apagar_resumos),
+            ("cliente", Cliente, Cliente.id == id, apagar_perfis),
+        ]
+    if modelo is Artista:
+        albuns = select(Album.id).where(Album.fk_id_artista == id)
+        raiz = [("álbuns", Album, Album.fk_id_artista == id, None), ("artista", Artista, Artista.id == id, None)]
+    else:
+        albuns = [id]
+        raiz = [("álbum", Album, Album.id == id, None)]
+    musicas = select(Musica.id).where(Musica.fk_id_album.in_(albuns))
+    return [
+        ("entradas de playlist", PlaylistMusica, PlaylistMusica.fk_id_musica.in_(musicas), descontar_entradas_por_id),
+        ("músicas", Musica, Musica.fk_id_album.in_(albuns), apagar_similares),
+    ] + raiz
+
+def contar_exclusao(sessao, modelo, id):
+    """Simulação: retorna [(descrição, linhas)] com o que apagar_em_cascata apagaria, sem apagar nada."""
+    return [
+        (descricao, sessao.scalar(select(func.count()).select_from(alvo).where(condicao)))
+        for descricao, alvo, condicao, _ in etapas_de_exclusao(modelo, id)
+    ]
+
+def apagar_em_cascata(sessao, modelo, id, tamanho_lote=None, confirmar_lotes=False, progresso=None):
+    """Apaga um artista, álbum ou cliente e o que depende dele, em lotes de até `tamanho_lote` linhas.
+
+    Com `confirmar_lotes`, faz commit a cada lote, para que nenhuma transação segure os bloqueios por muito
+    tempo; se for interrompida, o banco fica consistente e basta repetir a exclusão. Sem ele, tudo fica na
+    transação de quem chamou, como nos outros serviços. `progresso(descricao, apagadas)` é chamada a cada
+    lote. Retorna {descrição: linhas apagadas}.
+    """
+    tamanho_lote = tamanho_lote or TAMANHO_LOTE_EXCLUSAO
+    apagadas = {}
+    for descricao, alvo, condicao, preparo in etapas_de_exclusao(modelo, id):
+        apagadas[descricao] = 0
+        while True:
+            ids = sessao.scalars(select(alvo.id).where(condicao).order_by(alvo.id).limit(tamanho_lote)).all()
+            if not ids:
+                break
+            if preparo is not None:
+                preparo(sessao, ids)
+            sessao.execute(delete(alvo).where(alvo.id.in_(ids)).execution_options(synchronize_session=False))
+            if confirmar_lotes:
+                sessao.commit()
+            apagadas[descricao] += len(ids)
+            if progresso is not None:
+                progresso(descricao, apagadas[descricao])
+    if modelo is Artista:
+        # Com confirmar_lotes a exclusão já foi confirmada
+        if confirmar_lotes:
+            cache_artistas.invalidar(id)
+        else:
+            cache_artistas.invalidar_ao_confirmar(sessao, id)
+    return apagadas
+
+def servico_apagar(sessao, modelo, id):
+    """Apaga um registro, removendo também as entradas de playlist que dependem dele."""
+    registro = buscar_registro(sessao, modelo, id)
+    if modelo in (Artista, Album, Cliente):
+        apagar_em_cascata(sessao, modelo, id)
+        # O registro já foi apagado pelo DELETE; desligado da sessão, ainda pode ser lido por quem chamou
+        sessao.expunge(registro)
+        return registro
+    if modelo is Musica:
+        remover_entradas_de_musica(sessao, id)
+        apagar_similares(sessao, [id])
+    elif modelo is Playlist:
+        alterar_perfis(sessao, -1, PlaylistMusica.fk_id_playlist == id)
+        sessao.execute(
+            delete(PlaylistMusica).where(PlaylistMusica.fk_id_playlist == id).execution_options(synchronize_session=False)
+        )
+        apagar_resumos(sessao, [id])
+    elif modelo is Genero:
+        # As músicas continuam nas playlists, só que sem gênero: os totais não mudam, mas a contagem do gênero
+        # sai dos resumos (o ON DELETE CASCADE não vale no SQLite, que não liga as chaves estrangeiras)
+        sessao.execute(
+            delete(ResumoPlaylistGenero).where(ResumoPlaylistGenero.fk_id_genero == id).execution_options(synchronize_session=False)
+        )
+        # Pelo mesmo motivo, o gênero sai dos perfis dos clientes
+        sessao.execute(
+            delete(PerfilCliente).where(PerfilCliente.tipo == 'genero', PerfilCliente.referencia_id == id)
+            .execution_options(synchronize_session=False)
+        )
+    sessao.delete(registro)
+    if modelo is Genero:
+        cache_generos.invalidar_ao_confirmar(sessao, id)
+    return registro
 
 #CRUD(CREATE)
+@acao_de_menu
 def criar_cliente():
     nome = input("Digite o nome do cliente: ")
     email = input("Digite o email do cliente: ")
@@ -149,15 +1385,12 @@ def criar_cliente():
         except ValueError:
             print("Formato inválido. Por favor, insira a data no formato DD-MM-AAAA.")
     
-    novo_cliente = Cliente(nome=nome, email=email, data_nasc=data_nasc)
-    sessao.add(novo_cliente)
-    sessao.commit()
+    escrever('criar_cliente', nome=nome, email=email, data_nasc=data_nasc).result()
     print(f"Cliente '{nome}' criado com sucesso!")
 
+@acao_de_menu
 def criar_playlist():
     nome = input("Digite o nome da playlist: ")
-    data_criacao = date.today()
-    quantidade_musicas = 0
     clientes = sessao.query(Cliente).all()
     
     if not clientes:
@@ -179,12 +1412,11 @@ def criar_playlist():
         print("Cliente não encontrado.")
         return
 
-    nova_playlist = Playlist(nome=nome, data_criacao=data_criacao, quantidade_musicas=quantidade_musicas, fk_id_cliente=cliente.id)
-    sessao.add(nova_playlist)
-    sessao.commit()
+    escrever('criar_playlist', nome=nome, cliente_id=cliente.id).result()
     print(f"Playlist '{nome}' criada com sucesso!")
 
 
+@acao_de_menu
 def adicionar_musica():
     nome = input("Digite o nome da música: ")
 
@@ -198,18 +1430,19 @@ def adicionar_musica():
         except ValueError:
             print("Formato inválido. Por favor, insira um número inteiro para a duração.")
 
+    # Artista, gênero, single ou álbum criados aqui são gravados junto com a música, num único commit
+    criados = []
+
     # Selecionar ou criar artista
     try:
         artista_id = int(input("Digite o ID do artista: "))
-        artista = sessao.query(Artista).filter_by(id=artista_id).first()
+        artista = cache_artistas.buscar(sessao, artista_id)
         
         if not artista:
             artista_nome = input("Artista não encontrado. Digite o nome do artista: ")
             pais_origem = input("Digite o país de origem do artista: ")
-            artista = Artista(nome=artista_nome, pais_origem=pais_origem)
-            sessao.add(artista)
-            sessao.commit()
-            print(f"Artista '{artista.nome}' criado com sucesso!")
+            artista = servico_criar_artista(sessao, artista_nome, pais_origem)
+            criados.append(f"Artista '{artista.nome}'")
     except ValueError:
         print("ID inválido. Por favor, insira um número inteiro.")
         return
@@ -217,16 +1450,16 @@ def adicionar_musica():
     # Selecionar ou criar gênero
     try:
         genero_id = int(input("Digite o ID do gênero: "))
-        genero = sessao.query(Genero).filter_by(id=genero_id).first()
+        genero = cache_generos.buscar(sessao, genero_id)
         
         if not genero:
             genero_nome = input("Gênero não encontrado. Digite o nome do gênero: ")
-            genero = Genero(nome=genero_nome)
-            sessao.add(genero)
-            sessao.commit()
-            print(f"Gênero '{genero.nome}' criado com sucesso!")
+            genero = servico_criar_genero(sessao, genero_nome)
+            criados.append(f"Gênero '{genero.nome}'")
     except ValueError:
         print("ID inválido. Por favor, insira um número inteiro.")
+        if criados:
+            print("Nada foi gravado.")
         return
 
     tipo = input("A música é uma single ou faz parte de um álbum? (1 para Single, 2 para Álbum): ")
@@ -240,13 +1473,11 @@ def adicionar_musica():
             except ValueError:
                 print("Formato inválido. Por favor, insira a data no formato DD-MM-AAAA.")
         
-        nova_single = Single(nome=nome, data_lancamento=data_lancamento)
-        sessao.add(nova_single)
-        sessao.commit()
-        
-        nova_musica = Musica(nome=nome, duracao=duracao, fk_id_single=nova_single.id, fk_id_genero=genero.id)
-        sessao.add(nova_musica)
+        nova_single = servico_criar_single(sessao, nome, data_lancamento)
+        servico_adicionar_musica(sessao, nome, duracao, genero.id, single_id=nova_single.id)
         sessao.commit()
+        for criado in criados:
+            print(f"{criado} criado com sucesso!")
         print(f"Música '{nome}' adicionada como single com sucesso!")
     
     elif tipo == '2':
@@ -264,21 +1495,23 @@ def adicionar_musica():
                     except ValueError:
                         print("Formato inválido. Por favor, insira a data no formato DD-MM-AAAA.")
                 
-                album = Album(nome=album_nome, data_lancamento=data_lancamento_album, fk_id_artista=artista.id)
-                sessao.add(album)
-                sessao.commit()
-                print(f"Álbum '{album.nome}' criado com sucesso!")
+                album = servico_criar_album(sessao, album_nome, data_lancamento_album, artista.id)
+                criados.append(f"Álbum '{album.nome}'")
         except ValueError:
             print("ID inválido. Por favor, insira um número inteiro.")
+            if criados:
+                print("Nada foi gravado.")
             return
 
-        nova_musica = Musica(nome=nome, duracao=duracao, fk_id_album=album.id, fk_id_genero=genero.id)
-        sessao.add(nova_musica)
+        servico_adicionar_musica(sessao, nome, duracao, genero.id, album_id=album.id)
         sessao.commit()
+        for criado in criados:
+            print(f"{criado} criado com sucesso!")
         print(f"Música '{nome}' adicionada ao álbum '{album.nome}' com sucesso!")
 
 
 
+@acao_de_menu
 def adicionar_musica_a_playlist():
     playlists = sessao.query(Playlist).all()
     
@@ -306,146 +1539,414 @@ def adicionar_musica_a_playlist():
     ler_musicas()
 
     try:
-        musica_id = int(input("Digite o ID da música a ser adicionada: "))
-        musica = sessao.query(Musica).filter_by(id=musica_id).first()
+        musica_ids = interpretar_ids(input("Digite os IDs das músicas a serem adicionadas (ex.: 3, 7, 10-25): "))
     except ValueError:
-        print("ID inválido. Por favor, insira um número inteiro.")
+        print("IDs inválidos. Use números inteiros separados por vírgula ou intervalos como 10-25.")
         return
 
-    if not musica:
-        print("Música não encontrada. Você pode criar uma nova música.")
-        adicionar_musica()
-    else:
-        nova_playlist_musica = PlaylistMusica(fk_id_playlist=playlist.id, fk_id_musica=musica.id)
-        sessao.add(nova_playlist_musica)
-        playlist.quantidade_musicas += 1
-        sessao.commit()
-        print(f"Música '{musica.nome}' adicionada à playlist '{playlist.nome}' com sucesso!")
+    try:
+        adicionadas, repetidas = escrever('adicionar_musicas_a_playlist', playlist_id=playlist.id, musica_ids=musica_ids).result()
+    except ValueError as erro:
+        print(erro)
+        if len(musica_ids) == 1:
+            print("Você pode criar uma nova música.")
+            adicionar_musica()
+        return
+    except IntegrityError:
+        # Outro processo adicionou alguma das músicas ao mesmo tempo
+        sessao.rollback()
+        print("Alguma das músicas já está na playlist. Tente novamente.")
+        return
+
+    if repetidas:
+        print(f"Já estavam na playlist: {', '.join(map(str, repetidas))}.")
+    print(f"{len(adicionadas)} música(s) adicionada(s) à playlist '{playlist.nome}' com sucesso!")
+
+def interpretar_ids(texto):
+    """Converte um texto como '3, 7, 10-25' na lista de IDs [3, 7, 10, 11, ..., 25]."""
+    ids = []
+    for parte in re.split(r'[,\s]+', texto.strip()):
+        if not parte:
+            continue
+        if '-' in parte:
+            inicio, fim = (int(numero) for numero in parte.split('-', 1))
+            if fim < inicio:
+                raise ValueError(f"Intervalo inválido: {parte}")
+            ids.extend(range(inicio, fim + 1))
+        else:
+            ids.append(int(parte))
+    if not ids:
+        raise ValueError("Nenhum ID informado.")
+    return ids
 
 
 #CRUD(READ)
+def paginas_por_chave(colunas, tamanho_pagina):
+    """Busca as linhas em páginas usando paginação por chave (WHERE id > último id)."""
+    chave = colunas[0]
+    ultimo_id = None
+    while True:
+        consulta = select(*colunas).order_by(chave).limit(tamanho_pagina)
+        if ultimo_id is not None:
+            consulta = consulta.where(chave > ultimo_id)
+        pagina = sessao.execute(consulta).all()
+        if not pagina:
+            return
+        yield pagina
+        if len(pagina) < tamanho_pagina:
+            return
+        ultimo_id = pagina[-1][0]
+
+def listar(colunas, titulo, mensagem_vazia, formatar):
+    """Lista uma tabela sem carregá-la inteira na memória, em streaming ou em páginas."""
+    # Só as colunas exibidas são buscadas, sem criar objetos do ORM
+    vazia = True
+    if configuracao_listagem['modo'] == 'paginado':
+        tamanho_pagina = configuracao_listagem['tamanho_pagina']
+        for numero, pagina in enumerate(paginas_por_chave(colunas, tamanho_pagina), start=1):
+            if vazia:
+                print(titulo)
+                vazia = False
+            elif input(f"Enter para ver a página {numero} ou 's' para parar: ").strip().lower() == 's':
+                break
+            for linha in pagina:
+                print(formatar(linha))
+    else:
+        consulta = select(*colunas).order_by(colunas[0]).execution_options(yield_per=TAMANHO_LOTE_LEITURA)
+        for linha in sessao.execute(consulta):
+            if vazia:
+                print(titulo)
+                vazia = False
+            print(formatar(linha))
+    if vazia:
+        print(mensagem_vazia)
+
+@acao_de_menu
+@leitura
 def ler_clientes():
-    clientes = sessao.query(Cliente).all()
-    if not clientes:
-        print("Não há clientes cadastrados.")
-        return
-    print("Clientes cadastrados:")
-    for cliente in clientes:
-        print(f"{cliente.id}: {cliente.nome}")
+    listar((Cliente.id, Cliente.nome), "Clientes cadastrados:", "Não há clientes cadastrados.",
+           lambda cliente: f"{cliente.id}: {cliente.nome}")
 
+@acao_de_menu
+@leitura
 def ler_playlists():
-    playlists = sessao.query(Playlist).all()
-    if not playlists:
-        print("Não há playlists cadastradas.")
-        return
-    print("Playlists cadastradas:")
-    for playlist in playlists:
-        print(f"{playlist.id}: {playlist.nome}")
+    listar((Playlist.id, Playlist.nome), "Playlists cadastradas:", "Não há playlists cadastradas.",
+           lambda playlist: f"{playlist.id}: {playlist.nome}")
 
+@acao_de_menu
+@leitura
 def ler_musicas():
-    musicas = sessao.query(Musica).all()
-    if not musicas:
-        print("Não há músicas cadastradas.")
-        return
-    print("Músicas cadastradas:")
-    for musica in musicas:
-        print(f"{musica.id}: {musica.nome}")
+    listar((Musica.id, Musica.nome), "Músicas cadastradas:", "Não há músicas cadastradas.",
+           lambda musica: f"{musica.id}: {musica.nome}")
 
+@acao_de_menu
+@leitura
 def ler_albuns():
-    albuns = sessao.query(Album).all()
-    if not albuns:
-        print("Não há álbuns cadastrados.")
-        return
-    print("Álbuns cadastrados:")
-    for album in albuns:
-        print(f"{album.id}: {album.nome} (Lançado em: {album.data_lancamento})")
+    listar((Album.id, Album.nome, Album.data_lancamento), "Álbuns cadastrados:", "Não há álbuns cadastrados.",
+           lambda album: f"{album.id}: {album.nome} (Lançado em: {album.data_lancamento})")
 
+@acao_de_menu
+@leitura
 def ler_artistas():
-    artistas = sessao.query(Artista).all()
-    if not artistas:
-        print("Não há artistas cadastrados.")
-        return
-    print("Artistas cadastrados:")
-    for artista in artistas:
-        print(f"{artista.id}: {artista.nome}")
+    listar((Artista.id, Artista.nome), "Artistas cadastrados:", "Não há artistas cadastrados.",
+           lambda artista: f"{artista.id}: {artista.nome}")
 
+@acao_de_menu
+@leitura
 def ler_singles():
-    singles = sessao.query(Single).all()
-    if not singles:
-        print("Não há singles cadastradas.")
-        return
-    print("Singles cadastradas:")
-    for single in singles:
-        print(f"{single.id}: {single.nome} (Lançada em: {single.data_lancamento})")
+    listar((Single.id, Single.nome, Single.data_lancamento), "Singles cadastradas:", "Não há singles cadastradas.",
+           lambda single: f"{single.id}: {single.nome} (Lançada em: {single.data_lancamento})")
 
+@acao_de_menu
+@leitura
 def ler_generos():
-    generos = sessao.query(Genero).all()
-    if not generos:
-        print("Não há gêneros cadastrados.")
-        return
-    print("Gêneros cadastrados:")
-    for genero in generos:
-        print(f"{genero.id}: {genero.nome}")
+    listar((Genero.id, Genero.nome), "Gêneros cadastrados:", "Não há gêneros cadastrados.",
+           lambda genero: f"{genero.id}: {genero.nome}")
 
-def ler_playlists_e_musicas():
-    playlists = sessao.query(Playlist).all()
-    if not playlists:
-        print("Não há playlists cadastradas.")
-        return
-    print("Playlists cadastradas:")
-    for playlist in playlists:
-        print(f"\nPlaylist ID: {playlist.id}, Nome: {playlist.nome}, Data de Criação: {playlist.data_criacao}")
-        print("Músicas nesta playlist:")
-        if not playlist.musicas:
-            print("Nenhuma música cadastrada nesta playlist.")
-        else:
-            for playlist_musica in playlist.musicas:
-                musica = sessao.query(Musica).filter_by(id=playlist_musica.fk_id_musica).first()
-                print(f" - {musica.nome} (ID: {musica.id})")
+def configurar_listagem():
+    print(f"Modo atual: {configuracao_listagem['modo']}, tamanho da página: {configuracao_listagem['tamanho_pagina']}")
+    modo = input("Escolha o modo de listagem: {1} Streaming / {2} Paginado (deixe em branco para não alterar): ")
+    if modo == '1':
+        configuracao_listagem['modo'] = 'streaming'
+    elif modo == '2':
+        configuracao_listagem['modo'] = 'paginado'
 
-#CRUD(UPDATE)
-def atualizar_musica():
-    ler_musicas()  # Mostra as músicas cadastradas
+    tamanho_input = input("Digite o tamanho da página (deixe em branco para não alterar): ")
+    if tamanho_input:
+        try:
+            tamanho_pagina = int(tamanho_input)
+            if tamanho_pagina <= 0:
+                raise ValueError
+            configuracao_listagem['tamanho_pagina'] = tamanho_pagina
+        except ValueError:
+            print("Tamanho inválido. Por favor, insira um número inteiro positivo.")
+    print(f"Listagem configurada: modo {configuracao_listagem['modo']}, {configuracao_listagem['tamanho_pagina']} por página.")
+
+@acao_de_menu
+@leitura
+def ler_faixas_da_playlist():
     try:
-        musica_id = int(input("Digite o ID da música que deseja atualizar: "))
-        musica = sessao.query(Musica).filter_by(id=musica_id).first()
+        playlist_id = int(input("Digite o ID da playlist: "))
+        primeira = int(input("Primeira faixa (1 = primeira): "))
+        ultima = int(input("Última faixa: "))
+        if primeira < 1 or ultima < primeira:
+            raise ValueError
     except ValueError:
-        print("ID inválido. Por favor, insira um número inteiro.")
+        print("Valores inválidos. Informe o ID da playlist e um intervalo de faixas como 1 e 20.")
         return
-    
-    if musica:
-        novo_nome = input("Digite o novo nome da música (deixe em branco para não alterar): ")
-        if novo_nome:
-            musica.nome = novo_nome
-        
-        while True:
-            nova_duracao_input = input("Digite a nova duração da música em segundos (deixe em branco para não alterar): ")
-            if nova_duracao_input:
-                try:
-                    nova_duracao = int(nova_duracao_input)
-                    if nova_duracao < 0:
-                        print("A duração não pode ser negativa. Por favor, insira um valor válido.")
-                        continue
-                    musica.duracao = nova_duracao
-                except ValueError:
-                    print("Formato inválido. Por favor, insira um número inteiro para a duração.")
-                    continue
-                break
-            else:
-                break
-
-        sessao.commit()
-        print(f"Música atualizada com sucesso!")
-    else:
-        print("Música não encontrada.")
-
 
+    faixas = faixas_da_playlist(sessao, playlist_id, primeira, ultima)
+    if not faixas:
+        print("Nenhuma música neste intervalo da playlist.")
+        return
+    print(f"Faixas {primeira} a {primeira + len(faixas) - 1} da playlist {playlist_id}:")
+    for faixa, (musica_id, musica_nome, duracao) in enumerate(faixas, start=primeira):
+        print(f" {faixa}. {musica_nome} (ID: {musica_id}, Duração: {duracao} segundos)")
 
-def atualizar_playlist():
-    ler_playlists()  # Mostra as playlists cadastradas
+@acao_de_menu
+@leitura
+def ler_resumo_da_playlist():
     try:
-        playlist_id = int(input("Digite o ID da playlist que deseja atualizar: "))
-        playlist = sessao.query(Playlist).filter_by(id=playlist_id).first()
+        playlist_id = int(input("Digite o ID da playlist: "))
+    except ValueError:
+        print("ID inválido. Por favor, insira um número inteiro.")
+        return
+
+    try:
+        (quantidade, duracao_total), generos = resumo_da_playlist(sessao, playlist_id)
+    except ValueError as erro:
+        print(erro)
+        return
+    horas, resto = divmod(duracao_total, 3600)
+    print(f"Playlist {playlist_id}: {quantidade} música(s), duração total {horas}:{resto // 60:02d}:{resto % 60:02d}")
+    for genero_nome, quantidade_genero in generos:
+        print(f" - {genero_nome}: {quantidade_genero} música(s) ({quantidade_genero / quantidade * 100:.1f}%)")
+
+@acao_de_menu
+@leitura
+def ler_perfil_do_cliente():
+    try:
+        cliente_id = int(input("Digite o ID do cliente: "))
+    except ValueError:
+        print("ID inválido. Por favor, insira um número inteiro.")
+        return
+
+    perfil = perfil_do_cliente(sessao, cliente_id)
+    if not any(perfil.values()):
+        print("Nenhuma música nas playlists deste cliente.")
+        return
+    for titulo, tipo in (("Gêneros mais ouvidos", 'genero'), ("Artistas mais ouvidos", 'artista')):
+        print(f"{titulo}:")
+        for nome, quantidade in perfil[tipo]:
+            print(f" - {nome}: {quantidade} música(s)")
+
+@acao_de_menu
+@leitura
+def ler_musicas_similares():
+    try:
+        musica_id = int(input("Digite o ID da música: "))
+    except ValueError:
+        print("ID inválido. Por favor, insira um número inteiro.")
+        return
+
+    similares = musicas_similares(sessao, musica_id)
+    if not similares:
+        print("Nenhuma recomendação para esta música. Use o comando 'calcular-recomendacoes' para calculá-las.")
+        return
+    print("Músicas parecidas:")
+    for similar_id, similar_nome, pontuacao in similares:
+        print(f" - {similar_nome} (ID: {similar_id}, semelhança: {pontuacao:.2f})")
+
+def mostrar_estatisticas_cache():
+    print("Cache de dados de referência:")
+    for cache in (cache_generos, cache_artistas):
+        print(f"- {cache.estatisticas()}")
+
+@acao_de_menu
+@leitura
+def ler_playlists_e_musicas():
+    # Uma única consulta com join, lida em lotes: o número de consultas não cresce com o número de playlists
+    consulta = (
+        select(Playlist.id, Playlist.nome, Playlist.data_criacao, Musica.id, Musica.nome)
+        .outerjoin(PlaylistMusica, PlaylistMusica.fk_id_playlist == Playlist.id)
+        .outerjoin(Musica, Musica.id == PlaylistMusica.fk_id_musica)
+        .order_by(Playlist.id, PlaylistMusica.posicao, PlaylistMusica.id)
+        .execution_options(yield_per=TAMANHO_LOTE_LEITURA)
+    )
+    playlist_atual = None
+    for playlist_id, playlist_nome, data_criacao, musica_id, musica_nome in sessao.execute(consulta):
+        if playlist_atual is None:
+            print("Playlists cadastradas:")
+        if playlist_id != playlist_atual:
+            playlist_atual = playlist_id
+            print(f"\nPlaylist ID: {playlist_id}, Nome: {playlist_nome}, Data de Criação: {data_criacao}")
+            print("Músicas nesta playlist:")
+            if musica_id is None:
+                print("Nenhuma música cadastrada nesta playlist.")
+        if musica_id is not None:
+            print(f" - {musica_nome} (ID: {musica_id})")
+    if playlist_atual is None:
+        print("Não há playlists cadastradas.")
+
+# BUSCA
+TIPOS_BUSCA = (('Música', Musica), ('Álbum', Album), ('Artista', Artista))
+
+# Definido na primeira busca: 'fulltext' (MySQL), 'fts5' (SQLite) ou 'like' quando nenhum dos dois está disponível
+modo_busca = None
+
+def preparar_fts5():
+    """Cria a tabela FTS5 de busca do SQLite, preenchida a partir do catálogo e mantida por triggers."""
+    with engine.begin() as conexao:
+        if conexao.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'busca_catalogo'")).first():
+            return
+        print("Criando o índice de busca textual...")
+        conexao.execute(text("CREATE VIRTUAL TABLE busca_catalogo USING fts5(nome, tokenize = 'unicode61 remove_diacritics 2')"))
+        # O rowid codifica a tabela de origem (id * 3 + código), assim as triggers acham a linha pelo rowid
+        for codigo, (_, modelo) in enumerate(TIPOS_BUSCA):
+            tabela = modelo.__tablename__
+            chave = f"{len(TIPOS_BUSCA)} + {codigo}"
+            conexao.execute(text(f"INSERT INTO busca_catalogo(rowid, nome) SELECT id * {chave}, nome FROM {tabela}"))
+            conexao.execute(text(
+                f"CREATE TRIGGER busca_{tabela}_insercao AFTER INSERT ON {tabela} BEGIN "
+                f"INSERT INTO busca_catalogo(rowid, nome) VALUES (new.id * {chave}, new.nome); END"
+            ))
+            conexao.execute(text(
+                f"CREATE TRIGGER busca_{tabela}_atualizacao AFTER UPDATE OF nome ON {tabela} BEGIN "
+                f"DELETE FROM busca_catalogo WHERE rowid = old.id * {chave}; "
+                f"INSERT INTO busca_catalogo(rowid, nome) VALUES (new.id * {chave}, new.nome); END"
+            ))
+            conexao.execute(text(
+                f"CREATE TRIGGER busca_{tabela}_delecao AFTER DELETE ON {tabela} BEGIN "
+                f"DELETE FROM busca_catalogo WHERE rowid = old.id * {chave}; END"
+            ))
+
+def preparar_fulltext():
+    """Cria os índices FULLTEXT do MySQL que ainda não existem."""
+    inspetor = sqlalchemy.inspect(engine)
+    with engine.begin() as conexao:
+        for _, modelo in TIPOS_BUSCA:
+            tabela = modelo.__tablename__
+            if not any(indice['name'] == f'ft_{tabela}_nome' for indice in inspetor.get_indexes(tabela)):
+                print(f"Criando o índice de busca textual de {tabela}...")
+                conexao.execute(text(f"ALTER TABLE {tabela} ADD FULLTEXT INDEX ft_{tabela}_nome (nome)"))
+
+def preparar_busca():
+    """Prepara a busca textual do banco em uso e retorna o modo escolhido."""
+    global modo_busca
+    if modo_busca is None:
+        try:
+            if banco_sqlite:
+                preparar_fts5()
+                modo_busca = 'fts5'
+            elif url_com_banco.get_backend_name() == 'mysql':
+                preparar_fulltext()
+                modo_busca = 'fulltext'
+            else:
+                modo_busca = 'like'
+        except DBAPIError as erro:
+            print(f"Busca textual indisponível ({erro.orig}). Usando LIKE.")
+            modo_busca = 'like'
+    return modo_busca
+
+def buscar_por_like(termo, limite=20):
+    """Busca por LIKE '%termo%', sem ordenação por relevância. Lê a tabela inteira."""
+    resultados = []
+    for tipo, modelo in TIPOS_BUSCA:
+        consulta = select(modelo.id, modelo.nome).where(modelo.nome.contains(termo, autoescape=True)).limit(limite)
+        resultados.extend((tipo, id, nome) for id, nome in sessao.execute(consulta))
+    return resultados[:limite]
+
+def buscar_catalogo(termo, limite=20):
+    """Busca músicas, álbuns e artistas pelo nome, do mais relevante para o menos relevante."""
+    palavras = re.sub(r'[+\-<>()~*"@]', ' ', termo).split()
+    if not palavras:
+        return []
+    modo = preparar_busca()
+
+    if modo == 'fts5':
+        # Cada palavra vira um prefixo entre aspas ("palavra"*); todas precisam aparecer
+        consulta = ' '.join(f'"{palavra}"*' for palavra in palavras)
+        linhas = sessao.execute(text(
+            "SELECT rowid, nome FROM busca_catalogo WHERE busca_catalogo MATCH :consulta ORDER BY rank LIMIT :limite"
+        ), {'consulta': consulta, 'limite': limite})
+        return [(TIPOS_BUSCA[rowid % len(TIPOS_BUSCA)][0], rowid // len(TIPOS_BUSCA), nome) for rowid, nome in linhas]
+
+    if modo == 'fulltext':
+        consulta = ' '.join(f'+{palavra}*' for palavra in palavras)
+        partes = [
+            f"SELECT '{tipo}' AS tipo, id, nome, MATCH(nome) AGAINST (:consulta IN BOOLEAN MODE) AS relevancia "
+            f"FROM {modelo.__tablename__} WHERE MATCH(nome) AGAINST (:consulta IN BOOLEAN MODE)"
+            for tipo, modelo in TIPOS_BUSCA
+        ]
+        linhas = sessao.execute(
+            text(' UNION ALL '.join(partes) + ' ORDER BY relevancia DESC LIMIT :limite'),
+            {'consulta': consulta, 'limite': limite},
+        )
+        return [(tipo, id, nome) for tipo, id, nome, _ in linhas]
+
+    return buscar_por_like(termo, limite)
+
+@acao_de_menu
+@leitura
+def buscar_no_catalogo():
+    termo = input("Digite o termo da busca: ").strip()
+    if not termo:
+        print("Busca cancelada.")
+        return
+    resultados = buscar_catalogo(termo)
+    if not resultados:
+        print(f"Nenhum resultado para '{termo}'.")
+        return
+    print(f"Resultados para '{termo}':")
+    for tipo, id, nome in resultados:
+        print(f" - [{tipo}] {nome} (ID: {id})")
+
+#CRUD(UPDATE)
+@acao_de_menu
+def atualizar_musica():
+    ler_musicas()  # Mostra as músicas cadastradas
+    try:
+        musica_id = int(input("Digite o ID da música que deseja atualizar: "))
+        musica = sessao.query(Musica).filter_by(id=musica_id).first()
+    except ValueError:
+        print("ID inválido. Por favor, insira um número inteiro.")
+        return
+    
+    if musica:
+        novos_dados = {}
+        novo_nome = input("Digite o novo nome da música (deixe em branco para não alterar): ")
+        if novo_nome:
+            novos_dados['nome'] = novo_nome
+        
+        while True:
+            nova_duracao_input = input("Digite a nova duração da música em segundos (deixe em branco para não alterar): ")
+            if nova_duracao_input:
+                try:
+                    nova_duracao = int(nova_duracao_input)
+                    if nova_duracao < 0:
+                        print("A duração não pode ser negativa. Por favor, insira um valor válido.")
+                        continue
+                    novos_dados['duracao'] = nova_duracao
+                except ValueError:
+                    print("Formato inválido. Por favor, insira um número inteiro para a duração.")
+                    continue
+                break
+            else:
+                break
+
+        escrever('atualizar', entidade='musica', id=musica.id, dados=novos_dados).result()
+        print(f"Música atualizada com sucesso!")
+    else:
+        print("Música não encontrada.")
+
+
+
+@acao_de_menu
+def atualizar_playlist():
+    ler_playlists()  # Mostra as playlists cadastradas
+    try:
+        playlist_id = int(input("Digite o ID da playlist que deseja atualizar: "))
+        playlist = sessao.query(Playlist).filter_by(id=playlist_id).first()
     except ValueError:
         print("ID inválido. Por favor, insira um número inteiro.")
         return
@@ -453,14 +1954,60 @@ def atualizar_playlist():
     if playlist:
         novo_nome = input("Digite o novo nome da playlist (deixe em branco para não alterar): ")
         if novo_nome:
-            playlist.nome = novo_nome
+            escrever('atualizar', entidade='playlist', id=playlist.id, dados={'nome': novo_nome}).result()
 
-        sessao.commit()
         print(f"Playlist atualizada com sucesso!")
     else:
         print("Playlist não encontrada.")
 
 
+@acao_de_menu
+def reordenar_musica_da_playlist():
+    ler_playlists()  # Mostra as playlists cadastradas
+    try:
+        playlist_id = int(input("Digite o ID da playlist: "))
+        playlist = sessao.query(Playlist).filter_by(id=playlist_id).first()
+    except ValueError:
+        print("ID inválido. Por favor, insira um número inteiro.")
+        return
+
+    if not playlist:
+        print("Playlist não encontrada.")
+        return
+
+    entradas = sessao.execute(
+        select(Musica.id, Musica.nome)
+        .join(PlaylistMusica, PlaylistMusica.fk_id_musica == Musica.id)
+        .where(PlaylistMusica.fk_id_playlist == playlist.id)
+        .order_by(PlaylistMusica.posicao, PlaylistMusica.id)
+        .execution_options(yield_per=TAMANHO_LOTE_LEITURA)
+    )
+    vazia = True
+    for faixa, (musica_id, musica_nome) in enumerate(entradas, start=1):
+        if vazia:
+            print("Músicas nesta playlist:")
+            vazia = False
+        print(f" {faixa}. {musica_nome} (ID: {musica_id})")
+    if vazia:
+        print("Nenhuma música cadastrada nesta playlist.")
+        return
+
+    try:
+        musica_id = int(input("Digite o ID da música que deseja mover: "))
+        faixa = int(input("Digite a nova posição da música (1 = primeira): "))
+    except ValueError:
+        print("Valor inválido. Por favor, insira um número inteiro.")
+        return
+
+    try:
+        escrever('mover_musica_na_playlist', playlist_id=playlist.id, musica_id=musica_id, faixa=faixa).result()
+    except ValueError as erro:
+        print(erro)
+        return
+    print(f"Música movida para a posição {faixa} da playlist '{playlist.nome}' com sucesso!")
+
+
+@acao_de_menu
 def atualizar_album():
     ler_albuns()  # Mostra os álbuns cadastrados
     try:
@@ -471,27 +2018,29 @@ def atualizar_album():
         return
     
     if album:
+        novos_dados = {}
         novo_nome = input("Digite o novo nome do álbum (deixe em branco para não alterar): ")
         if novo_nome:
-            album.nome = novo_nome
+            novos_dados['nome'] = novo_nome
         
         while True:
             data_lancamento_input = input("Digite a nova data de lançamento do álbum (DD-MM-AAAA) ou deixe em branco para não alterar: ")
             if data_lancamento_input:
                 try:
-                    album.data_lancamento = datetime.strptime(data_lancamento_input, "%d-%m-%Y").date()
+                    novos_dados['data_lancamento'] = datetime.strptime(data_lancamento_input, "%d-%m-%Y").date()
                     break
                 except ValueError:
                     print("Formato inválido. Por favor, insira a data no formato DD-MM-AAAA.")
             else:
                 break
 
-        sessao.commit()
+        escrever('atualizar', entidade='album', id=album.id, dados=novos_dados).result()
         print(f"Álbum atualizado com sucesso!")
     else:
         print("Álbum não encontrado.")
 
 
+@acao_de_menu
 def atualizar_artista():
     ler_artistas()  # Mostra os artistas cadastrados
     try:
@@ -502,20 +2051,22 @@ def atualizar_artista():
         return
     
     if artista:
+        novos_dados = {}
         novo_nome = input("Digite o novo nome do artista (deixe em branco para não alterar): ")
         if novo_nome:
-            artista.nome = novo_nome
+            novos_dados['nome'] = novo_nome
         
         novo_pais = input("Digite o novo país de origem do artista (deixe em branco para não alterar): ")
         if novo_pais:
-            artista.pais_origem = novo_pais
+            novos_dados['pais_origem'] = novo_pais
 
-        sessao.commit()
+        escrever('atualizar', entidade='artista', id=artista.id, dados=novos_dados).result()
         print(f"Artista atualizado com sucesso!")
     else:
         print("Artista não encontrado.")
 
 
+@acao_de_menu
 def atualizar_cliente_detalhes():
     ler_clientes()  # Mostra os clientes cadastrados
     try:
@@ -536,28 +2087,28 @@ def atualizar_cliente_detalhes():
         
         if opcao == '1':
             novo_nome = input("Digite o novo nome do cliente: ")
-            cliente.nome = novo_nome
+            escrever('atualizar', entidade='cliente', id=cliente.id, dados={'nome': novo_nome}).result()
             
         elif opcao == '2':
             novo_email = input("Digite o novo email do cliente: ")
-            cliente.email = novo_email
+            escrever('atualizar', entidade='cliente', id=cliente.id, dados={'email': novo_email}).result()
             
         elif opcao == '3':
             while True:
                 data_nasc_input = input("Digite a nova data de nascimento do cliente (DD-MM-AAAA): ")
                 try:
                     data_nasc = datetime.strptime(data_nasc_input, "%d-%m-%Y").date()
-                    cliente.data_nasc = data_nasc
                     break
                 except ValueError:
                     print("Formato inválido. Por favor, insira a data no formato DD-MM-AAAA.")
+            escrever('atualizar', entidade='cliente', id=cliente.id, dados={'data_nasc': data_nasc}).result()
         
-        sessao.commit()
         print(f"Detalhes do cliente '{cliente.nome}' atualizados com sucesso!")
     else:
         print("Cliente não encontrado.")
 
 
+@acao_de_menu
 def atualizar_genero():
     ler_generos()  # Mostra os gêneros cadastrados
     try:
@@ -570,14 +2121,39 @@ def atualizar_genero():
     if genero:
         novo_nome = input("Digite o novo nome do gênero (deixe em branco para não alterar): ")
         if novo_nome:
-            genero.nome = novo_nome
+            escrever('atualizar', entidade='genero', id=genero.id, dados={'nome': novo_nome}).result()
 
-        sessao.commit()
         print(f"Gênero atualizado com sucesso!")
     else:
         print("Gênero não encontrado.")
 
 # CRUD(DELETE)
+def mostrar_progresso(contagem):
+    """Cria a função de progresso de apagar_em_cascata, que mostra numa linha só quanto de cada etapa já foi apagado."""
+    totais = dict(contagem)
+
+    def progresso(descricao, apagadas):
+        total = max(totais[descricao], apagadas)
+        print(f"\rApagando {descricao}: {apagadas}/{total}", end="\n" if apagadas == total else "", flush=True)
+    return progresso
+
+def apagar_com_confirmacao(modelo, registro, rotulo):
+    """Mostra o que será apagado junto com o registro e, se confirmado, apaga em lotes mostrando o progresso."""
+    contagem = contar_exclusao(sessao, modelo, registro.id)
+    print(f"Junto com {rotulo} '{registro.nome}' serão apagados:")
+    for descricao, linhas in contagem[:-1]:
+        print(f" - {linhas} {descricao}")
+    if input("Confirmar? (1. Sim / 2. Não): ").strip() != '1':
+        print("Operação cancelada.")
+        return False
+    # O DELETE apaga o registro sem passar pelo ORM; desligado da sessão, o nome dele ainda pode ser lido
+    sessao.expunge(registro)
+    # Não passa por escrever(): a cascata pode apagar milhões de linhas e confirma lote a lote, para não segurar
+    # bloqueios numa transação longa, o que não cabe numa operação única de um grupo da escrita agrupada
+    apagar_em_cascata(sessao, modelo, registro.id, confirmar_lotes=True, progresso=mostrar_progresso(contagem))
+    return True
+
+@acao_de_menu
 def apagar_cliente():
     while True:
         ler_clientes()  # Mostra os clientes cadastrados
@@ -589,14 +2165,14 @@ def apagar_cliente():
             break
         
         if cliente:
-            sessao.delete(cliente)
-            sessao.commit()
-            print(f"Cliente '{cliente.nome}' apagado com sucesso!")
+            if apagar_com_confirmacao(Cliente, cliente, "o cliente"):
+                print(f"Cliente '{cliente.nome}' apagado com sucesso!")
             break
         else:
             print("Cliente não encontrado. Tente novamente.")
 
 
+@acao_de_menu
 def apagar_playlist():
     while True:
         ler_playlists()  # Mostra as playlists cadastradas
@@ -608,14 +2184,15 @@ def apagar_playlist():
             break
         
         if playlist:
-            sessao.delete(playlist)
-            sessao.commit()
-            print(f"Playlist '{playlist.nome}' apagada com sucesso!")
+            nome = playlist.nome
+            escrever('apagar', entidade='playlist', id=playlist.id).result()
+            print(f"Playlist '{nome}' apagada com sucesso!")
             break
         else:
             print("Playlist não encontrada. Tente novamente.")
 
 
+@acao_de_menu
 def apagar_musica():
     while True:
         ler_musicas()  # Mostra as músicas cadastradas
@@ -627,14 +2204,57 @@ def apagar_musica():
             break
         
         if musica:
-            sessao.delete(musica)
-            sessao.commit()
-            print(f"Música '{musica.nome}' apagada com sucesso!")
+            nome = musica.nome
+            escrever('apagar', entidade='musica', id=musica.id).result()
+            print(f"Música '{nome}' apagada com sucesso!")
             break
         else:
             print("Música não encontrada. Tente novamente.")
 
 
+@acao_de_menu
+def remover_musica_da_playlist():
+    ler_playlists()  # Mostra as playlists cadastradas
+    try:
+        playlist_id = int(input("Digite o ID da playlist: "))
+        playlist = sessao.query(Playlist).filter_by(id=playlist_id).first()
+    except ValueError:
+        print("ID inválido. Por favor, insira um número inteiro.")
+        return
+
+    if not playlist:
+        print("Playlist não encontrada.")
+        return
+
+    entradas = sessao.execute(
+        select(PlaylistMusica.id, Musica.id, Musica.nome)
+        .join(Musica, Musica.id == PlaylistMusica.fk_id_musica)
+        .where(PlaylistMusica.fk_id_playlist == playlist.id)
+        .order_by(PlaylistMusica.posicao, PlaylistMusica.id)
+    ).all()
+    if not entradas:
+        print("Nenhuma música cadastrada nesta playlist.")
+        return
+    print("Músicas nesta playlist:")
+    for _, musica_id, musica_nome in entradas:
+        print(f" - {musica_nome} (ID: {musica_id})")
+
+    try:
+        musica_id = int(input("Digite o ID da música que deseja remover da playlist: "))
+    except ValueError:
+        print("ID inválido. Por favor, insira um número inteiro.")
+        return
+
+    try:
+        escrever('remover_musica_da_playlist', playlist_id=playlist.id, musica_id=musica_id).result()
+    except ValueError as erro:
+        print(erro)
+        return
+    musica_nome = next(nome for _, id, nome in entradas if id == musica_id)
+    print(f"Música '{musica_nome}' removida da playlist '{playlist.nome}' com sucesso!")
+
+
+@acao_de_menu
 def apagar_album():
     while True:
         ler_albuns()  # Mostra os álbuns cadastrados
@@ -646,15 +2266,15 @@ def apagar_album():
             break
         
         if album:
-            sessao.delete(album)
-            sessao.commit()
-            print(f"Álbum '{album.nome}' apagado com sucesso!")
+            if apagar_com_confirmacao(Album, album, "o álbum"):
+                print(f"Álbum '{album.nome}' apagado com sucesso!")
             break
         else:
             print("Álbum não encontrado. Tente novamente.")
 
 
 
+@acao_de_menu
 def apagar_artista():
     while True:
         ler_artistas()  # Mostra os artistas cadastrados
@@ -666,14 +2286,14 @@ def apagar_artista():
             break
         
         if artista:
-            sessao.delete(artista)
-            sessao.commit()
-            print(f"Artista '{artista.nome}' apagado com sucesso!")
+            if apagar_com_confirmacao(Artista, artista, "o artista"):
+                print(f"Artista '{artista.nome}' apagado com sucesso!")
             break
         else:
             print("Artista não encontrado. Tente novamente.")
 
 
+@acao_de_menu
 def apagar_genero():
     while True:
         ler_generos()  # Mostra os gêneros cadastrados
@@ -685,14 +2305,15 @@ def apagar_genero():
             break
         
         if genero:
-            sessao.delete(genero)
-            sessao.commit()
-            print(f"Gênero '{genero.nome}' apagado com sucesso!")
+            nome = genero.nome
+            escrever('apagar', entidade='genero', id=genero.id).result()
+            print(f"Gênero '{nome}' apagado com sucesso!")
             break
         else:
             print("Gênero não encontrado. Tente novamente.")
 
 
+@acao_de_menu
 def apagar_single():
     while True:
         ler_singles()  # Mostra os singles cadastrados
@@ -704,14 +2325,15 @@ def apagar_single():
             break
         
         if single:
-            sessao.delete(single)
-            sessao.commit()
-            print(f"Single '{single.nome}' apagada com sucesso!")
+            nome = single.nome
+            escrever('apagar', entidade='single', id=single.id).result()
+            print(f"Single '{nome}' apagada com sucesso!")
             break
         else:
             print("Single não encontrada. Tente novamente.")
 
 
+@acao_de_menu
 def deletar_banco_de_dados():
     while True:
         print(f"Você tem certeza que deseja deletar o banco de dados '{nome_do_banco}'?")
@@ -733,6 +2355,7 @@ def deletar_banco_de_dados():
         else:
             print("Opção inválida. Por favor, escolha '1' para sim ou '2' para não.")
 
+@menu
 def menu_criacao():
     while True:
         print("\nMenu de Criação: ", end="")
@@ -753,10 +2376,11 @@ def menu_criacao():
         else:
             print("Opção inválida. Por favor, escolha uma opção válida.")
 
+@menu
 def menu_leitura():
     while True:
         print("\nMenu de Leitura: ", end="")
-        print("1. Ler Clientes | 2. Ler Playlists | 3. Ler Músicas | 4. Ler Álbuns | 5. Ler Artistas | 6. Ler Singles | 7. Ler Gêneros Musicais | 8. Ler Playlists e suas Músicas | 9. Voltar")
+        print("1. Ler Clientes | 2. Ler Playlists | 3. Ler Músicas | 4. Ler Álbuns | 5. Ler Artistas | 6. Ler Singles | 7. Ler Gêneros Musicais | 8. Ler Playlists e suas Músicas | 9. Configurar Listagem | 10. Estatísticas do Cache | 11. Buscar no Catálogo | 12. Faixas de uma Playlist | 13. Resumo de uma Playlist | 14. Perfil de um Cliente | 15. Músicas Parecidas | 16. Voltar")
         
         opcao = input(" Escolha uma opção: ")
 
@@ -777,14 +2401,29 @@ def menu_leitura():
         elif opcao == '8':
             ler_playlists_e_musicas()
         elif opcao == '9':
+            configurar_listagem()
+        elif opcao == '10':
+            mostrar_estatisticas_cache()
+        elif opcao == '11':
+            buscar_no_catalogo()
+        elif opcao == '12':
+            ler_faixas_da_playlist()
+        elif opcao == '13':
+            ler_resumo_da_playlist()
+        elif opcao == '14':
+            ler_perfil_do_cliente()
+        elif opcao == '15':
+            ler_musicas_similares()
+        elif opcao == '16':
             break
         else:
             print("Opção inválida. Por favor, escolha uma opção válida.")
 
+@menu
 def menu_atualizacao():
     while True:
         print("\nMenu de Atualização: ", end="")
-        print("1. Atualizar Dados do Álbum | 2. Atualizar Dados do Artista | 3. Atualizar Cliente | 4. Atualizar Gênero Musical | 5. Atualizar Dados da Música | 6. Voltar")
+        print("1. Atualizar Dados do Álbum | 2. Atualizar Dados do Artista | 3. Atualizar Cliente | 4. Atualizar Gênero Musical | 5. Atualizar Dados da Música | 6. Reordenar Música da Playlist | 7. Voltar")
         
         opcao = input(" Escolha uma opção: ")
 
@@ -799,14 +2438,17 @@ def menu_atualizacao():
         elif opcao == '5':
             atualizar_musica()
         elif opcao == '6':
+            reordenar_musica_da_playlist()
+        elif opcao == '7':
             break
         else:
             print("Opção inválida. Por favor, escolha uma opção válida.")
 
+@menu
 def menu_delecao():
     while True:
         print("\nMenu de Deleção: ", end="")
-        print("1. Deletar Cliente | 2. Deletar Artista | 3. Deletar Álbum | 4. Deletar Gênero | 5. Deletar Playlist | 6. Deletar Música | 7. Deletar Single | 8. Deletar Banco de Dados | 9. Voltar")
+        print("1. Deletar Cliente | 2. Deletar Artista | 3. Deletar Álbum | 4. Deletar Gênero | 5. Deletar Playlist | 6. Deletar Música | 7. Deletar Single | 8. Remover Música de Playlist | 9. Deletar Banco de Dados | 10. Voltar")
         
         opcao = input(" Escolha uma opção: ")
 
@@ -825,13 +2467,16 @@ def menu_delecao():
         elif opcao == '7':
             apagar_single()
         elif opcao == '8':
+            remover_musica_da_playlist()
+        elif opcao == '9':
             deletar_banco_de_dados()
             exit()
-        elif opcao == '9':
+        elif opcao == '10':
             break
         else:
             print("Opção inválida. Por favor, escolha uma opção válida.")
 
+@menu
 def menu_principal():
     while True:
         print("\nMenu Principal: ", end="")
@@ -852,9 +2497,1997 @@ def menu_principal():
         else:
             print("Opção inválida. Por favor, escolha uma opção válida.")
 
-# Executando o menu principal
-menu_principal()
+# IMPORTAÇÃO EM LOTE
+def converter_data(texto):
+    """Converte uma data DD-MM-AAAA ou AAAA-MM-DD; retorna None se estiver vazia."""
+    texto = (texto or '').strip()
+    if not texto:
+        return None
+    for formato in ("%d-%m-%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Data inválida: '{texto}'. Use DD-MM-AAAA ou AAAA-MM-DD.")
+
+def ler_linhas_catalogo(caminho):
+    """Lê o arquivo do catálogo (CSV ou JSONL) linha a linha, sem carregá-lo inteiro."""
+    import csv
+    import json
+
+    with open(caminho, encoding='utf-8', newline='') as arquivo:
+        if caminho.lower().endswith(('.jsonl', '.json')):
+            for linha in arquivo:
+                if linha.strip():
+                    yield json.loads(linha)
+        else:
+            yield from csv.DictReader(arquivo)
+
+def resolver_ids(modelo, colunas_chave, novos, mapa):
+    """Preenche o mapa chave -> id para as chaves de `novos`, criando em lote as que não existem.
+
+    `novos` associa cada chave (tupla com os valores de `colunas_chave`) aos valores
+    da linha que será inserida caso ela ainda não exista no banco.
+    """
+    pendentes = {chave: valores for chave, valores in novos.items() if chave not in mapa}
+    if not pendentes:
+        return
+    colunas = [getattr(modelo, coluna) for coluna in colunas_chave]
+
+    def buscar_existentes():
+        consulta = (
+            select(modelo.id, *colunas)
+            .where(colunas[0].in_({chave[0] for chave in pendentes}))
+            .order_by(modelo.id)
+        )
+        for linha in sessao.execute(consulta):
+            chave = tuple(linha[1:])
+            if chave in pendentes:
+                mapa.setdefault(chave, linha[0])
+
+    buscar_existentes()
+    faltando = [valores for chave, valores in pendentes.items() if chave not in mapa]
+    if faltando:
+        sessao.execute(insert(modelo), faltando)
+        buscar_existentes()
+
+def importar_lote(linhas, mapas):
+    """Importa um lote de linhas do catálogo numa única transação. Retorna quantas músicas foram inseridas."""
+    artistas = {}
+    generos = {}
+    for linha in linhas:
+        if linha['artista']:
+            artistas[(linha['artista'],)] = {'nome': linha['artista'], 'pais_origem': linha['pais_origem']}
+        generos[(linha['genero'],)] = {'nome': linha['genero']}
+    resolver_ids(Artista, ('nome',), artistas, mapas['artistas'])
+    resolver_ids(Genero, ('nome',), generos, mapas['generos'])
+
+    albuns = {}
+    singles = {}
+    for linha in linhas:
+        if linha['album']:
+            artista_id = mapas['artistas'].get((linha['artista'],))
+            albuns[(linha['album'], artista_id)] = {
+                'nome': linha['album'], 'fk_id_artista': artista_id, 'data_lancamento': linha['data_lancamento'],
+            }
+        else:
+            singles[(linha['nome'], linha['data_lancamento'])] = {
+                'nome': linha['nome'], 'data_lancamento': linha['data_lancamento'],
+            }
+    resolver_ids(Album, ('nome', 'fk_id_artista'), albuns, mapas['albuns'])
+    resolver_ids(Single, ('nome', 'data_lancamento'), singles, mapas['singles'])
+
+    musicas = {}
+    for linha in linhas:
+        if linha['album']:
+            album_id = mapas['albuns'][(linha['album'], mapas['artistas'].get((linha['artista'],)))]
+            single_id = None
+        else:
+            album_id = None
+            single_id = mapas['singles'][(linha['nome'], linha['data_lancamento'])]
+        musicas[(linha['nome'], album_id, single_id)] = {
+            'nome': linha['nome'], 'duracao': linha['duracao'],
+            'fk_id_genero': mapas['generos'][(linha['genero'],)],
+            'fk_id_album': album_id, 'fk_id_single': single_id,
+        }
+
+    # Músicas já importadas (mesmo nome no mesmo álbum ou single) são ignoradas, o que torna a importação repetível
+    existentes = {tuple(linha) for linha in sessao.execute(
+        select(Musica.nome, Musica.fk_id_album, Musica.fk_id_single)
+        .where(Musica.nome.in_({chave[0] for chave in musicas}))
+    )}
+    novas = [valores for chave, valores in musicas.items() if chave not in existentes]
+    if novas:
+        sessao.execute(insert(Musica), novas)
+    sessao.commit()
+    return len(novas)
+
+def importar_catalogo(argumentos):
+    """Importa músicas, artistas, gêneros, álbuns e singles de um arquivo CSV ou JSONL."""
+    if not argumentos:
+        print("Uso: importar-catalogo <arquivo.csv|arquivo.jsonl> [tamanho do lote]")
+        return
+    caminho = argumentos[0]
+    tamanho_lote = int(argumentos[1]) if len(argumentos) > 1 else 5000
+
+    # Mapas nome -> id mantidos durante toda a importação, para não consultar o banco de novo
+    mapas = {'artistas': {}, 'generos': {}, 'albuns': {}, 'singles': {}}
+    lidas = inseridas = invalidas = 0
+    lote = []
+    inicio = time.perf_counter()
+
+    def processar_lote():
+        nonlocal inseridas
+        inseridas += importar_lote(lote, mapas)
+        lote.clear()
+        decorrido = time.perf_counter() - inicio
+        print(f"{lidas} linhas lidas, {inseridas} músicas inseridas ({lidas / decorrido:.0f} linhas/s)")
+
+    for numero, registro in enumerate(ler_linhas_catalogo(caminho), start=1):
+        try:
+            linha = {
+                'nome': (registro.get('nome') or '').strip(),
+                'duracao': int(registro.get('duracao') or 0),
+                'artista': (registro.get('artista') or '').strip(),
+                'pais_origem': (registro.get('pais_origem') or '').strip() or None,
+                'genero': (registro.get('genero') or '').strip(),
+                'album': (registro.get('album') or '').strip(),
+                'data_lancamento': converter_data(registro.get('data_lancamento')),
+            }
+            if not linha['nome'] or not linha['genero']:
+                raise ValueError("nome e gênero são obrigatórios")
+            if linha['duracao'] < 0:
+                raise ValueError("a duração não pode ser negativa")
+        except ValueError as erro:
+            invalidas += 1
+            print(f"Linha {numero} ignorada: {erro}")
+            continue
+        lidas += 1
+        lote.append(linha)
+        if len(lote) >= tamanho_lote:
+            processar_lote()
+    if lote:
+        processar_lote()
+
+    decorrido = time.perf_counter() - inicio
+    print(f"Importação concluída em {decorrido:.2f}s: {lidas} linhas válidas, {inseridas} músicas inseridas, "
+          f"{lidas - inseridas} já existentes ou repetidas, {invalidas} inválidas "
+          f"({lidas / decorrido if decorrido else 0:.0f} linhas/s).")
+
+# EXECUÇÃO EM LOTE
+OPERACOES_LOTE = {
+    'criar_cliente': servico_criar_cliente,
+    'criar_playlist': servico_criar_playlist,
+    'criar_artista': servico_criar_artista,
+    'criar_genero': servico_criar_genero,
+    'criar_album': servico_criar_album,
+    'criar_single': servico_criar_single,
+    'adicionar_musica': servico_adicionar_musica,
+    'adicionar_musica_a_playlist': servico_adicionar_musica_a_playlist,
+    'adicionar_musicas_a_playlist': servico_adicionar_musicas_a_playlist,
+    'remover_musica_da_playlist': servico_remover_musica_da_playlist,
+    'mover_musica_na_playlist': servico_mover_musica_na_playlist,
+    'atualizar': lambda sessao, entidade, id, dados: servico_atualizar(sessao, buscar_entidade(entidade), id, dados),
+    'apagar': lambda sessao, entidade, id: servico_apagar(sessao, buscar_entidade(entidade), id),
+}
+
+def buscar_entidade(nome):
+    if nome not in ENTIDADES:
+        raise ValueError(f"Entidade desconhecida: '{nome}'. Use uma de: {', '.join(ENTIDADES)}.")
+    return ENTIDADES[nome]
+
+def converter_datas(parametros):
+    """Converte os campos data_* (também dentro de 'dados') de texto para date."""
+    convertidos = {}
+    for campo, valor in parametros.items():
+        if campo.startswith('data_') and isinstance(valor, str):
+            valor = converter_data(valor)
+        elif campo == 'dados' and isinstance(valor, dict):
+            valor = converter_datas(valor)
+        convertidos[campo] = valor
+    return convertidos
+
+def aplicar_operacao(registro):
+    parametros = dict(registro)
+    nome = parametros.pop('operacao', None)
+    if nome not in OPERACOES_LOTE:
+        raise ValueError(f"Operação desconhecida: '{nome}'.")
+    return OPERACOES_LOTE[nome](sessao, **converter_datas(parametros))
+
+def executar_operacoes(operacoes, resultados=None):
+    """Executa as operações numa única transação. Retorna a lista de (linha, erro) das que falharam.
+
+    Operações com dados inválidos são ignoradas sem afetar as demais. Se o banco recusar alguma
+    operação (ex.: chave duplicada), o lote é desfeito e refeito uma operação por vez para isolá-la.
+    Com o dicionário `resultados`, guarda nele o retorno do serviço de cada operação aplicada, por linha.
+    """
+    if resultados is None:
+        resultados = {}
+    erros = []
+    try:
+        for numero, registro in operacoes:
+            try:
+                resultados[numero] = aplicar_operacao(registro)
+            except (ValueError, TypeError) as erro:
+                erros.append((numero, erro))
+        sessao.commit()
+        return erros
+    except DBAPIError:
+        sessao.rollback()
+
+    resultados.clear()
+    erros = []
+    for numero, registro in operacoes:
+        try:
+            resultados[numero] = aplicar_operacao(registro)
+            sessao.commit()
+        except (ValueError, TypeError) as erro:
+            erros.append((numero, erro))
+        except DBAPIError as erro:
+            sessao.rollback()
+            resultados.pop(numero, None)
+            erros.append((numero, erro))
+    return erros
+
+def executar_lote(argumentos):
+    """Executa um arquivo JSONL de operações, confirmando uma transação a cada N operações.
+
+    Com BANCO_ESCRITA_AGRUPADA=1, as operações vão para a escrita agrupada do programa, que forma os grupos
+    por BANCO_GRUPO_OPERACOES e BANCO_GRUPO_ESPERA_MS, e N é ignorado.
+    """
+    import json
+    from concurrent.futures import wait
+
+    if not argumentos:
+        print("Uso: executar-lote <arquivo.jsonl> [operações por transação]")
+        print(f"Operações disponíveis: {', '.join(OPERACOES_LOTE)}")
+        return
+    caminho = argumentos[0]
+    tamanho_lote = int(argumentos[1]) if len(argumentos) > 1 else 500
+
+    total = falhas = 0
+    lote = []
+    inicio = time.perf_counter()
+
+    def processar_lote():
+        nonlocal falhas
+        for numero, erro in executar_operacoes(lote):
+            falhas += 1
+            print(f"Linha {numero}: {getattr(erro, 'orig', erro)}")
+        lote.clear()
+
+    # Na escrita agrupada, os erros chegam pelos Futures, na thread de escrita, e são mostrados no final.
+    # Os grupos são confirmados em ordem, então quando o último Future é resolvido todos os outros já foram.
+    erros_agrupados = []
+    ultimo_futuro = None
+
+    def registrar_erro(numero, futuro):
+        if futuro.exception() is not None:
+            erros_agrupados.append((numero, futuro.exception()))
+
+    with open(caminho, encoding='utf-8') as arquivo:
+        for numero, linha in enumerate(arquivo, start=1):
+            if not linha.strip():
+                continue
+            total += 1
+            try:
+                registro = json.loads(linha)
+            except ValueError as erro:
+                falhas += 1
+                print(f"Linha {numero}: JSON inválido ({erro})")
+                continue
+            if ESCRITA_AGRUPADA:
+                try:
+                    parametros = dict(registro)
+                except (TypeError, ValueError) as erro:
+                    falhas += 1
+                    print(f"Linha {numero}: {erro}")
+                    continue
+                ultimo_futuro = escrever(parametros.pop('operacao', None), **parametros)
+                ultimo_futuro.add_done_callback(functools.partial(registrar_erro, numero))
+                continue
+            lote.append((numero, registro))
+            if len(lote) >= tamanho_lote:
+                processar_lote()
+    if lote:
+        processar_lote()
+    if ultimo_futuro is not None:
+        wait([ultimo_futuro])
+        for numero, erro in sorted(erros_agrupados, key=lambda item: item[0]):
+            falhas += 1
+            print(f"Linha {numero}: {getattr(erro, 'orig', erro)}")
+
+    decorrido = time.perf_counter() - inicio
+    print(f"{total} operações em {decorrido:.2f}s ({total / decorrido if decorrido else 0:.0f} operações/s): "
+          f"{total - falhas} aplicadas, {falhas} com erro.")
+
+# ESCRITA AGRUPADA
+# Cada commit custa pelo menos uma gravação forçada em disco (fsync), o que limita a algumas centenas as
+# escritas por segundo quando cada operação é confirmada sozinha. Na escrita agrupada (write-behind), as
+# operações de OPERACOES_LOTE entram numa fila, e uma thread de escrita com sessão própria confirma várias
+# de uma vez, com um commit por grupo. Quem envia recebe um Future, resolvido quando a operação está gravada.
+class EscritaAgrupada:
+    """Fila de operações confirmadas em grupo por uma thread de escrita.
+
+    O grupo é confirmado numa única transação quando junta `tamanho_grupo` operações ou quando a mais antiga
+    espera há `espera` segundos, o que vier primeiro.
+
+    Durabilidade: enviar() retorna um Future assim que a operação entra na fila, e a operação só está gravada
+    quando ele é resolvido. future.result() espera o commit do grupo e retorna o que o serviço da operação
+    retornou (registros do ORM chegam desligados da sessão, com os atributos carregados), ou levanta o erro da operação (dados inválidos
+    ou recusados pelo banco), sem afetar as outras do grupo, como em executar_operacoes(). Até lá, a operação não é vista por nenhuma sessão, nem pela de quem a enviou, e se
+    perde se o processo for morto. esvaziar() confirma já o que foi enviado, e fechar() (chamada também na
+    saída normal do programa, para a escrita criada por escrever()) confirma o que restar e para a thread.
+    `ao_confirmar(quantidade, erros, duracao)` é chamada na thread de escrita depois de cada grupo, antes de
+    os Futures serem resolvidos; `erros` é a lista de (operação, erro) das que falharam.
+    """
+
+    def __init__(self, tamanho_grupo=None, espera=None, ao_confirmar=None):
+        self.tamanho_grupo = tamanho_grupo or TAMANHO_GRUPO_ESCRITA
+        self.espera = ESPERA_GRUPO_ESCRITA if espera is None else espera
+        self.ao_confirmar = ao_confirmar
+        # Quem envia mais rápido do que o banco grava espera, em vez de acumular escritas não gravadas
+        self.limite_fila = self.tamanho_grupo * 4
+        self.fila = []
+        self.em_andamento = []
+        self.urgente = False
+        self.fechada = False
+        self.grupos = 0
+        self.condicao = threading.Condition()
+        self.thread = threading.Thread(target=self.escrever_grupos, name='escrita-agrupada', daemon=True)
+        self.thread.start()
+
+    def enviar(self, operacao, **parametros):
+        """Coloca a operação na fila e retorna o Future dela."""
+        futuro = FuturoDeEscrita()
+        with self.condicao:
+            while len(self.fila) >= self.limite_fila and not self.fechada:
+                self.condicao.wait()
+            if self.fechada:
+                raise RuntimeError("A escrita agrupada já foi fechada.")
+            self.fila.append((time.monotonic(), {'operacao': operacao, **parametros}, futuro))
+            self.condicao.notify_all()
+        return futuro
+
+    def esvaziar(self):
+        """Confirma sem esperar o grupo completar tudo o que já foi enviado, e espera o commit."""
+        from concurrent.futures import wait
+
+        with self.condicao:
+            pendentes = [futuro for _, _, futuro in self.em_andamento + self.fila]
+            self.urgente = True
+            self.condicao.notify_all()
+        wait(pendentes)
+
+    def fechar(self):
+        with self.condicao:
+            self.fechada = True
+            self.condicao.notify_all()
+        self.thread.join()
+
+    def proximo_grupo(self):
+        """Espera um grupo ficar pronto e o tira da fila; retorna [] quando a escrita foi fechada e a fila está vazia."""
+        with self.condicao:
+            while not self.fila and not self.fechada:
+                self.condicao.wait()
+            while 0 < len(self.fila) < self.tamanho_grupo and not (self.urgente or self.fechada):
+                restante = self.fila[0][0] + self.espera - time.monotonic()
+                if restante <= 0:
+                    break
+                self.condicao.wait(restante)
+            self.em_andamento = self.fila[:self.tamanho_grupo]
+            del self.fila[:self.tamanho_grupo]
+            if not self.fila:
+                self.urgente = False
+            self.condicao.notify_all()
+            return self.em_andamento
+
+    def escrever_grupos(self):
+        while True:
+            grupo = self.proximo_grupo()
+            if not grupo:
+                return
+            inicio = time.perf_counter()
+            try:
+                # A sessão global é por thread, então esta thread usa uma sessão só dela; os registros retornados
+                # são lidos por quem enviou depois que ela é fechada, então não expiram no commit
+                sessao().expire_on_commit = False
+                resultados = {}
+                erros = dict(executar_operacoes([(indice, registro) for indice, (_, registro, _) in enumerate(grupo)], resultados))
+            except Exception as erro:
+                sessao.rollback()
+                erros = dict.fromkeys(range(len(grupo)), erro)
+            sessao.remove()
+            self.grupos += 1
+            if self.ao_confirmar is not None:
+                try:
+                    self.ao_confirmar(len(grupo), [(grupo[indice][1], erro) for indice, erro in erros.items()],
+                                      time.perf_counter() - inicio)
+                except Exception as erro:
+                    print(f"Erro em ao_confirmar: {erro}")
+            for indice, (_, _, futuro) in enumerate(grupo):
+                if indice in erros:
+                    futuro.set_exception(erros[indice])
+                else:
+                    futuro.set_result(resultados.get(indice))
+            with self.condicao:
+                self.em_andamento = []
+
+class FuturoDeEscrita(Future):
+    """Future da escrita agrupada que abre a janela de leitura própria na thread que lê o resultado.
+
+    O commit do grupo acontece na thread de escrita, e é nela que o after_commit marca a última escrita; sem
+    isto, a próxima leitura de quem enviou a operação poderia ir para a réplica e não ver o que foi gravado.
+    """
+
+    def result(self, timeout=None):
+        resultado = super().result(timeout)
+        roteamento.ultima_escrita = time.monotonic()
+        return resultado
+
+escrita_agrupada = None
+trava_escrita_agrupada = threading.Lock()
+
+def escrever(operacao, **parametros):
+    """Aplica uma operação de OPERACOES_LOTE e retorna um Future resolvido quando ela estiver gravada.
+
+    Com BANCO_ESCRITA_AGRUPADA=1, a operação vai para a escrita agrupada do programa; sem, é aplicada e
+    confirmada na hora, na sessão de quem chamou, e o Future já volta resolvido. É por aqui que as ações do
+    menu gravam. Nos dois modos a transação da sessão de quem chamou é encerrada, para que as leituras
+    feitas depois do Future resolvido vejam a operação; com a réplica, as leituras só ficam no banco principal
+    se o resultado for lido com future.result() na thread que vai ler.
+    """
+    global escrita_agrupada
+
+    if ESCRITA_AGRUPADA:
+        with trava_escrita_agrupada:
+            if escrita_agrupada is None:
+                import atexit
+
+                escrita_agrupada = EscritaAgrupada()
+                atexit.register(escrita_agrupada.fechar)
+        sessao.commit()
+        return escrita_agrupada.enviar(operacao, **parametros)
+    futuro = Future()
+    resultados = {}
+    erros = executar_operacoes([(0, {'operacao': operacao, **parametros})], resultados)
+    if erros:
+        futuro.set_exception(erros[0][1])
+    else:
+        futuro.set_result(resultados[0])
+    return futuro
+
+# DADOS SINTÉTICOS
+def pesos_zipf(quantidade, expoente=1.1):
+    """Pesos acumulados de uma distribuição de Zipf: o item na posição k tem peso 1/k^expoente."""
+    pesos = []
+    acumulado = 0.0
+    for posicao in range(1, quantidade + 1):
+        acumulado += 1 / posicao ** expoente
+        pesos.append(acumulado)
+    return pesos
+
+def inserir_em_lotes(modelo, gerar_linha, quantidade, tamanho_lote):
+    """Insere `quantidade` linhas geradas por gerar_linha(i), em lotes, e retorna os IDs criados."""
+    # Os IDs são lidos de volta pelo intervalo, então a geração supõe que ninguém mais insere ao mesmo tempo
+    maior_id = sessao.execute(select(func.max(modelo.id))).scalar() or 0
+    lote = []
+    for indice in range(quantidade):
+        lote.append(gerar_linha(indice))
+        if len(lote) >= tamanho_lote:
+            sessao.execute(insert(modelo), lote)
+            sessao.commit()
+            lote = []
+    if lote:
+        sessao.execute(insert(modelo), lote)
+        sessao.commit()
+    return sessao.execute(select(modelo.id).where(modelo.id > maior_id).order_by(modelo.id)).scalars().all()
+
+def gerar_dados(argumentos):
+    """Preenche todas as tabelas com dados sintéticos de distribuição realista."""
+    import random
+
+    if not argumentos:
+        print("Uso: gerar-dados <músicas> [clientes] [semente]")
+        return
+    quantidade_musicas = int(argumentos[0])
+    quantidade_clientes = int(argumentos[1]) if len(argumentos) > 1 else max(1, quantidade_musicas // 10)
+    aleatorio = random.Random(int(argumentos[2]) if len(argumentos) > 2 else 42)
+    tamanho_lote = 5000
+    inicio = time.perf_counter()
+
+    def data_aleatoria(ano_inicial, ano_final):
+        return date(aleatorio.randint(ano_inicial, ano_final), aleatorio.randint(1, 12), aleatorio.randint(1, 28))
+
+    generos = inserir_em_lotes(Genero, lambda i: {'nome': f"Gênero {i + 1}"}, min(60, max(5, quantidade_musicas // 1000)), tamanho_lote)
+    artistas = inserir_em_lotes(Artista, lambda i: {
+        'nome': f"Artista {i + 1}", 'pais_origem': aleatorio.choice(('Brasil', 'Portugal', 'EUA', 'Reino Unido', 'Angola')),
+    }, max(1, quantidade_musicas // 20), tamanho_lote)
+
+    # Poucos artistas têm muitos álbuns e poucos gêneros concentram a maioria das músicas
+    pesos_artistas = pesos_zipf(len(artistas))
+    pesos_generos = pesos_zipf(len(generos))
+    albuns = inserir_em_lotes(Album, lambda i: {
+        'nome': f"Álbum {i + 1}", 'data_lancamento': data_aleatoria(1960, 2024),
+        'fk_id_artista': aleatorio.choices(artistas, cum_weights=pesos_artistas)[0],
+    }, max(1, quantidade_musicas // 10), tamanho_lote)
+    quantidade_singles = quantidade_musicas // 10
+    singles = inserir_em_lotes(Single, lambda i: {
+        'nome': f"Single {i + 1}", 'data_lancamento': data_aleatoria(1960, 2024),
+    }, quantidade_singles, tamanho_lote)
+
+    def gerar_musica(indice):
+        linha = {
+            'nome': f"Música {indice + 1}", 'duracao': int(aleatorio.lognormvariate(5.3, 0.35)),
+            'fk_id_genero': aleatorio.choices(generos, cum_weights=pesos_generos)[0],
+            'fk_id_album': None, 'fk_id_single': None,
+        }
+        if indice < len(singles):
+            linha['fk_id_single'] = singles[indice]
+        else:
+            linha['fk_id_album'] = aleatorio.choice(albuns)
+        return linha
+    musicas = inserir_em_lotes(Musica, gerar_musica, quantidade_musicas, tamanho_lote)
+
+    clientes = inserir_em_lotes(Cliente, lambda i: {
+        'nome': f"Cliente {i + 1}", 'email': f"cliente{i + 1}@email.com", 'data_nasc': data_aleatoria(1950, 2010),
+    }, quantidade_clientes, tamanho_lote)
+
+    # Número de playlists por cliente e de músicas por playlist seguem distribuições de cauda longa (Pareto)
+    maximo_por_playlist = max(1, min(5000, len(musicas) // 2))
+    donos = [cliente for cliente in clientes for _ in range(int(aleatorio.paretovariate(1.5)) - 1)]
+    tamanhos = [min(maximo_por_playlist, int(aleatorio.paretovariate(1.2) * 5)) for _ in donos]
+    playlists = inserir_em_lotes(Playlist, lambda i: {
+        'nome': f"Playlist {i + 1}", 'data_criacao': data_aleatoria(2015, 2024),
+        'quantidade_musicas': tamanhos[i], 'fk_id_cliente': donos[i],
+    }, len(donos), tamanho_lote)
+
+    # A popularidade das músicas segue Zipf sobre uma ordem embaralhada, para não favorecer os menores IDs
+    populares = list(musicas)
+    aleatorio.shuffle(populares)
+    pesos_musicas = pesos_zipf(len(populares))
+    entradas = 0
+    lote = []
+    for playlist_id, tamanho in zip(playlists, tamanhos):
+        escolhidas = set()
+        while len(escolhidas) < tamanho:
+            escolhidas.update(aleatorio.choices(populares, cum_weights=pesos_musicas, k=tamanho - len(escolhidas)))
+        lote.extend(
+            {'fk_id_playlist': playlist_id, 'fk_id_musica': musica_id, 'posicao': (indice + 1) * ESPACO_POSICAO}
+            for indice, musica_id in enumerate(escolhidas)
+        )
+        if len(lote) >= tamanho_lote:
+            sessao.execute(insert(PlaylistMusica), lote)
+            sessao.commit()
+            entradas += len(lote)
+            lote = []
+    if lote:
+        sessao.execute(insert(PlaylistMusica), lote)
+        sessao.commit()
+        entradas += len(lote)
+
+    reconstruir_resumos_playlists(sessao)
+    reconstruir_perfis_clientes(sessao)
+    sessao.commit()
+
+    print(f"Dados gerados em {time.perf_counter() - inicio:.1f}s: {len(generos)} gêneros, {len(artistas)} artistas, "
+          f"{len(albuns)} álbuns, {len(singles)} singles, {len(musicas)} músicas, {len(clientes)} clientes, "
+          f"{len(playlists)} playlists, {entradas} músicas em playlists.")
+
+# MANUTENÇÃO
+def reconciliar_contadores(argumentos):
+    """Recalcula o contador de músicas de todas as playlists com um único GROUP BY."""
+    tamanho_lote = int(argumentos[0]) if argumentos else 1000
+    inicio = time.perf_counter()
+
+    # Só as playlists cujo contador diverge da contagem real são atualizadas
+    quantidade_atual = func.coalesce(Playlist.quantidade_musicas, 0)
+    contagem_real = func.count(PlaylistMusica.id)
+    divergentes = sessao.execute(
+        select(Playlist.id, contagem_real - quantidade_atual)
+        .outerjoin(PlaylistMusica, PlaylistMusica.fk_id_playlist == Playlist.id)
+        .group_by(Playlist.id, Playlist.quantidade_musicas)
+        .having(contagem_real != quantidade_atual)
+    ).all()
+    sessao.commit()
+
+    # A correção é aplicada como diferença, e não como valor absoluto, para não desfazer
+    # incrementos atômicos feitos por outros processos depois da contagem.
+    tabela = Playlist.__table__
+    corrigir = (
+        update(tabela)
+        .where(tabela.c.id == bindparam('playlist_id'))
+        .values(quantidade_musicas=func.coalesce(tabela.c.quantidade_musicas, 0) + bindparam('diferenca'))
+    )
+    for posicao in range(0, len(divergentes), tamanho_lote):
+        lote = divergentes[posicao:posicao + tamanho_lote]
+        sessao.execute(corrigir, [{'playlist_id': playlist_id, 'diferenca': diferenca} for playlist_id, diferenca in lote])
+        sessao.commit()
+
+    print(f"{len(divergentes)} playlist(s) com contador corrigido em {time.perf_counter() - inicio:.2f}s.")
+
+def reconstruir_resumos(argumentos):
+    """Recalcula os resumos de todas as playlists a partir das músicas, numa transação."""
+    inicio = time.perf_counter()
+    reconstruir_resumos_playlists(sessao)
+    sessao.commit()
+    quantidade = sessao.execute(select(func.count()).select_from(ResumoPlaylist)).scalar()
+    print(f"Resumos de {quantidade} playlist(s) reconstruídos em {time.perf_counter() - inicio:.2f}s.")
+
+def iniciar_processo_perfis():
+    """Descarta, no processo filho, as conexões herdadas do processo pai."""
+    engine.dispose(close=False)
+
+def reconstruir_perfis_faixa(faixa):
+    primeiro, ultimo = faixa
+    with Sessao() as sessao_faixa:
+        reconstruir_perfis_clientes(sessao_faixa, primeiro, ultimo)
+        sessao_faixa.commit()
+
+def reconstruir_perfis(argumentos):
+    """Recalcula os perfis de todos os clientes em lotes de clientes, distribuídos entre processos."""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    tamanho_lote = int(argumentos[0]) if len(argumentos) > 0 else 1000
+    processos = int(argumentos[1]) if len(argumentos) > 1 else (os.cpu_count() or 1)
+    menor, maior = sessao.execute(select(func.min(Cliente.id), func.max(Cliente.id))).one()
+    sessao.commit()
+    if menor is None:
+        print("Nenhum cliente cadastrado.")
+        return
+    faixas = [(primeiro, min(primeiro + tamanho_lote - 1, maior)) for primeiro in range(menor, maior + 1, tamanho_lote)]
+    inicio = time.perf_counter()
+
+    # Os processos são criados com fork para herdarem as funções deste script, que não pode ser reimportado;
+    # onde não há fork, os lotes são executados neste processo mesmo
+    if processos > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        with ProcessPoolExecutor(max_workers=processos, mp_context=multiprocessing.get_context('fork'),
+                                 initializer=iniciar_processo_perfis) as executor:
+            for concluidos, _ in enumerate(executor.map(reconstruir_perfis_faixa, faixas), start=1):
+                print(f"\r{concluidos}/{len(faixas)} lotes de clientes", end="", flush=True)
+    else:
+        processos = 1
+        for concluidos, faixa in enumerate(faixas, start=1):
+            reconstruir_perfis_faixa(faixa)
+            print(f"\r{concluidos}/{len(faixas)} lotes de clientes", end="", flush=True)
+
+    linhas = sessao.execute(select(func.count()).select_from(PerfilCliente)).scalar()
+    print(f"\nPerfis reconstruídos em {time.perf_counter() - inicio:.2f}s com {processos} processo(s): {linhas} linhas.")
+
+def indices_faltando(inspetor, tabela):
+    """Retorna os índices declarados no modelo que não existem no banco e as chaves estrangeiras sem índice."""
+    existentes = {tuple(indice['column_names']) for indice in inspetor.get_indexes(tabela.name)}
+    existentes |= {tuple(restricao['column_names']) for restricao in inspetor.get_unique_constraints(tabela.name)}
+    existentes.add(tuple(inspetor.get_pk_constraint(tabela.name)['constrained_columns']))
+
+    declarados = [indice for indice in tabela.indexes if tuple(coluna.name for coluna in indice.columns) not in existentes]
+    sem_indice = [
+        chave['constrained_columns'][0] for chave in inspetor.get_foreign_keys(tabela.name)
+        if not any(colunas[0] == chave['constrained_columns'][0] for colunas in existentes if colunas)
+    ]
+    return declarados, sem_indice
+
+def estatisticas_indices():
+    """Retorna o número de linhas por tabela, o tamanho de cada índice e os índices sem uso, quando o banco informa."""
+    linhas = {}
+    tamanhos = {}
+    sem_uso = None
+    with engine.connect() as conexao:
+        if banco_sqlite:
+            for tabela in Base.metadata.sorted_tables:
+                linhas[tabela.name] = conexao.execute(select(func.count()).select_from(tabela)).scalar()
+            try:
+                # A tabela virtual dbstat só existe se o SQLite foi compilado com ela
+                for nome, tamanho in conexao.execute(text("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name")):
+                    tamanhos[nome] = tamanho
+            except DBAPIError:
+                pass
+        else:
+            # No MySQL o número de linhas é a estimativa do InnoDB, para não fazer COUNT(*) em tabelas enormes
+            for nome, quantidade in conexao.execute(
+                text("SELECT TABLE_NAME, TABLE_ROWS FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_SCHEMA = :banco"),
+                {'banco': nome_do_banco},
+            ):
+                linhas[nome] = quantidade
+            for tabela, indice, tamanho in conexao.execute(text(
+                "SELECT table_name, index_name, stat_value * @@innodb_page_size FROM mysql.innodb_index_stats "
+                "WHERE database_name = :banco AND stat_name = 'size'"
+            ), {'banco': nome_do_banco}):
+                tamanhos[indice if indice != 'PRIMARY' else f'{tabela}.PRIMARY'] = tamanho
+            try:
+                sem_uso = {(tabela, indice) for tabela, indice in conexao.execute(text(
+                    "SELECT object_name, index_name FROM sys.schema_unused_indexes WHERE object_schema = :banco"
+                ), {'banco': nome_do_banco})}
+            except DBAPIError:
+                pass
+    return linhas, tamanhos, sem_uso
+
+def formatar_bytes(tamanho):
+    if tamanho is None:
+        return 'n/d'
+    for unidade in ('B', 'KB', 'MB', 'GB'):
+        if tamanho < 1024 or unidade == 'GB':
+            return f"{tamanho:.0f} {unidade}" if unidade == 'B' else f"{tamanho:.1f} {unidade}"
+        tamanho /= 1024
+
+def relatorio_indices(argumentos):
+    """Mostra linhas, índices e tamanhos por tabela, e os índices sem uso ou faltando."""
+    criar = '--criar' in argumentos
+    inspetor = sqlalchemy.inspect(engine)
+    linhas, tamanhos, sem_uso = estatisticas_indices()
+
+    for tabela in Base.metadata.sorted_tables:
+        print(f"\nTabela {tabela.name}: {linhas.get(tabela.name, 'n/d')} linha(s), "
+              f"dados {formatar_bytes(tamanhos.get(tabela.name, tamanhos.get(f'{tabela.name}.PRIMARY')))}")
+        for indice in inspetor.get_indexes(tabela.name):
+            observacao = ''
+            if sem_uso is not None and (tabela.name, indice['name']) in sem_uso:
+                observacao = ' [sem uso desde o início do servidor]'
+            print(f" - {indice['name']} ({', '.join(indice['column_names'])}): "
+                  f"{formatar_bytes(tamanhos.get(indice['name']))}{observacao}")
+
+        declarados, sem_indice = indices_faltando(inspetor, tabela)
+        for indice in declarados:
+            print(f" ! índice faltando: {indice.name} ({', '.join(coluna.name for coluna in indice.columns)})")
+            if criar:
+                try:
+                    indice.create(engine)
+                    print(f"   índice {indice.name} criado.")
+                except DBAPIError as erro:
+                    # Ex.: um índice único sobre dados que já têm duplicatas
+                    print(f"   não foi possível criar o índice {indice.name}: {erro.orig}")
+        for coluna in sem_indice:
+            print(f" ! chave estrangeira sem índice: {coluna}")
+
+    if sem_uso is None:
+        print("\nEste banco não informa quais índices estão sem uso.")
+    if not criar:
+        print("Use 'relatorio-indices --criar' para criar os índices faltando.")
+
+def apagar_em_lotes(argumentos):
+    """Apaga um artista, álbum ou cliente com tudo o que depende dele, um lote por transação; --simular só conta."""
+    uso = "Use: apagar <artista|album|cliente> <id> [--simular] [--lote=1000]"
+    opcoes = [argumento for argumento in argumentos if argumento.startswith('--')]
+    posicionais = [argumento for argumento in argumentos if not argumento.startswith('--')]
+    if len(posicionais) != 2 or posicionais[0] not in ('artista', 'album', 'cliente') or not posicionais[1].isdigit():
+        print(uso)
+        return
+    modelo, id = ENTIDADES[posicionais[0]], int(posicionais[1])
+    tamanho_lote = TAMANHO_LOTE_EXCLUSAO
+    for opcao in opcoes:
+        if opcao.startswith('--lote='):
+            tamanho_lote = int(opcao.split('=', 1)[1])
+        elif opcao != '--simular':
+            print(f"Argumento desconhecido: '{opcao}'. {uso}")
+            return
+    if sessao.get(modelo, id) is None:
+        print(MENSAGENS_NAO_ENCONTRADO[modelo])
+        return
+
+    contagem = contar_exclusao(sessao, modelo, id)
+    for descricao, linhas in contagem:
+        print(f" - {descricao}: {linhas}")
+    if '--simular' in opcoes:
+        print("Simulação: nada foi apagado.")
+        return
+
+    inicio = time.perf_counter()
+    sessao.expunge(sessao.get(modelo, id))
+    apagadas = apagar_em_cascata(sessao, modelo, id, tamanho_lote, confirmar_lotes=True, progresso=mostrar_progresso(contagem))
+    print(f"{sum(apagadas.values())} linha(s) apagada(s) em lotes de até {tamanho_lote} ({time.perf_counter() - inicio:.2f}s).")
+
+def mostrar_versao_esquema(argumentos):
+    """Mostra a versão do esquema esperada pelo código, as migrações já aplicadas no banco e as pendentes."""
+    print(f"Versão do esquema no código: {VERSAO_ESQUEMA}")
+    for linha in sessao.execute(select(VersaoEsquema).order_by(VersaoEsquema.versao)).scalars():
+        print(f"  {linha.versao:>3}  {linha.data_aplicacao:%Y-%m-%d %H:%M:%S}  {linha.descricao}")
+    for numero in migracoes_pendentes(versao_do_esquema()):
+        print(f"  {numero:>3}  {'pendente':<19}  {MIGRACOES[numero][0]}")
+
+def migrar(argumentos):
+    """Aplica as migrações pendentes, com o tamanho do lote e a pausa dos preenchimentos configuráveis."""
+    uso = "Use: migrar [--lote=5000] [--pausa=0.05]"
+    for argumento in argumentos:
+        if argumento.startswith('--lote='):
+            configuracao_migracao['tamanho_lote'] = int(argumento.split('=', 1)[1])
+        elif argumento.startswith('--pausa='):
+            configuracao_migracao['pausa'] = float(argumento.split('=', 1)[1])
+        else:
+            print(f"Argumento desconhecido: '{argumento}'. {uso}")
+            return
+    versao = versao_do_esquema()
+    if not migracoes_pendentes(versao):
+        print(f"O esquema já está na versão {VERSAO_ESQUEMA}.")
+        return
+    inicio = time.perf_counter()
+    migrar_esquema(versao)
+    print(f"Esquema na versão {VERSAO_ESQUEMA} em {time.perf_counter() - inicio:.1f}s.")
+
+# RECOMENDAÇÕES
+# "Músicas parecidas" pela frequência com que duas músicas aparecem juntas nas playlists, normalizada
+# pela popularidade de cada uma (similaridade do cosseno). O cálculo usa numpy e scipy, importados só
+# aqui, e guarda as K mais parecidas de cada música em musicas_similares, então a consulta é uma leitura
+# pela chave primária.
+def musicas_similares(sessao, musica_id, limite=10):
+    """Retorna (id, nome, pontuação) das músicas mais parecidas com a informada."""
+    return sessao.execute(
+        select(Musica.id, Musica.nome, MusicaSimilar.pontuacao)
+        .join(Musica, Musica.id == MusicaSimilar.fk_id_similar)
+        .where(MusicaSimilar.fk_id_musica == musica_id)
+        .order_by(MusicaSimilar.ordem)
+        .limit(limite)
+    ).all()
+
+def calcular_recomendacoes(argumentos):
+    """Calcula e grava as K músicas mais parecidas com cada música.
+
+    A memória cresce com o total de entradas de playlist: a matriz de incidência fica inteira em memória, por
+    linha e por coluna, com cerca de 16 bytes por entrada (uns 20 no pico, enquanto playlist_musicas é lida).
+    Além dela, só a matriz de co-ocorrência de um bloco, proporcional a `musicas_por_bloco` vezes a
+    quantidade de vizinhos de cada música; com muitos dados, é o tamanho do bloco que deve ser reduzido.
+    """
+    from array import array
+
+    try:
+        import numpy as np
+        from scipy import sparse
+    except ImportError:
+        print("O cálculo de recomendações requer numpy e scipy: pip install numpy scipy")
+        return
+
+    k = int(argumentos[0]) if len(argumentos) > 0 else 20
+    musicas_por_bloco = int(argumentos[1]) if len(argumentos) > 1 else 5000
+    inicio = time.perf_counter()
+
+    # playlist_musicas é lida uma única vez, em ordem de playlist, para uma matriz de incidência
+    # playlist × música esparsa e compacta (índices de 4 bytes), reaproveitada por todos os blocos; ela não
+    # é limitada: ocupa cerca de 8 bytes por entrada, mais 8 na cópia por coluna
+    linhas, colunas = array('i'), array('i')
+    playlist_anterior, indice_playlist = None, -1
+    consulta = (
+        select(PlaylistMusica.fk_id_playlist, PlaylistMusica.fk_id_musica)
+        .order_by(PlaylistMusica.fk_id_playlist)
+        .execution_options(yield_per=TAMANHO_LOTE_LEITURA)
+    )
+    for playlist_id, musica_id in sessao.execute(consulta):
+        if playlist_id != playlist_anterior:
+            playlist_anterior = playlist_id
+            indice_playlist += 1
+        linhas.append(indice_playlist)
+        colunas.append(musica_id)
+    sessao.commit()
+    colunas = np.frombuffer(colunas, dtype=np.intc)
+    incidencia = sparse.csr_matrix(
+        (np.ones(len(colunas), dtype=np.float32), (np.frombuffer(linhas, dtype=np.intc), colunas)),
+        shape=(indice_playlist + 1, int(colunas.max(initial=0)) + 1),
+    )
+    del linhas, colunas
+    # A mesma matriz por coluna, para tirar as músicas de um bloco sem percorrer todas as entradas
+    incidencia_por_musica = incidencia.tocsc()
+
+    # Em quantas playlists cada música aparece, indexado pelo ID da música
+    ocorrencias = np.diff(incidencia_por_musica.indptr).astype(np.float64)
+    musicas = np.flatnonzero(ocorrencias)
+
+    # A matriz de co-ocorrência é montada um bloco de músicas por vez (linhas do bloco × todas as músicas):
+    # cada bloco só percorre as playlists que têm músicas dele, então o total de trabalho é o de montar a
+    # matriz inteira, e a memória além da incidência depende só do tamanho do bloco (e não do total de músicas)
+    blocos = range(0, len(musicas), musicas_por_bloco)
+    gravadas = 0
+    for numero, inicio_bloco in enumerate(blocos, start=1):
+        bloco = musicas[inicio_bloco:inicio_bloco + musicas_por_bloco]
+        coocorrencias = (incidencia_por_musica[:, bloco].T @ incidencia).tocsr()
+
+        vizinhos_do_bloco = []
+        for indice, musica_id in enumerate(bloco):
+            faixa = slice(coocorrencias.indptr[indice], coocorrencias.indptr[indice + 1])
+            vizinhos = coocorrencias.indices[faixa]
+            pontuacoes = coocorrencias.data[faixa] / np.sqrt(ocorrencias[musica_id] * ocorrencias[vizinhos])
+            pontuacoes[vizinhos == musica_id] = 0
+            if len(pontuacoes) > k:
+                melhores = np.argpartition(-pontuacoes, k)[:k]
+            else:
+                melhores = np.arange(len(pontuacoes))
+            melhores = melhores[np.argsort(-pontuacoes[melhores], kind='stable')]
+            vizinhos_do_bloco.extend(
+                {'fk_id_musica': int(musica_id), 'ordem': ordem, 'fk_id_similar': int(vizinhos[j]), 'pontuacao': float(pontuacoes[j])}
+                for ordem, j in enumerate((j for j in melhores if pontuacoes[j] > 0), start=1)
+            )
+
+        # Cada bloco substitui as recomendações das suas músicas numa transação
+        sessao.execute(delete(MusicaSimilar).where(MusicaSimilar.fk_id_musica.in_(bloco.tolist())))
+        if vizinhos_do_bloco:
+            sessao.execute(insert(MusicaSimilar), vizinhos_do_bloco)
+        sessao.commit()
+        gravadas += len(vizinhos_do_bloco)
+        print(f"\r{numero}/{len(blocos)} blocos de músicas", end="", flush=True)
+
+    # Músicas que saíram de todas as playlists não têm mais recomendações
+    sessao.execute(delete(MusicaSimilar).where(MusicaSimilar.fk_id_musica.not_in(select(PlaylistMusica.fk_id_musica))))
+    sessao.commit()
+    print(f"\nRecomendações de {len(musicas)} músicas calculadas em {time.perf_counter() - inicio:.1f}s ({gravadas} vizinhos gravados).")
+
+# DUPLICATAS
+# Encontra nomes quase iguais (ex.: "Caetano Veloso" e "caetano  veloso.") sem comparar todos os pares.
+# Cada nome normalizado vira um conjunto de trigramas, resumido por uma assinatura MinHash, e só são
+# comparados os nomes que caem no mesmo balde em alguma faixa da assinatura (LSH) dentro do mesmo bloco
+# (músicas só se comparam com as do mesmo álbum ou single). Nomes com números diferentes ("Volume 1" e
+# "Volume 2") nunca são considerados duplicatas.
+PERMUTACOES_MINHASH = 32
+FAIXAS_LSH = 8
+PRIMO_MINHASH = (1 << 61) - 1
+
+# Consulta (id, nome, colunas do bloco) de cada tipo de registro, e a coluna que aponta para ele
+ALVOS_DEDUPLICACAO = {
+    'artistas': (Artista, select(Artista.id, Artista.nome), Album.fk_id_artista),
+    'generos': (Genero, select(Genero.id, Genero.nome), Musica.fk_id_genero),
+    'musicas': (Musica, select(Musica.id, Musica.nome, Musica.fk_id_album, Musica.fk_id_single), None),
+}
+
+def normalizar_nome(nome):
+    """Minúsculas, sem acentos nem pontuação, com as palavras em ordem alfabética.
+
+    Letras de qualquer escrita são mantidas ("坂本龍一" continua "坂本龍一"). Só saem os acentos das letras
+    latinas, gregas e cirílicas; os sinais de outras escritas (ex.: o dakuten de "バ") mudam o som e ficam.
+    """
+    import unicodedata
+
+    caracteres = []
+    base = ''
+    for caractere in unicodedata.normalize('NFKD', nome or ''):
+        if unicodedata.combining(caractere):
+            if unicodedata.name(base, '').split(' ')[0] in ('LATIN', 'GREEK', 'CYRILLIC'):
+                continue
+        else:
+            base = caractere
+        caracteres.append(caractere)
+    sem_acentos = unicodedata.normalize('NFC', ''.join(caracteres)).casefold()
+    return ' '.join(sorted(re.findall(r'[^\W_]+', sem_acentos)))
+
+def trigramas(texto):
+    texto = f" {texto} "
+    return {texto[inicio:inicio + 3] for inicio in range(len(texto) - 2)}
+
+def agrupar_duplicatas(registros, limiar=0.8):
+    """Agrupa os registros (id, nome, *bloco) de nomes parecidos. Retorna os grupos com mais de um ID."""
+    import random
+    import zlib
+
+    sorteio = random.Random(0)
+    coeficientes = [(sorteio.randrange(1, PRIMO_MINHASH), sorteio.randrange(PRIMO_MINHASH)) for _ in range(PERMUTACOES_MINHASH)]
+    linhas_por_faixa = PERMUTACOES_MINHASH // FAIXAS_LSH
+    conjuntos = {}
+    baldes = {}
+    # Os hashes de cada trigrama são calculados uma vez só; há bem menos trigramas distintos que nomes
+    hashes_trigramas = {}
+
+    def hashes(trigrama):
+        if trigrama not in hashes_trigramas:
+            valor = zlib.crc32(trigrama.encode())
+            hashes_trigramas[trigrama] = [(a * valor + b) % PRIMO_MINHASH for a, b in coeficientes]
+        return hashes_trigramas[trigrama]
+
+    for id, nome, *bloco in registros:
+        normalizado = normalizar_nome(nome)
+        # Nomes só de pontuação não têm o que comparar, e juntos num balde seriam todos "iguais"
+        if not normalizado:
+            continue
+        conjunto = trigramas(normalizado)
+        conjuntos[id] = conjunto
+        assinatura = [min(valores) for valores in zip(*(hashes(trigrama) for trigrama in conjunto))]
+        numeros = tuple(re.findall(r'[0-9]+', normalizado))
+        for faixa in range(FAIXAS_LSH):
+            chave = (tuple(bloco), numeros, faixa, tuple(assinatura[faixa * linhas_por_faixa:(faixa + 1) * linhas_por_faixa]))
+            baldes.setdefault(chave, []).append(id)
+
+    # Os pares candidatos são confirmados pela semelhança de Jaccard real e unidos em grupos (union-find)
+    pais = {}
+
+    def raiz(id):
+        while pais.get(id, id) != id:
+            pais[id] = pais.get(pais[id], pais[id])
+            id = pais[id]
+        return id
+
+    for ids in baldes.values():
+        for indice, primeiro in enumerate(ids):
+            for segundo in ids[indice + 1:]:
+                raiz_primeiro, raiz_segundo = raiz(primeiro), raiz(segundo)
+                if raiz_primeiro == raiz_segundo:
+                    continue
+                a, b = conjuntos[primeiro], conjuntos[segundo]
+                uniao = len(a | b)
+                if uniao and len(a & b) / uniao >= limiar:
+                    pais[max(raiz_primeiro, raiz_segundo)] = min(raiz_primeiro, raiz_segundo)
+
+    grupos = {}
+    for id in pais:
+        grupos.setdefault(raiz(id), set()).add(id)
+    return [sorted(grupo | {raiz_grupo}) for raiz_grupo, grupo in grupos.items() if len(grupo | {raiz_grupo}) > 1]
+
+def mesclar_contagens(sessao, modelo, nome_coluna, mapa, *condicao):
+    """Soma as contagens das duplicatas às linhas do registro mantido e apaga as linhas das duplicatas."""
+    tabela = modelo.__table__
+    coluna = tabela.c[nome_coluna]
+    linhas = [dict(linha._mapping) for linha in sessao.execute(select(tabela).where(coluna.in_(list(mapa)), *condicao))]
+    for linha in linhas:
+        linha[nome_coluna] = mapa[linha[nome_coluna]]
+    sessao.execute(delete(tabela).where(coluna.in_(list(mapa)), *condicao))
+    somar_quantidades(sessao, tabela, linhas)
+
+def mesclar_duplicatas(sessao, modelo, coluna, grupos):
+    """Mantém, em cada grupo, o registro mais referenciado e aponta para ele as referências das duplicatas."""
+    todos = [id for grupo in grupos for id in grupo]
+    referencias = dict(sessao.execute(select(coluna, func.count()).where(coluna.in_(todos)).group_by(coluna)).all())
+    mapa = {}
+    for grupo in grupos:
+        mantido = max(grupo, key=lambda id: (referencias.get(id, 0), -id))
+        mapa.update({id: mantido for id in grupo if id != mantido})
+    if not mapa:
+        return mapa
+
+    tabela = coluna.table
+    sessao.execute(
+        update(tabela).where(tabela.c[coluna.name] == bindparam('duplicata')).values({coluna.name: bindparam('mantido')}),
+        [{'duplicata': duplicata, 'mantido': mantido} for duplicata, mantido in mapa.items()]
+    )
+    # As tabelas derivadas também passam a contar pelo registro mantido
+    if modelo is Genero:
+        mesclar_contagens(sessao, ResumoPlaylistGenero, 'fk_id_genero', mapa)
+        mesclar_contagens(sessao, PerfilCliente, 'referencia_id', mapa, PerfilCliente.tipo == 'genero')
+        cache_generos.invalidar_ao_confirmar(sessao)
+    else:
+        mesclar_contagens(sessao, PerfilCliente, 'referencia_id', mapa, PerfilCliente.tipo == 'artista')
+        cache_artistas.invalidar_ao_confirmar(sessao)
+    sessao.execute(delete(modelo).where(modelo.id.in_(list(mapa))).execution_options(synchronize_session=False))
+    return mapa
+
+def deduplicar(argumentos):
+    """Procura artistas, gêneros e músicas com nomes quase iguais e, com --mesclar, junta artistas e gêneros."""
+    mesclar = '--mesclar' in argumentos
+    limiar = 0.8
+    alvos = []
+    for argumento in argumentos:
+        if argumento.startswith('--limiar='):
+            limiar = float(argumento.split('=', 1)[1])
+        elif argumento in ALVOS_DEDUPLICACAO:
+            alvos.append(argumento)
+        elif argumento != '--mesclar':
+            print(f"Argumento desconhecido: '{argumento}'. Use: deduplicar [{'|'.join(ALVOS_DEDUPLICACAO)}] [--mesclar] [--limiar=0.8]")
+            return
+
+    for alvo in alvos or list(ALVOS_DEDUPLICACAO):
+        modelo, consulta, coluna = ALVOS_DEDUPLICACAO[alvo]
+        inicio = time.perf_counter()
+        nomes = {}
+
+        def registros():
+            for linha in sessao.execute(consulta.execution_options(yield_per=TAMANHO_LOTE_LEITURA)):
+                nomes[linha[0]] = linha[1]
+                yield linha
+
+        grupos = agrupar_duplicatas(registros(), limiar)
+        print(f"\n{alvo.capitalize()}: {len(grupos)} grupo(s) de possíveis duplicatas entre {len(nomes)} registros "
+              f"({time.perf_counter() - inicio:.2f}s)")
+        for grupo in grupos[:20]:
+            print(" - " + ", ".join(f"[{id}] {nomes[id]}" for id in grupo))
+        if len(grupos) > 20:
+            print(f" ... e mais {len(grupos) - 20} grupo(s)")
+
+        if mesclar and grupos:
+            if coluna is None:
+                print("Músicas duplicadas não são mescladas automaticamente, pois estão em playlists; revise os grupos acima.")
+                continue
+            mapa = mesclar_duplicatas(sessao, modelo, coluna, grupos)
+            sessao.commit()
+            print(f"{len(mapa)} duplicata(s) mesclada(s).")
+
+# EXPORTAÇÃO
+# Exporta o catálogo e as playlists para CSV, JSONL ou Parquet. O resultado é lido em lotes (com cursor
+# do lado do servidor no MySQL) e cada lote é escrito assim que chega, então a memória usada depende do
+# tamanho do lote e não do tamanho das tabelas. Os nomes de gênero, álbum, artista e single vêm do SQL.
+def consulta_exportacao_catalogo():
+    return (
+        select(Musica.id.label('musica_id'), Musica.nome.label('musica'), Musica.duracao,
+               Genero.nome.label('genero'), Album.nome.label('album'), Artista.nome.label('artista'),
+               Single.nome.label('single'),
+               func.coalesce(Album.data_lancamento, Single.data_lancamento).label('data_lancamento'))
+        .outerjoin(Genero, Genero.id == Musica.fk_id_genero)
+        .outerjoin(Album, Album.id == Musica.fk_id_album)
+        .outerjoin(Artista, Artista.id == Album.fk_id_artista)
+        .outerjoin(Single, Single.id == Musica.fk_id_single)
+        .order_by(Musica.id)
+    )
+
+def consulta_exportacao_playlists():
+    return (
+        select(Playlist.id.label('playlist_id'), Playlist.nome.label('playlist'), Playlist.data_criacao,
+               Cliente.id.label('cliente_id'), Cliente.nome.label('cliente'),
+               Musica.id.label('musica_id'), Musica.nome.label('musica'), Musica.duracao)
+        .outerjoin(Cliente, Cliente.id == Playlist.fk_id_cliente)
+        .outerjoin(PlaylistMusica, PlaylistMusica.fk_id_playlist == Playlist.id)
+        .outerjoin(Musica, Musica.id == PlaylistMusica.fk_id_musica)
+        .order_by(Playlist.id, PlaylistMusica.posicao, PlaylistMusica.id)
+    )
+
+EXPORTACOES = {
+    'catalogo': consulta_exportacao_catalogo,
+    'playlists': consulta_exportacao_playlists,
+}
+
+class EscritorCSV:
+    def __init__(self, caminho, colunas, tipos):
+        import csv
+
+        self.arquivo = open(caminho, 'w', newline='', encoding='utf-8')
+        self.saida = csv.writer(self.arquivo)
+        self.saida.writerow(colunas)
+
+    def escrever(self, linhas):
+        self.saida.writerows(linhas)
+
+    def fechar(self):
+        self.arquivo.close()
+
+class EscritorJSONL:
+    def __init__(self, caminho, colunas, tipos):
+        import json
+
+        self.json = json
+        self.colunas = colunas
+        self.arquivo = open(caminho, 'w', encoding='utf-8')
+
+    def escrever(self, linhas):
+        self.arquivo.writelines(
+            self.json.dumps(dict(zip(self.colunas, linha)), ensure_ascii=False, default=str) + '\n' for linha in linhas
+        )
+
+    def fechar(self):
+        self.arquivo.close()
+
+class EscritorParquet:
+    """Escreve cada lote como um row group; requer pyarrow."""
+
+    def __init__(self, caminho, colunas, tipos):
+        import pyarrow
+        import pyarrow.parquet
+
+        def tipo_arrow(tipo):
+            if isinstance(tipo, Date):
+                return pyarrow.date32()
+            if isinstance(tipo, Integer):
+                return pyarrow.int64()
+            if isinstance(tipo, Float):
+                return pyarrow.float64()
+            return pyarrow.string()
+
+        self.pyarrow = pyarrow
+        self.esquema = pyarrow.schema([(coluna, tipo_arrow(tipo)) for coluna, tipo in zip(colunas, tipos)])
+        self.arquivo = pyarrow.parquet.ParquetWriter(caminho, self.esquema)
+
+    def escrever(self, linhas):
+        valores = list(zip(*linhas))
+        self.arquivo.write_table(self.pyarrow.Table.from_arrays(
+            [self.pyarrow.array(coluna, type=campo.type) for coluna, campo in zip(valores, self.esquema)], schema=self.esquema
+        ))
+
+    def fechar(self):
+        self.arquivo.close()
+
+ESCRITORES = {
+    'csv': EscritorCSV,
+    'jsonl': EscritorJSONL,
+    'parquet': EscritorParquet,
+}
+
+def pico_de_memoria():
+    """Maior uso de memória do processo até agora, em bytes, ou None onde não é possível medir."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # O Linux informa em KB e o macOS em bytes
+    return pico if sys.platform == 'darwin' else pico * 1024
+
+@leitura
+def exportar(argumentos):
+    """Exporta o catálogo ou as playlists em streaming para CSV, JSONL ou Parquet."""
+    if len(argumentos) < 2 or argumentos[0] not in EXPORTACOES:
+        print(f"Uso: exportar <{'|'.join(EXPORTACOES)}> <arquivo.csv|.jsonl|.parquet> [linhas por lote]")
+        return
+    nome, caminho = argumentos[:2]
+    tamanho_lote = int(argumentos[2]) if len(argumentos) > 2 else 10000
+    formato = os.path.splitext(caminho)[1].lstrip('.').lower()
+    if formato not in ESCRITORES:
+        print(f"Formato desconhecido: '{formato}'. Use um destes: {', '.join(ESCRITORES)}.")
+        return
+
+    consulta = EXPORTACOES[nome]()
+    colunas = [coluna.name for coluna in consulta.selected_columns]
+    tipos = [coluna.type for coluna in consulta.selected_columns]
+    # O arquivo só aparece com o nome final quando está completo, para quem o consome não ler uma exportação pela metade
+    parcial = caminho + '.parcial'
+    try:
+        escritor = ESCRITORES[formato](parcial, colunas, tipos)
+    except ImportError:
+        print("A exportação em Parquet requer pyarrow: pip install pyarrow")
+        return
+
+    inicio = time.perf_counter()
+    total = 0
+    try:
+        resultado = sessao.execute(consulta.execution_options(yield_per=tamanho_lote))
+        for lote in resultado.partitions():
+            escritor.escrever(lote)
+            total += len(lote)
+            print(f"\r{total} linhas ({total / (time.perf_counter() - inicio):.0f} linhas/s)", end="", flush=True)
+    except BaseException:
+        escritor.fechar()
+        os.remove(parcial)
+        raise
+    escritor.fechar()
+    sessao.commit()
+    os.replace(parcial, caminho)
+
+    decorrido = time.perf_counter() - inicio
+    print(f"\nExportação de '{nome}' concluída em {caminho}: {total} linhas em {decorrido:.2f}s "
+          f"({total / decorrido if decorrido else 0:.0f} linhas/s), pico de memória {formatar_bytes(pico_de_memoria())}.")
+
+# CAMADA ASSÍNCRONA
+# Variante do acesso a dados com AsyncEngine/AsyncSession, para serviços que atendem muitos usuários
+# ao mesmo tempo. Usa aiosqlite no SQLite e aiomysql no MySQL (ou o driver de BANCO_URL_ASSINCRONA);
+# o driver e o greenlet só são importados quando a camada é usada pela primeira vez.
+# As escritas reaproveitam os serviços síncronos com run_sync.
+DRIVERS_ASSINCRONOS = {'sqlite': 'sqlite+aiosqlite', 'mysql': 'mysql+aiomysql'}
+
+engine_assincrona = None
+SessaoAssincrona = None
+
+def preparar_camada_assincrona():
+    """Cria, na primeira chamada, a engine e a fábrica de sessões assíncronas."""
+    global engine_assincrona, SessaoAssincrona
+    if engine_assincrona is None:
+        from sqlalchemy.ext.asyncio import create_async_engine
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        url = os.environ.get('BANCO_URL_ASSINCRONA') or url_com_banco.set(
+            drivername=DRIVERS_ASSINCRONOS[url_com_banco.get_backend_name()]
+        )
+        engine_assincrona = create_async_engine(url, **opcoes_engine(url))
+        if instrumentacao is not None:
+            instrumentacao.ativar(engine_assincrona.sync_engine)
+        SessaoAssincrona = async_sessionmaker(engine_assincrona, expire_on_commit=False)
+    return SessaoAssincrona
+
+async def async_consultar(consulta):
+    """Executa uma consulta numa sessão própria, para poder rodar ao mesmo tempo que outras."""
+    async with preparar_camada_assincrona()() as sessao_async:
+        return (await sessao_async.execute(consulta)).all()
+
+async def async_executar_servico(servico, *parametros):
+    """Executa um serviço síncrono numa sessão assíncrona e confirma a transação."""
+    async with preparar_camada_assincrona()() as sessao_async:
+        resultado = await sessao_async.run_sync(servico, *parametros)
+        await sessao_async.commit()
+        return resultado
+
+async def async_buscar_registro(modelo, id):
+    """Busca um registro pelo ID, ou levanta ValueError se ele não existir."""
+    async with preparar_camada_assincrona()() as sessao_async:
+        registro = await sessao_async.get(modelo, id)
+    if registro is None:
+        raise ValueError(MENSAGENS_NAO_ENCONTRADO[modelo])
+    return registro
+
+async def async_listar(modelo, limite=100, depois_do_id=0):
+    """Retorna até `limite` registros com ID maior que `depois_do_id`, em ordem de ID."""
+    async with preparar_camada_assincrona()() as sessao_async:
+        resultado = await sessao_async.scalars(
+            select(modelo).where(modelo.id > depois_do_id).order_by(modelo.id).limit(limite)
+        )
+        return resultado.all()
+
+def consultas_playlist_detalhada(playlist_id):
+    """Consultas independentes que montam uma playlist com seu dono e suas músicas."""
+    return (
+        select(Playlist.id, Playlist.nome, Playlist.data_criacao, Playlist.quantidade_musicas)
+        .where(Playlist.id == playlist_id),
+        select(Cliente.id, Cliente.nome, Cliente.email)
+        .where(Cliente.id == select(Playlist.fk_id_cliente).where(Playlist.id == playlist_id).scalar_subquery()),
+        select(Musica.id, Musica.nome, Musica.duracao)
+        .join(PlaylistMusica, PlaylistMusica.fk_id_musica == Musica.id)
+        .where(PlaylistMusica.fk_id_playlist == playlist_id)
+        .order_by(PlaylistMusica.posicao, PlaylistMusica.id),
+    )
+
+def montar_playlist_detalhada(playlist, dono, musicas):
+    if not playlist:
+        raise ValueError(MENSAGENS_NAO_ENCONTRADO[Playlist])
+    return {
+        'playlist': playlist[0]._asdict(),
+        'dono': dono[0]._asdict() if dono else None,
+        'musicas': [musica._asdict() for musica in musicas],
+    }
+
+def playlist_detalhada(sessao, playlist_id):
+    """Busca a playlist, o dono e as músicas, uma consulta depois da outra."""
+    return montar_playlist_detalhada(*(sessao.execute(consulta).all() for consulta in consultas_playlist_detalhada(playlist_id)))
+
+async def async_playlist_detalhada(playlist_id):
+    """Busca a playlist, o dono e as músicas ao mesmo tempo, cada consulta em uma conexão."""
+    resultados = await asyncio.gather(*(async_consultar(consulta) for consulta in consultas_playlist_detalhada(playlist_id)))
+    return montar_playlist_detalhada(*resultados)
+
+# COMANDOS DE LINHA DE COMANDO E BENCHMARKS
+def benchmark_pool(argumentos):
+    """Mede a latência da primeira consulta e a vazão com diferentes configurações de pool."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    consultas = int(argumentos[0]) if len(argumentos) > 0 else 2000
+    threads = int(argumentos[1]) if len(argumentos) > 1 else 8
+    cenarios = [
+        ('sem pool (NullPool)', {'poolclass': NullPool}),
+        ('pool_size=1', {'pool_size': 1, 'max_overflow': 0}),
+        ('pool_size=5', {'pool_size': 5, 'max_overflow': 0}),
+        ('pool_size=5 sem pre_ping', {'pool_size': 5, 'max_overflow': 0, 'pool_pre_ping': False}),
+        ('pool_size=10 +10 excedente', {'pool_size': 10, 'max_overflow': 10}),
+    ]
+
+    def consultar(engine_teste, quantidade):
+        for _ in range(quantidade):
+            with engine_teste.connect() as conexao:
+                conexao.execute(text("SELECT 1"))
+
+    print(f"{consultas} consultas em {threads} threads por cenário")
+    print(f"{'Cenário':<28} {'1ª consulta (ms)':>17} {'consultas/s':>12}")
+    for nome, opcoes in cenarios:
+        engine_teste = criar_engine(url_com_banco, **opcoes)
+
+        inicio = time.perf_counter()
+        consultar(engine_teste, 1)
+        primeira_consulta = (time.perf_counter() - inicio) * 1000
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            for _ in range(threads):
+                executor.submit(consultar, engine_teste, consultas // threads)
+        vazao = consultas / (time.perf_counter() - inicio)
+
+        engine_teste.dispose()
+        print(f"{nome:<28} {primeira_consulta:>17.2f} {vazao:>12.0f}")
+
+def verificar_relatorio(argumentos):
+    """Confere que o relatório de playlists faz uma única consulta com poucos e muitos dados; sai com código 1 se não."""
+    import io
+
+    contagens = []
+
+    def contar(conn, cursor, statement, parameters, context, executemany):
+        contagens[-1] += 1
+
+    # Os dados de verificação ficam só na transação e são descartados no final
+    musicas = [Musica(nome=f"Música de verificação {i}", duracao=180) for i in range(5)]
+    sessao.add_all(musicas)
+    try:
+        for quantidade in (10, 100, 1000):
+            sessao.add_all(
+                Playlist(nome=f"Verificação {i}", data_criacao=date.today(), quantidade_musicas=len(musicas),
+                         musicas=[PlaylistMusica(musica=musica) for musica in musicas])
+                for i in range(quantidade)
+            )
+            sessao.flush()
+            contagens.append(0)
+            event.listen(engine, 'before_cursor_execute', contar)
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    ler_playlists_e_musicas()
+            finally:
+                event.remove(engine, 'before_cursor_execute', contar)
+            print(f"+{quantidade} playlists: {contagens[-1]} consulta(s)")
+    finally:
+        sessao.rollback()
+
+    # O relatório deve ser uma única consulta, qualquer que seja a quantidade de playlists
+    if len(set(contagens)) > 1:
+        print("FALHA: o número de consultas cresce com a quantidade de playlists.")
+        sys.exit(1)
+    if contagens[0] != 1:
+        print(f"FALHA: o relatório fez {contagens[0]} consultas em vez de uma.")
+        sys.exit(1)
+    print("OK: uma única consulta, qualquer que seja a quantidade de playlists.")
+
+def verificar_resumos(argumentos):
+    """Confere que apagar registros mantém os resumos e os perfis iguais aos reconstruídos do zero; sai com código 1 se não."""
+    # Cada tabela derivada é lida inteira, em ordem, para comparar antes e depois da reconstrução
+    tabelas = {
+        'resumo_playlists': select(ResumoPlaylist.fk_id_playlist, ResumoPlaylist.quantidade_musicas, ResumoPlaylist.duracao_total)
+        .order_by(ResumoPlaylist.fk_id_playlist),
+        'resumo_playlist_generos': select(ResumoPlaylistGenero.fk_id_playlist, ResumoPlaylistGenero.fk_id_genero, ResumoPlaylistGenero.quantidade)
+        .order_by(ResumoPlaylistGenero.fk_id_playlist, ResumoPlaylistGenero.fk_id_genero),
+        'perfil_clientes': select(PerfilCliente.fk_id_cliente, PerfilCliente.tipo, PerfilCliente.referencia_id, PerfilCliente.quantidade)
+        .order_by(PerfilCliente.fk_id_cliente, PerfilCliente.tipo, PerfilCliente.referencia_id),
+    }
+    # Um registro de cada tipo que tenha entradas de playlist, escolhido depois da exclusão anterior
+    alvos = [
+        (Genero, select(Musica.fk_id_genero).join(PlaylistMusica, PlaylistMusica.fk_id_musica == Musica.id).where(Musica.fk_id_genero.is_not(None))),
+        (Musica, select(PlaylistMusica.fk_id_musica)),
+        (Playlist, select(PlaylistMusica.fk_id_playlist)),
+        (Album, select(Musica.fk_id_album).join(PlaylistMusica, PlaylistMusica.fk_id_musica == Musica.id).where(Musica.fk_id_album.is_not(None))),
+        (Artista, select(Album.fk_id_artista).join(Musica, Musica.fk_id_album == Album.id)
+         .join(PlaylistMusica, PlaylistMusica.fk_id_musica == Musica.id).where(Album.fk_id_artista.is_not(None))),
+        (Cliente, select(Playlist.fk_id_cliente).join(PlaylistMusica, PlaylistMusica.fk_id_playlist == Playlist.id)
+         .where(Playlist.fk_id_cliente.is_not(None))),
+    ]
+
+    def divergencias():
+        atuais = {nome: sessao.execute(consulta).all() for nome, consulta in tabelas.items()}
+        reconstruir_resumos_playlists(sessao)
+        reconstruir_perfis_clientes(sessao)
+        return [nome for nome, consulta in tabelas.items() if sessao.execute(consulta).all() != atuais[nome]]
+
+    # As exclusões ficam só na transação e são descartadas no final
+    falhas = []
+    try:
+        falhas += [f"{nome} (antes das exclusões)" for nome in divergencias()]
+        for modelo, consulta in alvos:
+            id = sessao.execute(consulta.limit(1)).scalar()
+            if id is None:
+                print(f"{modelo.__name__}: nenhum registro com entradas de playlist, ignorado")
+                continue
+            servico_apagar(sessao, modelo, id)
+            sessao.flush()
+            diferentes = divergencias()
+            print(f"{modelo.__name__} {id} apagado: {', '.join(diferentes) or 'resumos e perfis iguais aos reconstruídos'}")
+            falhas += [f"{nome} (depois de apagar {modelo.__name__} {id})" for nome in diferentes]
+    finally:
+        sessao.rollback()
+
+    if falhas:
+        print("FALHA: resumos ou perfis diferentes dos reconstruídos em " + "; ".join(falhas) + ".")
+        sys.exit(1)
+    print("OK: os resumos e os perfis continuam iguais aos reconstruídos depois de cada exclusão.")
+
+def verificar_replica(argumentos):
+    """Confere que, com a escrita agrupada e a réplica, quem grava lê o que gravou; sai com código 1 se não."""
+    global ESCRITA_AGRUPADA
+
+    if engine_replica is None:
+        print("Configure a réplica com BANCO_URL_REPLICA (para testar localmente, uma cópia do arquivo SQLite).")
+        return
+
+    @leitura
+    def ler_genero(genero_id):
+        return sessao.scalar(select(Genero.nome).where(Genero.id == genero_id))
+
+    consultas_na_replica = []
+
+    def contar(conn, cursor, statement, parameters, context, executemany):
+        consultas_na_replica.append(statement)
+
+    nome = f"Verificação da réplica {time.time_ns()}"
+    modo_anterior, ESCRITA_AGRUPADA = ESCRITA_AGRUPADA, True
+    # Começa fora da janela de leitura própria, como um usuário que ainda não escreveu
+    roteamento.ultima_escrita = float('-inf')
+    try:
+        genero = escrever('criar_genero', nome=nome).result()
+        event.listen(engine_replica, 'before_cursor_execute', contar)
+        try:
+            lido = ler_genero(genero.id)
+            sessao.commit()
+        finally:
+            event.remove(engine_replica, 'before_cursor_execute', contar)
+        escrever('apagar', entidade='genero', id=genero.id).result()
+    finally:
+        ESCRITA_AGRUPADA = modo_anterior
+
+    if lido != nome:
+        print(f"FALHA: a leitura depois da escrita agrupada não viu o gênero gravado "
+              f"({len(consultas_na_replica)} consulta(s) na réplica).")
+        sys.exit(1)
+    print("OK: a leitura depois da escrita agrupada foi para o banco principal e viu o gênero gravado.")
+
+def benchmark_busca(argumentos):
+    """Compara o tempo da busca textual com uma busca por LIKE '%termo%'."""
+    repeticoes = 20
+    if argumentos and argumentos[0].isdigit():
+        repeticoes = int(argumentos[0])
+        argumentos = argumentos[1:]
+    termos = argumentos or ['amor', 'love', 'rock']
+    modo = preparar_busca()
+
+    print(f"Busca textual no modo '{modo}', {repeticoes} repetições por termo")
+    print(f"{'Termo':<20} {'resultados':>10} {'busca (ms)':>11} {'LIKE (ms)':>10}")
+    for termo in termos:
+        inicio = time.perf_counter()
+        for _ in range(repeticoes):
+            resultados = buscar_catalogo(termo)
+        tempo_busca = (time.perf_counter() - inicio) / repeticoes * 1000
+
+        inicio = time.perf_counter()
+        for _ in range(repeticoes):
+            buscar_por_like(termo)
+        tempo_like = (time.perf_counter() - inicio) / repeticoes * 1000
+        print(f"{termo:<20} {len(resultados):>10} {tempo_busca:>11.2f} {tempo_like:>10.2f}")
+
+def medir(resultados, nome, operacao, repeticoes):
+    """Executa operacao(i) `repeticoes` vezes e guarda média, p95 e máximo em milissegundos."""
+    tempos = []
+    for indice in range(repeticoes):
+        inicio = time.perf_counter()
+        operacao(indice)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    tempos.sort()
+    resultados[nome] = {
+        'repeticoes': repeticoes,
+        'media_ms': sum(tempos) / len(tempos),
+        'p95_ms': tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))],
+        'maximo_ms': tempos[-1],
+    }
+    print(f"{nome:<32} {resultados[nome]['media_ms']:>10.2f} {resultados[nome]['p95_ms']:>10.2f}")
+
+def benchmark_crud(argumentos):
+    """Mede as operações de leitura, criação, atualização e deleção e grava os resultados em JSON."""
+    import json
+
+    repeticoes = int(argumentos[0]) if argumentos else 200
+    backend = url_com_banco.get_backend_name()
+    arquivo_resultado = argumentos[1] if len(argumentos) > 1 else f"benchmark-{backend}-{datetime.now():%Y%m%d-%H%M%S}.json"
+    repeticoes_leitura = max(1, repeticoes // 50)
+    resultados = {}
+    descarte = open(os.devnull, 'w')
+
+    def sem_saida(funcao):
+        def executar(_):
+            with contextlib.redirect_stdout(descarte):
+                funcao()
+        return executar
+
+    print(f"{'Operação':<32} {'média (ms)':>10} {'p95 (ms)':>10}")
+    for funcao in (ler_clientes, ler_playlists, ler_musicas, ler_albuns, ler_artistas, ler_singles, ler_generos,
+                   ler_playlists_e_musicas):
+        medir(resultados, funcao.__name__, sem_saida(funcao), repeticoes_leitura)
+    medir(resultados, 'buscar_catalogo', lambda i: buscar_catalogo(f"Música {i + 1}"), repeticoes)
+
+    # Os registros criados aqui são os mesmos atualizados e apagados depois, então o banco termina como começou
+    genero = servico_criar_genero(sessao, "Gênero do benchmark")
+    album = servico_criar_album(sessao, "Álbum do benchmark")
+    sessao.commit()
+    genero_id, album_id = genero.id, album.id
+    clientes, playlists, musicas = [], [], []
+
+    def criar_cliente_medido(i):
+        clientes.append(servico_criar_cliente(sessao, f"Cliente benchmark {i}", "benchmark@email.com", date(2000, 1, 1)).id)
+        sessao.commit()
+
+    def criar_playlist_medida(i):
+        playlists.append(servico_criar_playlist(sessao, f"Playlist benchmark {i}", clientes[i]).id)
+        sessao.commit()
+
+    def adicionar_musica_medida(i):
+        musicas.append(servico_adicionar_musica(sessao, f"Música benchmark {i}", 180, genero_id, album_id=album_id).id)
+        sessao.commit()
+
+    def executar_e_confirmar(servico, *parametros):
+        servico(sessao, *parametros)
+        sessao.commit()
+
+    medir(resultados, 'criar_cliente', criar_cliente_medido, repeticoes)
+    medir(resultados, 'criar_playlist', criar_playlist_medida, repeticoes)
+    medir(resultados, 'adicionar_musica', adicionar_musica_medida, repeticoes)
+    medir(resultados, 'adicionar_musica_a_playlist',
+          lambda i: executar_e_confirmar(servico_adicionar_musica_a_playlist, playlists[i], musicas[i]), repeticoes)
+    medir(resultados, 'atualizar_musica',
+          lambda i: executar_e_confirmar(servico_atualizar, Musica, musicas[i], {'duracao': 200 + i}), repeticoes)
+    medir(resultados, 'atualizar_cliente',
+          lambda i: executar_e_confirmar(servico_atualizar, Cliente, clientes[i], {'email': f"b{i}@email.com"}), repeticoes)
+    medir(resultados, 'remover_musica_da_playlist',
+          lambda i: executar_e_confirmar(servico_remover_musica_da_playlist, playlists[i], musicas[i]), repeticoes)
+    medir(resultados, 'apagar_musica', lambda i: executar_e_confirmar(servico_apagar, Musica, musicas[i]), repeticoes)
+    medir(resultados, 'apagar_playlist', lambda i: executar_e_confirmar(servico_apagar, Playlist, playlists[i]), repeticoes)
+    medir(resultados, 'apagar_cliente', lambda i: executar_e_confirmar(servico_apagar, Cliente, clientes[i]), repeticoes)
+    servico_apagar(sessao, Album, album_id)
+    servico_apagar(sessao, Genero, genero_id)
+    sessao.commit()
+    descarte.close()
+
+    contagens = {
+        tabela.name: sessao.execute(select(func.count()).select_from(tabela)).scalar()
+        for tabela in Base.metadata.sorted_tables
+    }
+    with open(arquivo_resultado, 'w', encoding='utf-8') as arquivo:
+        json.dump({
+            'banco': backend,
+            'versao_sqlalchemy': versao,
+            'data': datetime.now().isoformat(timespec='seconds'),
+            'linhas': contagens,
+            'resultados': resultados,
+        }, arquivo, ensure_ascii=False, indent=2)
+    print(f"Resultados gravados em {arquivo_resultado}")
+
+def benchmark_async(argumentos):
+    """Compara a vazão das camadas síncrona e assíncrona com vários usuários abrindo playlists ao mesmo tempo."""
+    import random
+    from concurrent.futures import ThreadPoolExecutor
+
+    usuarios = int(argumentos[0]) if len(argumentos) > 0 else 100
+    operacoes = int(argumentos[1]) if len(argumentos) > 1 else 20
+    ids = sessao.scalars(select(Playlist.id)).all()
+    sessao.rollback()
+    if not ids:
+        print("Nenhuma playlist cadastrada. Use 'gerar-dados' antes do benchmark.")
+        return
+    sorteio = random.Random(42)
+    roteiros = [[sorteio.choice(ids) for _ in range(operacoes)] for _ in range(usuarios)]
+
+    # Cada operação usa sua própria sessão, como um serviço que atende uma requisição por vez
+    def usuario_sincrono(roteiro):
+        tempos = []
+        for playlist_id in roteiro:
+            inicio = time.perf_counter()
+            with Sessao() as sessao_usuario:
+                playlist_detalhada(sessao_usuario, playlist_id)
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        return tempos
+
+    async def usuario_assincrono(roteiro):
+        tempos = []
+        for playlist_id in roteiro:
+            inicio = time.perf_counter()
+            await async_playlist_detalhada(playlist_id)
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        return tempos
+
+    async def executar_assincrono():
+        preparar_camada_assincrona()
+        try:
+            return await asyncio.gather(*(usuario_assincrono(roteiro) for roteiro in roteiros))
+        finally:
+            # As conexões ficam presas ao event loop, então são fechadas antes de ele terminar
+            await engine_assincrona.dispose()
+
+    def executar_sincrono():
+        with ThreadPoolExecutor(max_workers=usuarios) as executor:
+            return list(executor.map(usuario_sincrono, roteiros))
+
+    print(f"{usuarios} usuários simultâneos, {operacoes} playlists abertas por usuário")
+    print(f"{'Camada':<12} {'operações/s':>12} {'média (ms)':>11} {'p95 (ms)':>10}")
+    for nome, executar in (('síncrona', executar_sincrono), ('assíncrona', lambda: asyncio.run(executar_assincrono()))):
+        inicio = time.perf_counter()
+        tempos = sorted(tempo for tempos_usuario in executar() for tempo in tempos_usuario)
+        duracao = time.perf_counter() - inicio
+        print(f"{nome:<12} {len(tempos) / duracao:>12.0f} {sum(tempos) / len(tempos):>11.2f} "
+              f"{tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))]:>10.2f}")
+
+def comparar_benchmarks(argumentos):
+    """Compara a média de cada operação entre dois arquivos de resultado do benchmark-crud."""
+    import json
+
+    if len(argumentos) != 2:
+        print("Uso: comparar-benchmarks <antes.json> <depois.json>")
+        return
+    with open(argumentos[0], encoding='utf-8') as arquivo:
+        antes = json.load(arquivo)
+    with open(argumentos[1], encoding='utf-8') as arquivo:
+        depois = json.load(arquivo)
+
+    print(f"{'Operação':<32} {'antes (ms)':>10} {'depois (ms)':>11} {'variação':>9}")
+    for nome, resultado in antes['resultados'].items():
+        if nome not in depois['resultados']:
+            continue
+        media_antes = resultado['media_ms']
+        media_depois = depois['resultados'][nome]['media_ms']
+        variacao = (media_depois - media_antes) / media_antes * 100 if media_antes else 0
+        print(f"{nome:<32} {media_antes:>10.2f} {media_depois:>11.2f} {variacao:>+8.1f}%")
+
+def benchmark_replica(argumentos):
+    """Mede a carga no banco principal com leituras e escritas simultâneas, sem e com a réplica de leitura.
+
+    Parte dos usuários (threads) só lê; os outros alternam escritas e leituras e, depois de cada escrita,
+    releem o que escreveram, para conferir a janela de leitura própria.
+    """
+    global engine_replica
+    import random
+    from concurrent.futures import ThreadPoolExecutor
+
+    if engine_replica is None:
+        print("Configure a réplica com BANCO_URL_REPLICA (para testar localmente, uma cópia do arquivo SQLite).")
+        return
+    usuarios = int(argumentos[0]) if len(argumentos) > 0 else 8
+    operacoes = int(argumentos[1]) if len(argumentos) > 1 else 200
+    escritores = max(1, usuarios * (int(argumentos[2]) if len(argumentos) > 2 else 25) // 100)
+
+    amostra = sessao.execute(select(PlaylistMusica.fk_id_playlist, PlaylistMusica.fk_id_musica).limit(5000)).all()
+    cliente_ids = sessao.scalars(select(Cliente.id).limit(1000)).all()
+    if not amostra or not cliente_ids:
+        print("O banco não tem playlists com músicas; use 'gerar-dados' antes.")
+        return
+    sessao.commit()
+
+    @leitura
+    def ler(sessao_usuario, sorteio):
+        playlist_id, _ = sorteio.choice(amostra)
+        consulta = sorteio.randrange(3)
+        if consulta == 0:
+            faixas_da_playlist(sessao_usuario, playlist_id, 1, 50)
+        elif consulta == 1:
+            resumo_da_playlist(sessao_usuario, playlist_id)
+        else:
+            perfil_do_cliente(sessao_usuario, sorteio.choice(cliente_ids))
+
+    @leitura
+    def ler_duracao(sessao_usuario, musica_id):
+        return sessao_usuario.scalar(select(Musica.duracao).where(Musica.id == musica_id))
+
+    def usuario(indice):
+        sorteio = random.Random(indice)
+        # Cada escritor altera as suas músicas, para que um não mude o que o outro acabou de escrever
+        musicas = sorted({musica_id for _, musica_id in amostra})[indice::escritores]
+        desatualizadas = 0
+        with Sessao() as sessao_usuario:
+            for _ in range(operacoes):
+                if indice < escritores and sorteio.random() < 0.5:
+                    musica_id, duracao = sorteio.choice(musicas), sorteio.randint(120, 360)
+                    servico_atualizar(sessao_usuario, Musica, musica_id, {'duracao': duracao})
+                    sessao_usuario.commit()
+                    desatualizadas += ler_duracao(sessao_usuario, musica_id) != duracao
+                else:
+                    ler(sessao_usuario, sorteio)
+                sessao_usuario.commit()
+        return desatualizadas
+
+    consultas, tempo = Counter(), Counter()
+    trava = threading.Lock()
+
+    def antes(conn, cursor, statement, parameters, context, executemany):
+        conn.info['inicio_benchmark'] = time.perf_counter()
+
+    def contar_em(nome):
+        def depois(conn, cursor, statement, parameters, context, executemany):
+            duracao = time.perf_counter() - conn.info.pop('inicio_benchmark')
+            with trava:
+                consultas[nome] += 1
+                tempo[nome] += duracao
+        return depois
+
+    ouvintes = {nome: contar_em(nome) for nome in ('principal', 'réplica')}
+    for engine_medido, nome in ((engine, 'principal'), (engine_replica, 'réplica')):
+        event.listen(engine_medido, 'before_cursor_execute', antes)
+        event.listen(engine_medido, 'after_cursor_execute', ouvintes[nome])
+
+    print(f"{usuarios} usuários ({escritores} escrevendo), {operacoes} operações cada, "
+          f"janela de leitura própria de {JANELA_LEITURA_PROPRIA:g}s")
+    print(f"{'Cenário':<16} {'operações/s':>12} {'consultas no principal':>23} {'tempo no principal (s)':>23} "
+          f"{'consultas na réplica':>21} {'releituras desatualizadas':>26}")
+    replica = engine_replica
+    try:
+        for cenario, engine_replica in (('só o principal', None), ('com réplica', replica)):
+            consultas.clear()
+            tempo.clear()
+            inicio = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=usuarios) as executor:
+                desatualizadas = sum(executor.map(usuario, range(usuarios)))
+            vazao = usuarios * operacoes / (time.perf_counter() - inicio)
+            print(f"{cenario:<16} {vazao:>12.0f} {consultas['principal']:>23} {tempo['principal']:>23.2f} "
+                  f"{consultas['réplica']:>21} {desatualizadas:>26}")
+    finally:
+        engine_replica = replica
+        for engine_medido, nome in ((engine, 'principal'), (engine_replica, 'réplica')):
+            event.remove(engine_medido, 'before_cursor_execute', antes)
+            event.remove(engine_medido, 'after_cursor_execute', ouvintes[nome])
+
+def memoria_residente():
+    """Memória residente atual do processo, em bytes (no Linux); nos outros sistemas, o pico até agora."""
+    try:
+        with open('/proc/self/statm') as arquivo:
+            return int(arquivo.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return pico_de_memoria()
+
+def benchmark_sessao(argumentos):
+    """Simula uma sessão longa do menu e mede a memória residente e o tempo de flush + commit ao longo dela.
+
+    Sem o modo, roda a simulação em dois processos: 'global' (uma sessão durante todo o programa, como era
+    antes) e 'por-acao' (a sessão é descartada ao fim de cada ação, como faz acao_de_menu).
+    """
+    import random
+    import subprocess
+
+    acoes = int(argumentos[0]) if argumentos else 2880  # 8 horas, uma ação a cada 10 segundos
+    if len(argumentos) < 2:
+        for modo in ('global', 'por-acao'):
+            print(f"\nModo {modo}:", flush=True)
+            subprocess.run([sys.executable, os.path.abspath(__file__), 'benchmark-sessao', str(acoes), modo], check=True)
+        return
+    modo = argumentos[1]
+    if modo not in ('global', 'por-acao'):
+        print("Uso: benchmark-sessao [ações] [global|por-acao]")
+        return
+
+    amostra = sessao.execute(select(PlaylistMusica.fk_id_playlist, PlaylistMusica.fk_id_musica).limit(5000)).all()
+    musica_ids = sessao.scalars(select(Musica.id).limit(5000)).all()
+    if not amostra or not musica_ids:
+        print("O banco não tem playlists com músicas; use 'gerar-dados' antes.")
+        return
+    sessao.remove()
+    sorteio = random.Random(0)
+
+    def listar_musicas():
+        inicio = sorteio.choice(musica_ids)
+        musicas = sessao.scalars(select(Musica).where(Musica.id >= inicio).order_by(Musica.id).limit(50)).all()
+        return [(musica.nome, musica.album.nome if musica.album else None) for musica in musicas]
+
+    def ver_playlist():
+        playlist = sessao.get(Playlist, sorteio.choice(amostra).fk_id_playlist)
+        return [entrada.musica.nome for entrada in playlist.musicas]
+
+    def atualizar_musica():
+        servico_atualizar(sessao, Musica, sorteio.choice(musica_ids), {'duracao': sorteio.randint(120, 360)})
+
+    def mover_musica():
+        playlist_id, musica_id = sorteio.choice(amostra)
+        servico_mover_musica_na_playlist(sessao, playlist_id, musica_id, sorteio.randint(1, 20))
+
+    janelas = 8
+    por_janela = max(1, acoes // janelas)
+    tempos = []
+    print(f"{'Hora':>4} {'ações':>6} {'memória (MB)':>13} {'objetos na sessão':>18} "
+          f"{'flush+commit médio (ms)':>24} {'p95 (ms)':>9}")
+    inicio_simulacao = time.perf_counter()
+    for indice in range(acoes):
+        sorteio.choice((listar_musicas, ver_playlist))()
+        sorteio.choice((atualizar_musica, mover_musica))()
+        inicio = time.perf_counter()
+        sessao.flush()
+        sessao.commit()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+        objetos = len(sessao.identity_map)
+        if modo == 'por-acao':
+            sessao.remove()
+        if (indice + 1) % por_janela == 0 or indice + 1 == acoes:
+            tempos.sort()
+            print(f"{(indice + 1) * janelas / acoes:>4.0f} {indice + 1:>6} {memoria_residente() / 2**20:>13.1f} "
+                  f"{objetos:>18} {sum(tempos) / len(tempos):>24.2f} {tempos[int(len(tempos) * 0.95)]:>9.2f}")
+            tempos = []
+    print(f"{acoes} ações em {time.perf_counter() - inicio_simulacao:.1f}s.")
+
+def benchmark_inicializacao(argumentos):
+    """Mede o tempo de partida a frio do programa, com e sem o caminho rápido da versão do esquema.
+
+    Cada medição é um processo novo rodando 'versao-esquema'. As linhas do interpretador e das importações
+    mostram o piso, que nenhuma mudança na inicialização consegue reduzir.
+    """
+    import subprocess
+
+    repeticoes = int(argumentos[0]) if argumentos else 10
+    programa = [sys.executable, os.path.abspath(__file__), 'versao-esquema']
+    casos = (
+        ('interpretador', [sys.executable, '-c', 'pass'], {}),
+        ('importações', [sys.executable, '-c', 'import sqlalchemy.orm'], {}),
+        ('caminho rápido', programa, {'BANCO_VERIFICAR_ESQUEMA': '0'}),
+        ('verificação completa', programa, {'BANCO_VERIFICAR_ESQUEMA': '1'}),
+    )
+    # Garante que o banco já tem a versão gravada antes de medir o caminho rápido
+    subprocess.run(programa, check=True, stdout=subprocess.DEVNULL)
+
+    print(f"{repeticoes} partidas de cada")
+    print(f"{'Caso':<22} {'média (ms)':>11} {'mínimo (ms)':>12} {'máximo (ms)':>12}")
+    for nome, comando, ambiente in casos:
+        tempos = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            subprocess.run(comando, check=True, stdout=subprocess.DEVNULL, env={**os.environ, **ambiente})
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        print(f"{nome:<22} {sum(tempos) / len(tempos):>11.1f} {min(tempos):>12.1f} {max(tempos):>12.1f}")
+
+def benchmark_escrita(argumentos):
+    """Mede escritas por segundo confirmando cada operação sozinha e com a escrita agrupada em vários tamanhos de grupo.
+
+    Cada escrita cria uma playlist vazia para um cliente existente; as playlists criadas são apagadas no final.
+    A latência é o tempo entre pedir a escrita e ela estar gravada (o Future resolvido).
+    """
+    import random
+
+    operacoes = int(argumentos[0]) if argumentos else 2000
+    tamanhos = [int(tamanho) for tamanho in argumentos[1:]] or [10, 100, 1000]
+    cliente_ids = sessao.scalars(select(Cliente.id).limit(1000)).all()
+    sessao.remove()
+    if not cliente_ids:
+        print("Nenhum cliente cadastrado. Use 'gerar-dados' antes do benchmark.")
+        return
+    sorteio = random.Random(0)
+    nome_playlist = 'Benchmark escrita'
+
+    def mostrar(modo, tamanho, duracao, commits, latencias, falhas):
+        latencias.sort()
+        print(f"{modo:<10} {tamanho:>6} {operacoes / duracao:>11.0f} {commits:>8} "
+              f"{sum(latencias) / len(latencias) * 1000:>11.2f} {latencias[int(len(latencias) * 0.95)] * 1000:>9.2f} {falhas:>6}")
+
+    print(f"{operacoes} escritas por modo, banco {engine.dialect.name}")
+    print(f"{'Modo':<10} {'grupo':>6} {'escritas/s':>11} {'commits':>8} {'média (ms)':>11} {'p95 (ms)':>9} {'erros':>6}")
+
+    # Um commit por operação, como no menu e em escrever() sem BANCO_ESCRITA_AGRUPADA
+    latencias = []
+    falhas = 0
+    inicio = time.perf_counter()
+    for _ in range(operacoes):
+        inicio_operacao = time.perf_counter()
+        falhas += len(executar_operacoes([(0, {'operacao': 'criar_playlist', 'nome': nome_playlist,
+                                               'cliente_id': sorteio.choice(cliente_ids)})]))
+        latencias.append(time.perf_counter() - inicio_operacao)
+    mostrar('imediata', 1, time.perf_counter() - inicio, operacoes, latencias, falhas)
+    sessao.remove()
+
+    for tamanho in tamanhos:
+        latencias = []
+        escrita = EscritaAgrupada(tamanho)
+        inicio = time.perf_counter()
+        futuros = []
+        for _ in range(operacoes):
+            inicio_operacao = time.perf_counter()
+            futuro = escrita.enviar('criar_playlist', nome=nome_playlist, cliente_id=sorteio.choice(cliente_ids))
+            futuro.add_done_callback(lambda _, inicio_operacao=inicio_operacao: latencias.append(time.perf_counter() - inicio_operacao))
+            futuros.append(futuro)
+        escrita.fechar()
+        duracao = time.perf_counter() - inicio
+        mostrar('agrupada', tamanho, duracao, escrita.grupos, latencias, sum(futuro.exception() is not None for futuro in futuros))
+
+    playlist_ids = sessao.scalars(select(Playlist.id).where(Playlist.nome == nome_playlist)).all()
+    for indice in range(0, len(playlist_ids), 1000):
+        lote = playlist_ids[indice:indice + 1000]
+        apagar_resumos(sessao, lote)
+        sessao.execute(delete(Playlist).where(Playlist.id.in_(lote)).execution_options(synchronize_session=False))
+    sessao.commit()
+    print(f"{len(playlist_ids)} playlists do benchmark apagadas.")
+
+COMANDOS = {
+    'benchmark-pool': benchmark_pool,
+    'verificar-relatorio': verificar_relatorio,
+    'verificar-resumos': verificar_resumos,
+    'verificar-replica': verificar_replica,
+    'importar-catalogo': importar_catalogo,
+    'executar-lote': executar_lote,
+    'gerar-dados': gerar_dados,
+    'reconciliar-contadores': reconciliar_contadores,
+    'reconstruir-resumos': reconstruir_resumos,
+    'reconstruir-perfis': reconstruir_perfis,
+    'calcular-recomendacoes': calcular_recomendacoes,
+    'deduplicar': deduplicar,
+    'apagar': apagar_em_lotes,
+    'versao-esquema': mostrar_versao_esquema,
+    'migrar': migrar,
+    'exportar': exportar,
+    'relatorio-indices': relatorio_indices,
+    'benchmark-busca': benchmark_busca,
+    'benchmark-crud': benchmark_crud,
+    'comparar-benchmarks': comparar_benchmarks,
+    'benchmark-async': benchmark_async,
+    'benchmark-sessao': benchmark_sessao,
+    'benchmark-replica': benchmark_replica,
+    'benchmark-inicializacao': benchmark_inicializacao,
+    'benchmark-escrita': benchmark_escrita,
+}
+
+def executar_comando(argumentos):
+    """Executa um comando não interativo passado na linha de comando."""
+    comando = COMANDOS.get(argumentos[0])
+    if comando is None:
+        print(f"Comando desconhecido: '{argumentos[0]}'. Comandos disponíveis: {', '.join(COMANDOS)}")
+        return
+    if instrumentacao is not None:
+        instrumentacao.menu_atual = 'comando'
+    acao_de_menu(comando)(argumentos[1:])
+
+# Executando o menu principal, ou o comando pedido na linha de comando
+if modo_comando:
+    executar_comando(sys.argv[1:])
+else:
+    menu_principal()
+
+if instrumentacao is not None:
+    instrumentacao.imprimir_resumo()
 
 # Fechando a sessão ao final
-sessao.close()
+sessao.remove()
 